@@ -0,0 +1,256 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+import preference_language
+import ranking
+import recommendation_cache
+
+# One user's request: name (the user file it came from) and the preferences read from it
+Request = namedtuple('Request', ['name', 'preferences'])
+
+# The outcome of one request in a batch:
+# - name and user of the request, activity asked for
+# - options: the number of options found (None for activities or when no options were ranked), top: the best options
+#   as dictionaries (see describe)
+# - output: what find_states printed for the request, error: the error it raised (None if it did not)
+# - seconds: the time the request took, shared work included
+# - cached: whether the result came from the result cache of the agent (see recommendation_cache)
+RequestResult = namedtuple('RequestResult', ['name', 'user', 'activity', 'options', 'top', 'output', 'error',
+                                             'seconds', 'cached'], defaults=[False])
+
+
+def user_files(paths):
+    """
+    The user json files of a list of files and directories, the files in a directory in alphabetical order
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.json'))
+        else:
+            files.append(path)
+    return files
+
+
+def load_requests(paths):
+    """
+    Reads the requests of a list of user files and directories
+    """
+    requests = []
+    for path in user_files(paths):
+        with open(path, 'r') as openfile:
+            requests.append(Request(path, json.load(openfile)))
+    return requests
+
+
+def group_key(preferences):
+    """
+    Requests with the same key share most of their work: the same activity from the same location, with the same
+    symptoms and food and clothing preferences
+    """
+    return (str(preferences.get('activity', '')), str(preferences.get('current_location', '')),
+            str(preferences.get('user', '')), tuple(preferences.get('symptoms', [])),
+            tuple(preferences.get('pref_food', [])), tuple(preferences.get('pref_clothing', [])))
+
+
+def canonical_preferences(preferences):
+    """
+    The normalised expression of a pref_food/pref_clothing list (see preference_language.parse), so equivalent lists
+    share their work
+    """
+    return preference_language.parse(preferences)
+
+
+class ThreadOutput:
+    """
+    Stands in for sys.stdout while output is captured (see captured_output): what a thread prints while it captures
+    goes to its own buffer, everything else to the stream that was replaced. contextlib.redirect_stdout replaces
+    sys.stdout for every thread, so it can not keep apart the output of requests served at the same time.
+    """
+
+    lock = threading.Lock()
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def target(self):
+        buffer = getattr(self.local, 'buffer', None)
+        return buffer if buffer is not None else self.stream
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+@contextlib.contextmanager
+def captured_output(buffer):
+    """
+    Captures what the current thread prints into buffer
+    """
+    with ThreadOutput.lock:
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        output = sys.stdout
+    output.local.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        output.local.buffer = None
+
+
+class SharedWork:
+    """
+    Results of the agent methods that are shared between the requests of a batch, per method and key (see the shared
+    decorator in group10_agent). Counts how often a result was computed and how often it was reused.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.computed = {}
+        self.reused = {}
+
+    def get(self, name, key, compute):
+        try:
+            result = self.results[name, key]
+        except KeyError:
+            self.computed[name] = self.computed.get(name, 0) + 1
+            result = self.results[name, key] = compute()
+            return result
+        self.reused[name] = self.reused.get(name, 0) + 1
+        return result
+
+    def as_dict(self):
+        return {name: {'computed': self.computed.get(name, 0), 'reused': self.reused.get(name, 0)}
+                for name in sorted(set(self.computed) | set(self.reused))}
+
+
+def label(value):
+    """
+    A value of a recommendation state in plain json: entities by their label (or name), lists element by element
+    """
+    if isinstance(value, (list, tuple)):
+        return [label(element) for element in value]
+    if getattr(value, 'storid', None) is not None:
+        return value.label[0] if len(value.label) > 0 else value.name
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return str(value)
+
+
+def describe(record):
+    """
+    A recommendation record (see candidate_table.CandidateTable.record) as a dictionary of the filled in fields of its
+    state and its utility
+    """
+    state = record[0]
+    description = {name: label(getattr(state, name)) for name in state.__slots__
+                   if getattr(state, name) not in ('', [], None)}
+    description['utility'] = record[1]
+    return description
+
+
+class Batch:
+    """
+    The requests of one find_states_many call. Requests are run grouped by group_key, so requests sharing work follow
+    each other, and their results are given back in the order of the requests.
+    """
+
+    def __init__(self, requests, share=True, top=3):
+        self.requests = [request if isinstance(request, Request) else Request(*request) for request in requests]
+        self.shared_work = SharedWork() if share else None
+        self.top = top
+        self.results = [None] * len(self.requests)
+        self.seconds = 0
+
+    def ordered(self):
+        """
+        The indices of the requests, grouped by group_key (in the order in which the groups first appear)
+        """
+        groups = {}
+        for index, request in enumerate(self.requests):
+            groups.setdefault(group_key(request.preferences), []).append(index)
+        return [index for indices in groups.values() for index in indices]
+
+    @property
+    def groups(self):
+        return len({group_key(request.preferences) for request in self.requests})
+
+    def run(self, index, find_states, cache=None, version=None):
+        """
+        Runs one request with find_states (a function of the preferences), keeping what it prints and the error it
+        raises instead of stopping the batch. With a recommendation_cache.RecommendationCache, the result of an
+        earlier request with the same canonical preferences (and ontology version) is reused, and results without
+        errors are stored.
+        """
+        request = self.requests[index]
+        start = time.perf_counter()
+        if cache is not None:
+            key = recommendation_cache.canonical_request(request.preferences)
+            cached = cache.get(key, version)
+            if cached is not None:
+                seconds = time.perf_counter() - start
+                self.seconds += seconds
+                self.results[index] = cached._replace(name=request.name, seconds=seconds, cached=True)
+                return self.results[index]
+        output = io.StringIO()
+        options = None
+        error = None
+        with captured_output(output):
+            try:
+                options = find_states(request.preferences)
+            except Exception as exception:
+                error = '{}: {}'.format(type(exception).__name__, exception)
+        top = None
+        if isinstance(options, ranking.Ranking):
+            top = [describe(record) for record in options.top(self.top)] if len(options) > 0 else []
+        seconds = time.perf_counter() - start
+        self.seconds += seconds
+        self.results[index] = RequestResult(request.name, request.preferences.get('user'),
+                                            request.preferences.get('activity'),
+                                            len(options) if isinstance(options, ranking.Ranking) else None, top,
+                                            output.getvalue(), error, seconds)
+        if cache is not None and error is None:
+            cache.put(key, self.results[index], version)
+        return self.results[index]
+
+    def throughput(self):
+        """
+        Requests per second and the mean and slowest request time of the batch
+        """
+        timings = [result.seconds for result in self.results if result is not None]
+        return {'requests': len(timings), 'groups': self.groups, 'seconds': round(self.seconds, 6),
+                'requests_per_second': round(len(timings) / self.seconds, 3) if self.seconds else None,
+                'mean_ms': round(1000 * self.seconds / len(timings), 3) if timings else None,
+                'max_ms': round(1000 * max(timings), 3) if timings else None}
+
+    def as_dict(self):
+        return {'results': [result._asdict() for result in self.results],
+                'throughput': self.throughput(),
+                'shared_work': self.shared_work.as_dict() if self.shared_work is not None else {}}
+
+
+def print_batch(batch, as_json=False):
+    """
+    Prints the recommendations of every request of a batch (a Batch or a worker_pool.PoolBatch) and its throughput,
+    or the whole batch as json
+    """
+    if as_json:
+        print(json.dumps(batch.as_dict(), indent=2))
+        return
+    for result in batch.results:
+        print('===== {}'.format(result.name))
+        print(result.output, end='')
+        if result.error is not None:
+            print('Error: {}'.format(result.error))
+    print('\n' + '  '.join('{} {}'.format(key, value) for key, value in batch.throughput().items()))
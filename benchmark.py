@@ -0,0 +1,1099 @@
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import json
+import operator
+import os
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from owlready2 import *
+import batch_recommendations
+import candidate_table
+import group10_agent
+import incremental_reasoning
+import instrumentation
+import intern_table
+import ontology_snapshot
+import preference_language
+import preference_relaxation
+import ranking
+import recommendation_cache
+import recommendation_service
+import reverse_index
+import rule_materialiser
+import synthetic_ontology
+import utility_scoring
+import worker_pool
+
+ONTOLOGY_PATH = "IAG_Group10_Ontology.owl"
+
+
+def time_in_subprocess(code):
+    """
+    Runs a snippet in a fresh interpreter and returns the elapsed time it reports. A fresh interpreter is used so
+    that nothing (imported modules, loaded worlds, the JVM) is shared between measurements.
+    """
+    script = 'import time\nstart = time.perf_counter()\n{}\nprint(time.perf_counter() - start)'.format(code)
+    result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def benchmark_startup(repeat):
+    """
+    Compares constructing the agent without a snapshot (parse and reason every time), with a cold snapshot
+    directory (parse, reason and write the snapshot) and with a warm snapshot directory (open the snapshot).
+    """
+    results = {'no_snapshot': [], 'cold_snapshot': [], 'warm_snapshot': []}
+    for _ in range(repeat):
+        snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+        try:
+            construct = 'import group10_agent\ngroup10_agent.EnvironmentalAgent({!r}, snapshot_dir={!r})'
+            results['no_snapshot'].append(time_in_subprocess(construct.format(ONTOLOGY_PATH, None)))
+            results['cold_snapshot'].append(time_in_subprocess(construct.format(ONTOLOGY_PATH, snapshot_dir)))
+            results['warm_snapshot'].append(time_in_subprocess(construct.format(ONTOLOGY_PATH, snapshot_dir)))
+        finally:
+            shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return results
+
+
+def benchmark_import(repeat):
+    """
+    Compares importing group10_agent and constructing the agent from a warm snapshot with the lazy startup (the
+    default) and with everything built eagerly. import_eager imports what group10_agent used to pull in at import
+    time (owlready2 and random_agent), for reference.
+    """
+    results = {'import': [], 'import_eager': [], 'construct_lazy': [], 'construct_eager': []}
+    snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+    try:
+        # Build the snapshot once, so that only opening it is measured
+        time_in_subprocess('import group10_agent\ngroup10_agent.EnvironmentalAgent({!r}, snapshot_dir={!r})'
+                           .format(ONTOLOGY_PATH, snapshot_dir))
+        construct = 'import group10_agent\nstart = time.perf_counter()\n' \
+                    'group10_agent.EnvironmentalAgent({!r}, snapshot_dir={!r}, lazy={!r})'
+        for _ in range(repeat):
+            results['import'].append(time_in_subprocess('import group10_agent'))
+            results['import_eager'].append(time_in_subprocess('from owlready2 import *\nimport random_agent'))
+            results['construct_lazy'].append(time_in_subprocess(construct.format(ONTOLOGY_PATH, snapshot_dir, True)))
+            results['construct_eager'].append(time_in_subprocess(construct.format(ONTOLOGY_PATH, snapshot_dir,
+                                                                                  False)))
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return results
+
+
+def restaurant_delta(agent, size, prefix):
+    """
+    A delta adding size restaurants, each located in an existing neighborhood and serving an existing recipe
+    """
+    neighborhoods = list(agent.ontology.Neighborhood.instances())
+    recipes = list(agent.ontology.Recipe.instances())
+    delta = incremental_reasoning.OntologyDelta()
+    for i in range(size):
+        name = '{}Restaurant{}'.format(prefix, i)
+        delta.add_individual(name, agent.ontology.Restaurant, '{} Restaurant {}'.format(prefix, i))
+        delta.add(name, 'isLocatedIn', neighborhoods[i % len(neighborhoods)])
+        delta.add(name, 'serves', recipes[i % len(recipes)])
+    return delta
+
+
+def benchmark_delta(sizes, repeat):
+    """
+    Compares applying deltas of increasing size incrementally with running the reasoner over the whole ontology
+    """
+    results = {'full_reasoning': []}
+    for _ in range(repeat):
+        world = World()
+        world.get_ontology(os.path.abspath(ONTOLOGY_PATH)).load()
+        start = time.perf_counter()
+        ontology_snapshot.run_reasoner(world)
+        results['full_reasoning'].append(time.perf_counter() - start)
+        world.close()
+
+    snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+    try:
+        agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=snapshot_dir)
+        for size in sizes:
+            timings = results['delta_{}'.format(size)] = []
+            for run in range(repeat):
+                delta = restaurant_delta(agent, size, 'Bench{}x{}'.format(size, run))
+                start = time.perf_counter()
+                agent.apply_delta(delta)
+                timings.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return results
+
+
+def catalogue_delta(agent, size, prefix):
+    """
+    A delta scaling up the catalogue with size clothing items (sold in an existing store, made of an existing
+    material), size recipes (with an existing ingredient) and size restaurants serving them
+    """
+    stores = list(agent.ontology.ClothingStore.instances())
+    materials = list(agent.ontology.Material.instances())
+    ingredients = list(agent.ontology.Ingredient.instances())
+    delta = restaurant_delta(agent, size, prefix)
+    for i in range(size):
+        item = '{}Item{}'.format(prefix, i)
+        delta.add_individual(item, agent.ontology.EverydayClothing, '{} Item {}'.format(prefix, i))
+        delta.add(item, 'availableIn', stores[i % len(stores)])
+        delta.add(item, 'containsMaterial', materials[i % len(materials)])
+        recipe = '{}Recipe{}'.format(prefix, i)
+        delta.add_individual(recipe, agent.ontology.Recipe, '{} Recipe {}'.format(prefix, i))
+        delta.add(recipe, 'containsIngredient', ingredients[i % len(ingredients)])
+        delta.add('{}Restaurant{}'.format(prefix, i), 'serves', recipe)
+    return delta
+
+
+def reverse_lookups(agent, lookup):
+    """
+    Looks up the subjects of every object of the reverse indexed properties, the way the infer_* functions do
+    """
+    ontology = agent.ontology
+    queries = [('selling', ontology.Clothing), ('serves', ontology.Recipe), ('containsIngredient', ontology.Ingredient),
+               ('containsMaterial', ontology.Material), ('isForbiddenBy', ontology.HealthCondition)]
+    for prop_name, cls in queries:
+        for value in cls.instances():
+            lookup(prop_name, value)
+
+
+def benchmark_reverse_index(sizes, repeat):
+    """
+    Compares one ontology.search per looked up object with lookups in the reverse index, on the catalogue scaled up
+    with deltas of increasing size
+    """
+    results = {}
+    snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+    try:
+        agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=snapshot_dir)
+        added = 0
+        for size in sizes:
+            agent.apply_delta(catalogue_delta(agent, size - added, 'Catalogue{}'.format(size)))
+            added = size
+            search = results['search_{}'.format(size)] = []
+            index = results['index_{}'.format(size)] = []
+            build = results['index_build_{}'.format(size)] = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                reverse_lookups(agent, lambda prop_name, value: list(agent.ontology.search(**{prop_name: value})))
+                search.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                reverse_lookups(agent, agent.reverse_index.subjects)
+                index.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                reverse_index.ReverseIndex(agent.ontology)
+                build.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return results
+
+
+# Preference requests of the user files, with and without health exclusions
+PREFERENCE_REQUESTS = [
+    ('food', ['ingredient some Fish', 'or', 'ingredient some Shellfish'], []),
+    ('food', ['ingredient Spinach', 'or', 'not ingredient some AnimalBased'], ['LactoseIntolerance']),
+    ('food', ['some ingredient PlantBased'], ['CitrusAllergy', 'ShellfishAllergy']),
+    ('clothing', ['material some NaturalMaterial', 'isFairTrade true', 'maxprice 49'], ['WoolAllergy']),
+    ('clothing', ['not material some NaturalMaterial', 'maxprice 100'], []),
+]
+
+
+def python_candidates(agent, domain_name, preferences, health_conditions):
+    """
+    The candidates of a request with the Python evaluator, like infer_recipes/infer_clothes
+    """
+    if domain_name == 'food':
+        forbidden = agent.health_exclusions.excluded_recipes(health_conditions)
+    else:
+        forbidden = agent.health_exclusions.excluded_clothing(health_conditions)
+    return agent.interned.members(agent.plans.evaluate(agent, domain_name, preferences) & ~forbidden)
+
+
+def benchmark_preferences(sizes, repeat):
+    """
+    Compares evaluating the preference requests with the Python evaluator (cold: compiled from scratch, warm: from
+    the plan cache) with a single SPARQL query per request, on the catalogue scaled up with deltas of increasing size.
+    Both have to return the same candidates.
+    """
+    results = {}
+    snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+    try:
+        agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=snapshot_dir)
+        requests = [(domain_name, preferences, [agent.label_to_indiv.get(name) or agent.ontology[name]
+                                                for name in health_conditions])
+                    for domain_name, preferences, health_conditions in PREFERENCE_REQUESTS]
+        added = 0
+        for size in sizes:
+            agent.apply_delta(catalogue_delta(agent, size - added, 'Catalogue{}'.format(size)))
+            added = size
+            for request in requests:
+                if python_candidates(agent, *request) != agent.sparql_plans.candidates(agent, *request):
+                    raise AssertionError('Python and SPARQL candidates differ for {}'.format(request))
+            python_cold = results['python_cold_{}'.format(size)] = []
+            python_warm = results['python_warm_{}'.format(size)] = []
+            sparql = results['sparql_{}'.format(size)] = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                agent.plans = preference_language.PlanCache()
+                for request in requests:
+                    python_candidates(agent, *request)
+                python_cold.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                for request in requests:
+                    python_candidates(agent, *request)
+                python_warm.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                for request in requests:
+                    agent.sparql_plans.candidates(agent, *request)
+                sparql.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return results
+
+
+def routing_delta(agent, cities, neighborhoods_per_city, prefix):
+    """
+    A delta adding cities with neighborhoods (a chain of adjacent ones, every other one with a train station) and
+    trains between them: a ring through all cities plus a faster connection to the city halfway the ring
+    """
+    delta = incremental_reasoning.OntologyDelta()
+    city_labels = []
+    for c in range(cities):
+        city = '{}City{}'.format(prefix, c)
+        city_labels.append('{} City {}'.format(prefix, c))
+        delta.add_individual(city, agent.ontology.City, city_labels[-1])
+        for n in range(neighborhoods_per_city):
+            neighborhood = '{}City{}Neighborhood{}'.format(prefix, c, n)
+            delta.add_individual(neighborhood, agent.ontology.Neighborhood, '{} City {} Neighborhood {}'.format(
+                prefix, c, n))
+            delta.add(neighborhood, 'isLocatedIn', city)
+            delta.add(neighborhood, 'hasPopulation', 30000 if n % 2 == 0 else 8000)
+            if n > 0:
+                delta.add(neighborhood, 'adjacentTo', '{}City{}Neighborhood{}'.format(prefix, c, n - 1))
+    connections = [(c, (c + 1) % cities, 40) for c in range(cities)]
+    connections += [(c, (c + cities // 2) % cities, 60) for c in range(cities)]
+    for i, (origin, destination, distance) in enumerate(connections):
+        train = '{}Train{}'.format(prefix, i)
+        delta.add_individual(train, agent.ontology.Train, 'Train From {} To {}'.format(city_labels[origin],
+                                                                                       city_labels[destination]))
+        delta.add(train, 'travelDistance', distance)
+    return delta
+
+
+def benchmark_routing(cities, neighborhoods_per_city, queries, repeat):
+    """
+    Route queries between random neighborhoods on a generated network of cities: the first queries (computing the
+    shortest path trees), later queries once the trees are cached and lookups of routes that were computed before
+    """
+    results = {'cold': [], 'warm': [], 'cached': []}
+    snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+    try:
+        agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=snapshot_dir)
+        agent.apply_delta(routing_delta(agent, cities, neighborhoods_per_city, 'Routing'))
+        neighborhoods = [neighborhood for neighborhood in agent.ontology.Neighborhood.instances()
+                         if neighborhood.isLocatedIn]
+        generator = random.Random(10)
+        pairs = [(generator.choice(neighborhoods), generator.choice(neighborhoods)) for _ in range(queries)]
+        matrix = agent.travel_matrix
+        for _ in range(repeat):
+            matrix.routes = {}
+            matrix.network = None
+            for variant in ['cold', 'warm']:
+                start = time.perf_counter()
+                for origin, destination in pairs:
+                    matrix.compute_route(origin, destination) if variant == 'warm' else matrix.route(origin,
+                                                                                                     destination)
+                results[variant].append((time.perf_counter() - start) / queries)
+            start = time.perf_counter()
+            for origin, destination in pairs:
+                matrix.route(origin, destination)
+            results['cached'].append((time.perf_counter() - start) / queries)
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return results
+
+
+def benchmark_scoring(candidates, repeat):
+    """
+    Compares scoring candidates one by one with RecommendationState.calculate_utility with scoring them all with
+    utility_scoring.batch_utilities. Both have to give exactly the same utilities.
+    """
+    generator = random.Random(10)
+    rows = []
+    for _ in range(candidates):
+        co2_scores = [generator.randint(1, 5) for _ in range(generator.randint(1, 4))]
+        n_prefs = generator.randint(1, 4)
+        adhered_prefs = generator.randint(0, n_prefs) - generator.choice([0, 0.3, 0.5, 0.7])
+        rows.append((co2_scores, len(co2_scores), adhered_prefs, n_prefs))
+    # collect is the extra work of the agent to gather the candidates, batch the vectorised scoring itself
+    results = {'scalar': [], 'collect': [], 'batch': []}
+    state = group10_agent.RecommendationState()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        scalar = [state.calculate_utility(adhered_prefs / n_prefs, co2_scores, n_domains)
+                  for co2_scores, n_domains, adhered_prefs, n_prefs in rows]
+        results['scalar'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        scores = utility_scoring.CandidateScores()
+        for row in rows:
+            scores.add(*row)
+        results['collect'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        batch = scores.utilities()
+        results['batch'].append(time.perf_counter() - start)
+        if scalar != batch:
+            raise AssertionError('Batch utilities differ from the scalar formula')
+    return results
+
+
+def benchmark_ranking(candidates, k, repeat):
+    """
+    Compares sorting all restaurant options twice (the way they used to be ranked) with taking the best k with
+    ranking.top_k. Both have to give the same options in the same order, ties included.
+    """
+    generator = random.Random(10)
+    # Few distinct values, so there are many ties
+    options = [[index, generator.randint(1, 20) / 4, generator.randint(0, 3)] for index in range(candidates)]
+    results = {'double_sort': [], 'top_k': []}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        sorted_options = list(options)
+        sorted_options.sort(key=lambda option: option[1], reverse=True)
+        sorted_options.sort(key=lambda option: option[2], reverse=True)
+        best_sorted = sorted_options[:k]
+        results['double_sort'].append(time.perf_counter() - start)
+        start = time.perf_counter()
+        best = ranking.top_k(options, k, operator.itemgetter(2, 1))
+        results['top_k'].append(time.perf_counter() - start)
+        if best != best_sorted:
+            raise AssertionError('Top k options differ from the sorted options')
+    return results
+
+
+def benchmark_candidates(candidates):
+    """
+    Memory and time for collecting restaurant candidates as a RecommendationState plus a [state, utility, adhered
+    preferences] list each (the way they used to be collected) and in a candidate_table.CandidateTable, which only
+    builds states for the three options that are shown
+    """
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH)
+    recipes = list(agent.ontology.Recipe.instances())
+    restaurants = list(agent.ontology.Restaurant.instances())
+    vehicles = list(agent.ontology.Transportation.instances()) + ['Walking', 'Public Transport']
+    generator = random.Random(10)
+    rows = [(generator.choice(recipes), generator.choice(restaurants), generator.choice(vehicles),
+             generator.randint(5, 90), [generator.randint(1, 5), generator.randint(1, 5)], generator.randint(0, 3),
+             generator.choice([[], ['Cuisine'], ['Location', 'Duration']])) for _ in range(candidates)]
+
+    def collect(variant):
+        if variant == 'states':
+            options = []
+            for recipe, restaurant, mode, duration, co2_scores, adhered_prefs, violations in rows:
+                state = group10_agent.RecommendationState('Restaurant', mode, restaurant, recipe, [], [],
+                                                          list(violations), duration, '', env_score=list(co2_scores))
+                options.append([state, state.calculate_utility(adhered_prefs / 3, co2_scores, 2), adhered_prefs])
+            return options, sorted(options, key=operator.itemgetter(2, 1), reverse=True)[:3]
+        options = candidate_table.CandidateTable(agent, candidate_table.RESTAURANT, group10_agent.RecommendationState,
+                                                 ['Cuisine', 'Location', 'Duration'])
+        for recipe, restaurant, mode, duration, co2_scores, adhered_prefs, violations in rows:
+            options.add(recipe, restaurant, mode, duration, co2_scores, adhered_prefs, 3, violations)
+        options.score()
+        return options, ranking.Ranking(options, ranking.RESTAURANT_ORDER).top(3)
+
+    report = {}
+    for variant in ['states', 'table']:
+        # Timed without tracing, tracemalloc slows down every allocation
+        start = time.perf_counter()
+        collect(variant)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        options, shown = collect(variant)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[variant] = {'candidates': candidates, 'ms': round(1000 * elapsed, 3), 'bytes': current,
+                           'peak_bytes': peak, 'shown': [option[0].food.name for option in shown]}
+        del options, shown
+    if report['states']['shown'] != report['table']['shown']:
+        raise AssertionError('The table shows other options than the recommendation states')
+    return report
+
+
+def search_delta(agent, size, prefix):
+    """
+    A delta adding size restaurants in neighborhoods that are located in a city, each with an existing cuisine and
+    serving an existing recipe
+    """
+    neighborhoods = [neighborhood for neighborhood in agent.ontology.Neighborhood.instances()
+                     if neighborhood.isLocatedIn]
+    cuisines = list(agent.ontology.Cuisine.instances())
+    recipes = list(agent.ontology.Recipe.instances())
+    delta = incremental_reasoning.OntologyDelta()
+    for i in range(size):
+        name = '{}Restaurant{}'.format(prefix, i)
+        delta.add_individual(name, agent.ontology.Restaurant, '{} Restaurant {}'.format(prefix, i))
+        delta.add(name, 'isLocatedIn', neighborhoods[i % len(neighborhoods)])
+        delta.add(name, 'hasCuisine', cuisines[i % len(cuisines)])
+        delta.add(name, 'serves', recipes[i % len(recipes)])
+    return delta
+
+
+def benchmark_search(sizes, k, user_file, repeat):
+    """
+    Compares creating every restaurant candidate with the branch and bound search for the best k, for a user on the
+    catalogue scaled up with restaurants. Both have to give the same best k options and the same number of options.
+    """
+    with open(user_file, 'r') as openfile:
+        preferences = json.load(openfile)
+    report = {}
+    snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+    try:
+        agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=snapshot_dir)
+        added = 0
+        for size in sizes:
+            agent.apply_delta(search_delta(agent, size - added, 'Search{}'.format(size)))
+            added = size
+            current_location = agent.get_user_location(preferences['current_location'], preferences['user'])
+            restaurants = agent.infer_recipes(preferences['pref_food'], [])
+            shown = {}
+            for variant, variant_k in [('full', None), ('top_{}'.format(k), k)]:
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    table = agent.create_restaurant_recommendations(
+                        restaurants, current_location, group10_agent.RequestContext(preferences), k=variant_k)
+                    timings.append(time.perf_counter() - start)
+                options = ranking.Ranking(table, ranking.RESTAURANT_ORDER)
+                shown[variant] = (len(options), [(option[0].food.name, option[0].restaurant.name, option[1])
+                                                 for option in options.top(k)])
+                report['{}_{}'.format(variant, size)] = dict({'best_ms': round(1000 * min(timings), 3)},
+                                                             **table.search_stats.as_dict())
+            if shown['full'] != shown['top_{}'.format(k)]:
+                raise AssertionError('The search found other options than creating every candidate')
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return report
+
+
+RELAXATION_REQUESTS = [
+    ('clothing', ['material some NaturalMaterial', 'isFairTrade true', 'maxprice 49']),
+    ('clothing', ['maxprice 5', 'material some NaturalMaterial', 'isFairTrade true', 'maxprice 60', 'maxprice 49',
+                  'isFairTrade false']),
+    ('food', ['some ingredient PlantBased', 'ingredient some Fish']),
+    ('food', ['ingredient some Fish', 'not ingredient some Fish', 'ingredient Spinach', 'or', 'ingredient Rice',
+              'ingredient some Shellfish', 'maxprice 1']),
+]
+
+
+def pop_relaxation(agent, domain_name, preferences):
+    """
+    The way the clothing preferences used to be relaxed: the last entry is dropped until something matches, every
+    pass evaluating the shorter list again. Returns the dropped entries.
+    """
+    preferences = list(preferences)
+    dropped = []
+    while preferences and not python_candidates(agent, domain_name, preferences, []):
+        dropped.append(preferences.pop(-1))
+    return dropped
+
+
+def benchmark_relaxation(repeat):
+    """
+    Compares dropping the last preference until something matches with the subset lattice search of
+    preference_relaxation, both starting from an empty plan cache. Reports the time, the number of dropped
+    preferences and the cost of every step of the lattice search.
+    """
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH)
+    report = {}
+    for number, (domain_name, preferences) in enumerate(RELAXATION_REQUESTS):
+        timings = {'pop': [], 'lattice': []}
+        for _ in range(repeat):
+            agent.plans = preference_language.PlanCache()
+            start = time.perf_counter()
+            popped = pop_relaxation(agent, domain_name, preferences)
+            timings['pop'].append(time.perf_counter() - start)
+            agent.plans = preference_language.PlanCache()
+            start = time.perf_counter()
+            relaxation = preference_relaxation.relax(agent, domain_name, preferences)
+            timings['lattice'].append(time.perf_counter() - start)
+        report['{}_{}'.format(domain_name, number)] = {
+            'pop_ms': round(1000 * min(timings['pop']), 3), 'pop_dropped': len(popped),
+            'lattice_ms': round(1000 * min(timings['lattice']), 3), 'lattice_dropped': len(relaxation.dropped),
+            'clause_ms': round(1000 * relaxation.clause_seconds, 3),
+            'steps': ['{} dropped: {} subsets {:.3f} ms'.format(step.dropped, step.subsets, 1000 * step.seconds)
+                      for step in relaxation.steps]}
+    return report
+
+
+def benchmark_batch(paths, copies, repeat):
+    """
+    Compares running the requests of the user files one by one (nothing shared between them) with one
+    find_states_many batch sharing the work of requests in common, every user file being requested copies times.
+    Both have to give the same recommendations.
+    """
+    requests = batch_recommendations.load_requests(paths) * copies
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH)
+    report = {}
+    top = {}
+    for variant, share in [('one_by_one', False), ('batch', True)]:
+        throughputs = []
+        for _ in range(repeat):
+            # The charging spots are chosen at random, the same seed gives both variants the same ones
+            random.seed(0)
+            batch = agent.find_states_many(requests, share)
+            throughputs.append(batch.throughput())
+        best = max(throughputs, key=lambda throughput: throughput['requests_per_second'])
+        report[variant] = dict(best, **{name: '{computed}/{reused}'.format(**counts)
+                                        for name, counts in batch.as_dict()['shared_work'].items()})
+        top[variant] = [(result.options, result.top, result.error) for result in batch.results]
+    if top['one_by_one'] != top['batch']:
+        raise AssertionError('The batch found other recommendations than the requests one by one')
+    return report
+
+
+def benchmark_pool(paths, copies, workers, modes):
+    """
+    Throughput of a worker pool for every number of workers and mode, every user file being requested copies times.
+    The speedup is relative to the first number of workers of the same mode; startup is the time to reason (fork,
+    thread) or prepare the snapshot and start the workers (snapshot).
+    """
+    requests = batch_recommendations.load_requests(paths) * copies
+    report = {}
+    snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+    try:
+        for mode in modes:
+            base = None
+            for count in workers:
+                with worker_pool.WorkerPool(ONTOLOGY_PATH, count, mode, snapshot_dir) as pool:
+                    # The first batch also waits for the workers to open the snapshot (snapshot mode)
+                    warmup = pool.recommend(requests[:count])
+                    batch = pool.recommend(requests)
+                throughput = batch.throughput()
+                base = base or throughput['requests_per_second']
+                report['{}_{}'.format(mode, count)] = {
+                    'startup_ms': round(1000 * pool.startup_seconds, 3),
+                    'warmup_ms': round(1000 * warmup.seconds, 3),
+                    'requests_per_second': throughput['requests_per_second'],
+                    'speedup': round(throughput['requests_per_second'] / base, 2),
+                    'workers_used': len(batch.worker_stats)}
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return report
+
+
+async def http_post(reader, writer, path, body, keep_alive):
+    """
+    Sends one POST request on an open connection, returns the status of the answer
+    """
+    writer.write('POST {} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                 'Connection: {}\r\n\r\n'.format(path, len(body), 'keep-alive' if keep_alive else 'close').encode()
+                 + body)
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    length = next(int(line.split(':', 1)[1]) for line in head if line.lower().startswith('content-length:'))
+    await reader.readexactly(length)
+    return int(head[0].split(' ')[1])
+
+
+async def service_clients(port, bodies, connections, keep_alive):
+    """
+    Sends every body once over a number of concurrent connections (kept alive, or a new connection per request),
+    returns the latency and status of every request
+    """
+    latencies = []
+    statuses = {}
+
+    async def client(share):
+        connection = None
+        for body in share:
+            if connection is None:
+                connection = await asyncio.open_connection('127.0.0.1', port)
+            start = time.perf_counter()
+            status = await http_post(*connection, '/recommendations', body, keep_alive)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not keep_alive:
+                connection[1].close()
+                connection = None
+        if connection is not None:
+            connection[1].close()
+
+    await asyncio.gather(*(client(bodies[number::connections]) for number in range(connections)))
+    return latencies, statuses
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def benchmark_service(paths, requests, connections):
+    """
+    Throughput and latency of the recommendation service on localhost with a number of concurrent clients, for
+    different requests (the user files in turn) and for identical requests (coalesced while one is computed), with
+    connections kept alive and with a new connection per request
+    """
+    users = [json.dumps(request.preferences).encode() for request in batch_recommendations.load_requests(paths)]
+    service = recommendation_service.RecommendationService(group10_agent.EnvironmentalAgent(ONTOLOGY_PATH))
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start('127.0.0.1', 0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    report = {}
+    try:
+        for mix, bodies in [('different', [users[number % len(users)] for number in range(requests)]),
+                            ('identical', [users[0]] * requests)]:
+            for keep_alive in [True, False]:
+                before = dict(service.stats)
+                start = time.perf_counter()
+                latencies, statuses = asyncio.run(service_clients(port, bodies, connections, keep_alive))
+                seconds = time.perf_counter() - start
+                report['{}_{}'.format(mix, 'keep_alive' if keep_alive else 'new_connection')] = {
+                    'requests_per_second': round(len(latencies) / seconds, 1),
+                    'p50_ms': round(1000 * percentile(latencies, 0.5), 3),
+                    'p99_ms': round(1000 * percentile(latencies, 0.99), 3),
+                    'statuses': statuses,
+                    'computed': service.stats['computed'] - before['computed'],
+                    'coalesced': service.stats['coalesced'] - before['coalesced'],
+                    'connections': service.stats['connections'] - before['connections']}
+    finally:
+        loop.call_soon_threadsafe(server.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        service.close()
+    return report
+
+
+def benchmark_cache(paths, copies, entries, repeat):
+    """
+    Compares answering the same requests again and again without a result cache and with caches of a number of
+    entries (the requests of a batch run grouped, so identical requests follow each other), every user file being
+    requested copies times. Also reports the counters of a cache after a delta, whose entries are then dropped.
+    """
+    requests = batch_recommendations.load_requests(paths) * copies
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH)
+    report = {}
+    for max_entries in [None] + entries:
+        timings = []
+        for _ in range(repeat):
+            cache = None if max_entries is None else recommendation_cache.RecommendationCache(max_entries)
+            agent.result_cache = cache
+            start = time.perf_counter()
+            agent.find_states_many(requests)
+            timings.append(time.perf_counter() - start)
+        report['no_cache' if cache is None else 'entries_{}'.format(max_entries)] = dict(
+            {'best_ms': round(1000 * min(timings), 3),
+             'requests_per_second': round(len(requests) / min(timings), 1)},
+            **(cache.stats() if cache is not None else {}))
+    agent.result_cache = recommendation_cache.RecommendationCache()
+    agent.find_states_many(requests)
+    agent.apply_delta(search_delta(agent, 1, 'Cache'))
+    agent.find_states_many(requests)
+    report['after_delta'] = agent.result_cache.stats()
+    return report
+
+
+def comparable(result):
+    """
+    The part of a request result that has to be the same every time the request is run: the charging spot of an
+    electric car is chosen at random (it does not change the ranking)
+    """
+    top = None
+    if result.top is not None:
+        top = [{key: value for key, value in option.items() if key != 'charging_spot'} for option in result.top]
+    output = [line for line in result.output.splitlines() if 'charging spot' not in line]
+    return result.options, top, output, result.error
+
+
+def benchmark_threads(paths, copies, threads):
+    """
+    Stress test of one agent serving many requests from a pool of threads at the same time, every request with its
+    own context: every user file is requested copies times and every result has to be the same as when the requests
+    are run one after the other. Reports the throughput for every number of threads.
+    """
+    requests = batch_recommendations.load_requests(paths) * copies
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH)
+
+    def run(request):
+        return agent.find_states_many([request], share=False).results[0]
+
+    start = time.perf_counter()
+    expected = [comparable(run(request)) for request in requests]
+    report = {'sequential': {'requests_per_second': round(len(requests) / (time.perf_counter() - start), 1)}}
+    for count in threads:
+        with concurrent.futures.ThreadPoolExecutor(count) as executor:
+            start = time.perf_counter()
+            results = list(executor.map(run, requests))
+            seconds = time.perf_counter() - start
+        mismatches = sum(comparable(result) != expected[index] for index, result in enumerate(results))
+        report['threads_{}'.format(count)] = {'requests_per_second': round(len(requests) / seconds, 1),
+                                              'requests': len(results), 'mismatches': mismatches}
+        if mismatches:
+            raise AssertionError('{} of {} requests gave other results on {} threads'.format(mismatches,
+                                                                                             len(requests), count))
+    return report
+
+
+def benchmark_instrumentation(paths, copies, repeat):
+    """
+    The cost of the instrumentation: the requests of the user files (every one copies times) without and with an
+    instrumented agent, followed by the stages and counters recorded in the last instrumented run
+    """
+    requests = batch_recommendations.load_requests(paths) * copies
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH)
+    report = {}
+    for variant in ['disabled', 'enabled']:
+        timings = []
+        for _ in range(repeat):
+            agent.instrumentation = instrumentation.Instrumentation() if variant == 'enabled' else None
+            start = time.perf_counter()
+            agent.find_states_many(requests, share=False)
+            timings.append(time.perf_counter() - start)
+        report[variant] = {'best_ms': round(1000 * min(timings), 3),
+                           'requests_per_second': round(len(requests) / min(timings), 1)}
+    report['enabled']['overhead_percent'] = round(
+        100 * (report['enabled']['best_ms'] / report['disabled']['best_ms'] - 1), 2)
+    stats = agent.instrumentation.stats(agent)
+    for stage, summary in stats['stages'].items():
+        report[stage] = summary
+    report['counters'] = stats['counters']
+    return report
+
+
+def benchmark_reasoner(paths, repeat):
+    """
+    HermiT against the rule materialiser: constructing the agent without a snapshot and with a cold snapshot
+    directory, each in a fresh interpreter, the facts entailed by both (see rule_materialiser.check) and the requests
+    of the user files whose output differs between the two
+    """
+    construct = 'import group10_agent\ngroup10_agent.EnvironmentalAgent({!r}, snapshot_dir={!r}, reasoner={!r})'
+    report = {}
+    for reasoner in ontology_snapshot.REASONERS:
+        timings = {'no_snapshot': [], 'cold_snapshot': []}
+        for _ in range(repeat):
+            snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+            try:
+                timings['no_snapshot'].append(time_in_subprocess(construct.format(ONTOLOGY_PATH, None, reasoner)))
+                timings['cold_snapshot'].append(time_in_subprocess(construct.format(ONTOLOGY_PATH, snapshot_dir,
+                                                                                    reasoner)))
+            finally:
+                shutil.rmtree(snapshot_dir, ignore_errors=True)
+        report[reasoner] = {'{}_best_ms'.format(variant): round(1000 * min(values), 3)
+                            for variant, values in timings.items()}
+    report['rules']['speedup'] = round(report['hermit']['no_snapshot_best_ms'] /
+                                       report['rules']['no_snapshot_best_ms'], 2)
+
+    check = rule_materialiser.check(ONTOLOGY_PATH)
+    report['facts'] = {key: check[key] for key in ['facts', 'missing', 'extra']}
+    report['differences'] = {'{}_{}'.format(kind, predicate): len(pairs)
+                             for kind, differences in check['differences'].items()
+                             for predicate, pairs in differences.items()}
+
+    requests = batch_recommendations.load_requests(paths)
+    snapshot_dir = tempfile.mkdtemp(prefix='group10-snapshot-')
+    try:
+        batches = {reasoner: group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=snapshot_dir,
+                                                              reasoner=reasoner).find_states_many(requests)
+                   for reasoner in ontology_snapshot.REASONERS}
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    differing = [hermit.name for hermit, rules in zip(batches['hermit'].results, batches['rules'].results)
+                 if (hermit.output, hermit.top, hermit.error) != (rules.output, rules.top, rules.error)]
+    report['outputs'] = {'requests': len(requests), 'differing': len(differing),
+                         'names': ','.join(os.path.basename(name) for name in differing) or '-'}
+    return report
+
+
+# The stages of find_states, by the activity of a request
+SCALING_STAGES = ['Restaurant', 'Clothing', 'Transportation', 'Activity']
+
+
+def scaling_stage(agent, requests):
+    """
+    Times find_states for every request of one stage. The first request is reported on its own, it also builds what
+    the agent computes on first use (route trees, compiled preferences). Only requests that complete are timed, the
+    ones that raise are counted as errors.
+    """
+    timings = []
+    errors = []
+    for request in requests:
+        start = time.perf_counter()
+        with batch_recommendations.captured_output(io.StringIO()):
+            try:
+                agent.find_states(request.preferences, group10_agent.RequestContext(request.preferences))
+            except Exception as exception:
+                errors.append('{}: {}'.format(type(exception).__name__, exception))
+                continue
+        timings.append(time.perf_counter() - start)
+    measured = {'requests': len(requests), 'completed': len(timings), 'errors': len(errors)}
+    if timings:
+        rest = timings[1:] or timings
+        measured.update({'first_ms': round(1000 * timings[0], 3), 'mean_ms': round(1000 * sum(rest) / len(rest), 3),
+                         'p50_ms': round(1000 * percentile(rest, 0.5), 3),
+                         'p95_ms': round(1000 * percentile(rest, 0.95), 3), 'max_ms': round(1000 * max(rest), 3)})
+    if errors:
+        measured['first_error'] = errors[0]
+    return measured
+
+
+def scaling_run(scale, requests, seed=synthetic_ontology.SEED):
+    """
+    Generates the ontology at one scale (synthetic_ontology), creates an agent for it (reasoning included) and times
+    requests of the generated users for every stage. Run in an interpreter of its own by benchmark_scaling.
+    """
+    directory = tempfile.mkdtemp(prefix='group10-scaling-')
+    try:
+        path = os.path.join(directory, 'scale_{}.owl'.format(scale))
+        start = time.perf_counter()
+        synthetic = synthetic_ontology.generate(path, synthetic_ontology.scaled_counts(scale), seed=seed)
+        generate_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        agent = group10_agent.EnvironmentalAgent(path, snapshot_dir=os.path.join(directory, 'snapshots'))
+        startup_seconds = time.perf_counter() - start
+        templates = [request for request in batch_recommendations.load_requests(['./Users'])
+                     if 'activity' in request.preferences]
+        stages = {}
+        for stage in SCALING_STAGES:
+            stage_templates = [request for request in templates if request.preferences['activity'] == stage]
+            stages[stage.lower()] = scaling_stage(agent, synthetic_ontology.synthetic_requests(
+                synthetic, stage_templates, requests, seed))
+        measured = {'scale': scale, 'counts': synthetic.counts, 'individuals': len(agent.individuals),
+                    'file_mb': round(os.path.getsize(path) / (1 << 20), 3),
+                    'generate_seconds': round(generate_seconds, 3), 'startup_seconds': round(startup_seconds, 3),
+                    'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                    'reasoner_max_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+                    'stages': stages}
+        agent.world.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return measured
+
+
+def run_scale(scale, requests, timeout):
+    """
+    Runs scaling_run in a fresh interpreter, so every scale starts from the same state and a scale that takes longer
+    than timeout seconds (the reasoner included, which runs in a process of its own) can be stopped
+    """
+    code = 'import benchmark, json\nprint(json.dumps(benchmark.scaling_run({}, {})))'.format(scale, requests)
+    process = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, start_new_session=True)
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        return {'scale': scale, 'error': 'timed out after {} s'.format(timeout)}
+    if process.returncode != 0:
+        lines = stderr.strip().splitlines()
+        return {'scale': scale, 'error': lines[-1] if lines else 'exit status {}'.format(process.returncode)}
+    return json.loads(stdout.strip().splitlines()[-1])
+
+
+def benchmark_scaling(scales, requests, timeout, output):
+    """
+    The find_states stages (restaurant, clothing, transportation, activity) on generated ontologies of scale times
+    the individuals of the shipped one, with the time to generate and reason every ontology and the memory used.
+    All measurements are written to output as json, after every scale, so the scales that finished are kept when a
+    larger one does not.
+    """
+    document = {'requests_per_stage': requests, 'timeout_seconds': timeout, 'scales': {}}
+    report = {}
+    for scale in scales:
+        measured = document['scales'][str(scale)] = run_scale(scale, requests, timeout)
+        with open(output, 'w') as openfile:
+            json.dump(document, openfile, indent=2)
+        if 'error' in measured:
+            report['x{}'.format(scale)] = {'error': measured['error']}
+            continue
+        report['x{}'.format(scale)] = {key: measured[key] for key in ['individuals', 'file_mb', 'generate_seconds',
+                                                                       'startup_seconds', 'max_rss_mb',
+                                                                       'reasoner_max_rss_mb']}
+        for stage, stage_measured in measured['stages'].items():
+            report['x{}_{}'.format(scale, stage)] = {key: value for key, value in stage_measured.items()
+                                                     if key != 'first_error'}
+    return report
+
+
+def benchmark_memory():
+    """
+    Memory used by the intern table compared with the label dictionaries and per-class individuals list
+    """
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH)
+    return intern_table.memory_report(agent)
+
+
+def print_report(name, report):
+    """
+    Prints a report of named measurements
+    """
+    print('{}:'.format(name))
+    for part, measurements in report.items():
+        print('  {:<24} {}'.format(part, '  '.join('{} {}'.format(key, value) for key, value in measurements.items())))
+
+
+def print_results(name, results):
+    """
+    Prints the best and mean time of every measured variant
+    """
+    print('{}:'.format(name))
+    for variant, timings in results.items():
+        print('  {:<20} best {:10.3f} ms  mean {:10.3f} ms'.format(variant, 1000 * min(timings),
+                                                                1000 * sum(timings) / len(timings)))
+
+
+if __name__ == "__main__":
+    """
+    Command line entry point, every benchmark is a subcommand
+    """
+    parser = argparse.ArgumentParser(description="Benchmarks for Group 10's environmental agent")
+    parser.add_argument('--json', action='store_true', help='print the raw timings as json')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    startup_parser = subparsers.add_parser('startup', help='cold vs warm start of the agent with snapshots')
+    startup_parser.add_argument('--repeat', type=int, default=3)
+
+    import_parser = subparsers.add_parser('import', help='import and constructor time, lazy vs eager startup')
+    import_parser.add_argument('--repeat', type=int, default=3)
+
+    delta_parser = subparsers.add_parser('delta', help='incremental deltas vs running the reasoner again')
+    delta_parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+    delta_parser.add_argument('--repeat', type=int, default=3)
+
+    reverse_parser = subparsers.add_parser('reverse', help='reverse index lookups vs ontology.search per object')
+    reverse_parser.add_argument('--sizes', type=int, nargs='+', default=[0, 100, 1000, 5000])
+    reverse_parser.add_argument('--repeat', type=int, default=3)
+
+    preferences_parser = subparsers.add_parser('preferences', help='Python preference evaluator vs one SPARQL query')
+    preferences_parser.add_argument('--sizes', type=int, nargs='+', default=[0, 100, 1000])
+    preferences_parser.add_argument('--repeat', type=int, default=3)
+
+    routing_parser = subparsers.add_parser('routing', help='route queries per query on a generated city network')
+    routing_parser.add_argument('--cities', type=int, default=50)
+    routing_parser.add_argument('--neighborhoods', type=int, default=10, help='neighborhoods per city')
+    routing_parser.add_argument('--queries', type=int, default=2000)
+    routing_parser.add_argument('--repeat', type=int, default=3)
+
+    scoring_parser = subparsers.add_parser('scoring', help='scalar vs batched NumPy utility scoring')
+    scoring_parser.add_argument('--candidates', type=int, default=100000)
+    scoring_parser.add_argument('--repeat', type=int, default=3)
+
+    ranking_parser = subparsers.add_parser('ranking', help='sorting all options vs a bounded heap of the best k')
+    ranking_parser.add_argument('--candidates', type=int, default=100000)
+    ranking_parser.add_argument('-k', type=int, default=3)
+    ranking_parser.add_argument('--repeat', type=int, default=3)
+
+    candidates_parser = subparsers.add_parser('candidates', help='memory and time of state objects vs a candidate table')
+    candidates_parser.add_argument('--candidates', type=int, default=100000)
+
+    search_parser = subparsers.add_parser('search', help='every restaurant candidate vs branch and bound for the best k')
+    search_parser.add_argument('--sizes', type=int, nargs='+', default=[0, 100, 1000])
+    search_parser.add_argument('-k', type=int, default=3)
+    search_parser.add_argument('--user', default='./Users/michelle.json', help='json file with the preferences')
+    search_parser.add_argument('--repeat', type=int, default=3)
+
+    relaxation_parser = subparsers.add_parser('relaxation', help='dropping the last preference vs the subset lattice')
+    relaxation_parser.add_argument('--repeat', type=int, default=3)
+
+    batch_parser = subparsers.add_parser('batch', help='requests one by one vs one batch sharing their work')
+    batch_parser.add_argument('paths', nargs='*', default=['./Users'], help='user json files or directories')
+    batch_parser.add_argument('--copies', type=int, default=20, help='how often every user file is requested')
+    batch_parser.add_argument('--repeat', type=int, default=3)
+
+    pool_parser = subparsers.add_parser('pool', help='throughput of a worker pool for a number of worker processes')
+    pool_parser.add_argument('paths', nargs='*', default=['./Users'], help='user json files or directories')
+    pool_parser.add_argument('--copies', type=int, default=200, help='how often every user file is requested')
+    pool_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    pool_parser.add_argument('--modes', nargs='+', choices=worker_pool.MODES, default=worker_pool.MODES)
+
+    service_parser = subparsers.add_parser('service', help='keep-alive clients against the HTTP service on localhost')
+    service_parser.add_argument('paths', nargs='*', default=['./Users'], help='user json files or directories')
+    service_parser.add_argument('--requests', type=int, default=2000)
+    service_parser.add_argument('--connections', type=int, default=16)
+
+    cache_parser = subparsers.add_parser('cache', help='repeated requests without and with a result cache')
+    cache_parser.add_argument('paths', nargs='*', default=['./Users'], help='user json files or directories')
+    cache_parser.add_argument('--copies', type=int, default=50, help='how often every user file is requested')
+    cache_parser.add_argument('--entries', type=int, nargs='+', default=[1, 4, 1024])
+    cache_parser.add_argument('--repeat', type=int, default=3)
+
+    threads_parser = subparsers.add_parser('threads', help='stress test of one agent serving a pool of threads')
+    threads_parser.add_argument('paths', nargs='*', default=['./Users'], help='user json files or directories')
+    threads_parser.add_argument('--copies', type=int, default=100, help='how often every user file is requested')
+    threads_parser.add_argument('--threads', type=int, nargs='+', default=[2, 8, 32])
+
+    scaling_parser = subparsers.add_parser('scaling', help='find_states stages on generated ontologies of every scale')
+    scaling_parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100, 1000])
+    scaling_parser.add_argument('--requests', type=int, default=20, help='requests per stage')
+    scaling_parser.add_argument('--timeout', type=float, default=3600, help='seconds a scale may take')
+    scaling_parser.add_argument('--output', default='scaling.json', help='json file the measurements are written to')
+
+    instrumentation_parser = subparsers.add_parser('instrumentation', help='requests without and with instrumentation')
+    instrumentation_parser.add_argument('paths', nargs='*', default=['./Users'], help='user json files or directories')
+    instrumentation_parser.add_argument('--copies', type=int, default=50, help='how often every user file is requested')
+    instrumentation_parser.add_argument('--repeat', type=int, default=3)
+
+    reasoner_parser = subparsers.add_parser('reasoner', help='HermiT vs the rule materialiser: startup and results')
+    reasoner_parser.add_argument('paths', nargs='*', default=['./Users'], help='user json files or directories')
+    reasoner_parser.add_argument('--repeat', type=int, default=3)
+
+    subparsers.add_parser('memory', help='memory footprint of the intern table vs the label dictionaries')
+
+    args = parser.parse_args()
+    if args.benchmark == 'startup':
+        results = benchmark_startup(args.repeat)
+    elif args.benchmark == 'import':
+        results = benchmark_import(args.repeat)
+    elif args.benchmark == 'delta':
+        results = benchmark_delta(args.sizes, args.repeat)
+    elif args.benchmark == 'reverse':
+        results = benchmark_reverse_index(args.sizes, args.repeat)
+    elif args.benchmark == 'preferences':
+        results = benchmark_preferences(args.sizes, args.repeat)
+    elif args.benchmark == 'routing':
+        results = benchmark_routing(args.cities, args.neighborhoods, args.queries, args.repeat)
+    elif args.benchmark == 'scoring':
+        results = benchmark_scoring(args.candidates, args.repeat)
+    elif args.benchmark == 'ranking':
+        results = benchmark_ranking(args.candidates, args.k, args.repeat)
+    elif args.benchmark == 'candidates':
+        results = benchmark_candidates(args.candidates)
+    elif args.benchmark == 'search':
+        results = benchmark_search(args.sizes, args.k, args.user, args.repeat)
+    elif args.benchmark == 'relaxation':
+        results = benchmark_relaxation(args.repeat)
+    elif args.benchmark == 'batch':
+        results = benchmark_batch(args.paths, args.copies, args.repeat)
+    elif args.benchmark == 'pool':
+        results = benchmark_pool(args.paths, args.copies, args.workers, args.modes)
+    elif args.benchmark == 'service':
+        results = benchmark_service(args.paths, args.requests, args.connections)
+    elif args.benchmark == 'cache':
+        results = benchmark_cache(args.paths, args.copies, args.entries, args.repeat)
+    elif args.benchmark == 'threads':
+        results = benchmark_threads(args.paths, args.copies, args.threads)
+    elif args.benchmark == 'scaling':
+        results = benchmark_scaling(args.scales, args.requests, args.timeout, args.output)
+    elif args.benchmark == 'instrumentation':
+        results = benchmark_instrumentation(args.paths, args.copies, args.repeat)
+    elif args.benchmark == 'reasoner':
+        results = benchmark_reasoner(args.paths, args.repeat)
+    elif args.benchmark == 'memory':
+        results = benchmark_memory()
+
+    if args.json:
+        print(json.dumps(results))
+    elif args.benchmark in ('memory', 'candidates', 'search', 'relaxation', 'batch', 'pool', 'service', 'cache',
+                            'threads', 'scaling', 'instrumentation', 'reasoner'):
+        print_report(args.benchmark, results)
+    else:
+        print_results(args.benchmark, results)
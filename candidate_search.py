@@ -0,0 +1,68 @@
+import heapq
+from collections import namedtuple
+
+# A group of candidates sharing an upper bound on their ranking key:
+# - position: where its first candidate is in the full enumeration, the candidates follow it (ties are won by the
+#   earlier candidate, like in a stable sort)
+# - bound: a key no candidate of the branch can exceed (keys are tuples compared lexicographically, best is highest)
+# - size: the number of candidates in the branch
+# - expand: function returning the (key, candidate) pairs of the branch, in enumeration order
+Branch = namedtuple('Branch', ['position', 'bound', 'size', 'expand'])
+
+
+class SearchStats:
+    """
+    Counters of one search: how many branches and candidates there were, and how many of them were never expanded
+    because they could not get into the top k
+    """
+
+    def __init__(self):
+        self.branches = 0
+        self.expanded_branches = 0
+        self.pruned_branches = 0
+        self.candidates = 0
+        self.expanded_candidates = 0
+        self.pruned_candidates = 0
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+def negated(key):
+    return tuple(-value for value in key)
+
+
+def search(branches, k, stats=None):
+    """
+    Branch and bound over the branches (in any order): expands them best bound first and yields (position, key,
+    candidate) for every candidate of the expanded branches. A branch is only expanded while its bound can still beat
+    the k-th best key found so far; as bounds only get worse in this order, the search stops at the first branch that
+    can not, the best k candidates are then proven to be among the ones yielded. k=None expands every branch.
+    """
+    stats = stats if stats is not None else SearchStats()
+    queue = []
+    for branch in branches:
+        stats.branches += 1
+        stats.candidates += branch.size
+        if branch.size:
+            queue.append((negated(branch.bound), branch.position, branch))
+    heapq.heapify(queue)
+
+    # The best k keys so far, worst (lowest key, latest position) first
+    best = []
+    while queue:
+        negated_bound, position, branch = heapq.heappop(queue)
+        if k is not None and len(best) == k and (k == 0 or branch.bound < best[0][0]):
+            stats.pruned_branches += 1 + len(queue)
+            stats.pruned_candidates += branch.size + sum(entry[2].size for entry in queue)
+            break
+        stats.expanded_branches += 1
+        for index, (key, candidate) in enumerate(branch.expand()):
+            stats.expanded_candidates += 1
+            if k is not None:
+                entry = (key, -(position + index))
+                if len(best) < k:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+            yield position + index, key, candidate
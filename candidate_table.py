@@ -0,0 +1,176 @@
+from array import array
+import utility_scoring
+
+# Most CO2 scores a candidate has: clothing item, origin and travel option
+MAX_DOMAINS = 3
+
+# Candidate kinds, deciding how the recommendation states and records are built (see CandidateTable.state)
+RESTAURANT = 'Restaurant'
+CLOTHING = 'Clothing'
+TRAVEL = 'Travel'
+
+
+class CandidateTable:
+    """
+    Struct-of-arrays table of the candidates of one request: one typed array per column instead of a
+    RecommendationState and a [state, utility, adhered preferences] list per candidate. Entities are stored by their
+    interned ID (see InternTable), other values (like 'Walking' or the online store list) by a negative code into a
+    small list of values. The failed preference checks of a candidate are a bitmask over violation_names (see
+    loose_preferences.LoosePreferences.names).
+    RecommendationState objects (of state_class) are only built for the rows that are shown (see record).
+    """
+
+    def __init__(self, agent, kind, state_class, violation_names=()):
+        self.agent = agent
+        self.kind = kind
+        self.state_class = state_class
+        self.violation_names = list(violation_names)
+        # Clothing candidates all share one list of loosened preferences, see create_clothing_recommendations
+        self.shared_violations = None
+        self.values = []
+        self.codes = {}
+        self.item = array('q')
+        self.destination = array('q')
+        self.mode = array('q')
+        self.charging_spot = array('q')
+        self.duration = array('q')
+        # CO2 scores are integers, except for a few decimals in the ontology. Which ones were integers is kept as a
+        # bitmask so the scores shown are the same as the ontology values.
+        self.co2 = [array('d') for _ in range(MAX_DOMAINS)]
+        self.co2_integers = array('B')
+        self.n_domains = array('b')
+        self.n_prefs = array('q')
+        self.violations = array('Q')
+        self.utility = array('d')
+        # Integer for most candidates, a float when a cuisine weight is involved
+        self.adhered_prefs = []
+        # Candidates that were found but not added, as they can not be among the options that are shown (see
+        # candidate_search), with the counters of that search
+        self.pruned = 0
+        self.search_stats = None
+
+    def __len__(self):
+        return len(self.item)
+
+    def encode(self, value):
+        try:
+            return self.codes[value]
+        except KeyError:
+            code = self.codes[value] = self.new_code(value)
+            return code
+        except TypeError:  # Lists can not be dictionary keys
+            return self.new_code(value)
+
+    def new_code(self, value):
+        if getattr(value, 'storid', None) is not None:
+            return self.agent.interned.add(value)
+        for index, known in enumerate(self.values):
+            if type(known) == type(value) and known == value:
+                return -1 - index
+        self.values.append(value)
+        return -len(self.values)
+
+    def decode(self, code):
+        if code >= 0:
+            return self.agent.interned.entity(code)
+        return self.values[-1 - code]
+
+    def encode_violations(self, names):
+        """
+        Bitmask of the failed checks, names being a subsequence of violation_names
+        """
+        mask = 0
+        position = 0
+        for name in names:
+            position = self.violation_names.index(name, position)
+            mask |= 1 << position
+            position += 1
+        return mask
+
+    def decode_violations(self, mask):
+        return [name for position, name in enumerate(self.violation_names) if mask >> position & 1]
+
+    def add(self, item, destination, mode, duration, co2_scores, adhered_prefs, n_prefs, violations=(),
+            charging_spot=''):
+        """
+        Adds a candidate, returns its row. The CO2 scores are copied, callers may keep changing their list.
+        """
+        self.item.append(self.encode(item))
+        self.destination.append(self.encode(destination))
+        self.mode.append(self.encode(mode))
+        self.charging_spot.append(self.encode(charging_spot))
+        self.duration.append(duration)
+        integers = 0
+        for domain, score in enumerate(co2_scores):
+            self.co2[domain].append(score)
+            if type(score) is int:
+                integers |= 1 << domain
+        for domain in range(len(co2_scores), MAX_DOMAINS):
+            self.co2[domain].append(0)
+        self.co2_integers.append(integers)
+        self.n_domains.append(len(co2_scores))
+        self.n_prefs.append(n_prefs)
+        self.violations.append(self.encode_violations(violations))
+        self.adhered_prefs.append(adhered_prefs)
+        return len(self.item) - 1
+
+    def co2_scores(self, row):
+        return [int(self.co2[domain][row]) if self.co2_integers[row] >> domain & 1 else self.co2[domain][row]
+                for domain in range(self.n_domains[row])]
+
+    def score(self):
+        """
+        Computes the utility of every candidate with one batch_utilities call
+        """
+        if len(self) == 0:
+            self.utility = array('d')
+            return self.utility
+        numpy = utility_scoring.numpy
+        co2_sums = sum(numpy.frombuffer(column, dtype=float) for column in self.co2)
+        n_domains = numpy.frombuffer(self.n_domains, dtype=numpy.int8)
+        n_prefs = numpy.frombuffer(self.n_prefs, dtype=numpy.int64)
+        utilities = utility_scoring.batch_utilities(co2_sums, n_domains, self.adhered_prefs, n_prefs)
+        self.utility = array('d', utilities.tobytes())
+        return self.utility
+
+    def column(self, name):
+        return getattr(self, name)
+
+    def sort_key(self, order):
+        """
+        Key function over the rows for an ordering, a list of column names
+        """
+        if len(order) == 1:
+            return self.column(order[0]).__getitem__
+        columns = [self.column(name) for name in order]
+        return lambda row: tuple(column[row] for column in columns)
+
+    def state(self, row):
+        """
+        The RecommendationState of a row, built the way the recommendation functions used to build them
+        """
+        mode = self.decode(self.mode[row])
+        charging_spot = self.decode(self.charging_spot[row])
+        violations = self.decode_violations(self.violations[row])
+        if self.kind == RESTAURANT:
+            return self.state_class('Restaurant', mode, self.decode(self.destination[row]), self.decode(self.item[row]),
+                                    [], [], violations, self.duration[row], charging_spot,
+                                    env_score=self.co2_scores(row))
+        if self.kind == CLOTHING:
+            violations = self.shared_violations if self.shared_violations is not None else violations
+            return self.state_class('Clothing', mode, [], [], self.decode(self.destination[row]),
+                                    self.decode(self.item[row]), violations, self.duration[row], charging_spot)
+        # Travel states have always been built with these positional arguments
+        return self.state_class('Restaurant', mode, [], [], violations, self.duration[row], charging_spot)
+
+    def record(self, row):
+        """
+        The recommendation of a row in the list form the offer functions use: [state, utility, adhered preferences],
+        with the duration before the adhered preferences for travel
+        """
+        if self.kind == TRAVEL:
+            return [self.state(row), self.utility[row], self.duration[row], self.adhered_prefs[row]]
+        return [self.state(row), self.utility[row], self.adhered_prefs[row]]
+
+    def records(self):
+        return [self.record(row) for row in range(len(self))]
@@ -1,19 +1,95 @@
+import argparse
+import functools
+import importlib.util
 import json
-from owlready2 import *
 import operator
-import random_agent
 import random
+import sys
+import ranking
 
 
-def count_upper_case_letters(str_obj):
+def lazy_import(name):
     """
-    Counts the amount of upper case letters
+    Returns a module that is only executed on first attribute access. Used for the modules that depend on owlready2,
+    so importing this module (for instance for RecommendationState) does not pull in owlready2.
     """
-    count = 0
-    for elem in str_obj:
-        if elem.isupper():
-            count += 1
-    return count
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+ontology_snapshot = lazy_import('ontology_snapshot')
+incremental_reasoning = lazy_import('incremental_reasoning')
+intern_table = lazy_import('intern_table')
+reverse_index = lazy_import('reverse_index')
+preference_language = lazy_import('preference_language')
+preference_sparql = lazy_import('preference_sparql')
+health_exclusions = lazy_import('health_exclusions')
+travel_matrix = lazy_import('travel_matrix')
+utility_scoring = lazy_import('utility_scoring')
+candidate_table = lazy_import('candidate_table')
+candidate_search = lazy_import('candidate_search')
+loose_preferences = lazy_import('loose_preferences')
+preference_relaxation = lazy_import('preference_relaxation')
+batch_recommendations = lazy_import('batch_recommendations')
+
+# Number of restaurant recommendations that are explained to the user
+RESTAURANTS_SHOWN = 3
+
+
+def shared(key):
+    """
+    Decorator for the agent methods whose result only depends on a key of their arguments (a function of the
+    arguments). When called with the context of a request that is part of a find_states_many batch, the requests
+    with the same key share one result, see batch_recommendations.SharedWork.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, context=None):
+            if context is None or context.shared_work is None:
+                return method(self, *args)
+            return context.shared_work.get(method.__name__, key(*args), lambda: method(self, *args))
+        return wrapper
+    return decorator
+
+
+def instrumented(method):
+    """
+    Decorator for the stages of find_states: when the agent is instrumented (see instrumentation.Instrumentation),
+    every call is recorded as a span of the stage named after the method. Without instrumentation the only cost is
+    one attribute check.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.instrumentation is None:
+            return method(self, *args, **kwargs)
+        with self.instrumentation.span(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class RequestContext:
+    """
+    Everything that belongs to one request of find_states: the preferences of the user, the charging spot their
+    electric car needs (if any), whether it is rush hour, how their preferences were relaxed and the work shared with
+    the other requests of a batch. The agent itself only holds what all requests share, so one agent can serve
+    requests from several threads at once, every request with its own context.
+    """
+
+    __slots__ = ('preferences', 'charging_spot', 'rushhour', 'relaxation', 'shared_work')
+
+    def __init__(self, preferences, shared_work=None):
+        self.preferences = preferences
+        self.charging_spot = ''
+        self.rushhour = False
+        self.relaxation = None
+        self.shared_work = shared_work
 
 
 class RecommendationState:
@@ -21,6 +97,9 @@ class RecommendationState:
     State for storing a certain recommendation
     """
 
+    __slots__ = ('activity', 'transportation', 'restaurant', 'food', 'clothing_store', 'clothing_item',
+                 'pref_not_adhered_to', 'duration', 'charging_spot', 'energy', 'env_score')
+
     def __init__(self, activity='', transportation='', restaurant='', food='', clothing_store='', clothing_item='',
                  pref_not_adhered_to='', duration=0, charging_spot='', energy='', env_score =''):
         self.activity = activity
@@ -50,35 +129,105 @@ class EnvironmentalAgent:
     Group 10's environmental agent with functions for executing inferences using the ontology
     """
 
-    def __init__(self, path):
-        # Load the desired ontology using the path file
-        self.ontology = get_ontology(path)
-        self.ontology.load()
-        self.recommendations = []
-        self.query = []
-        self.rushhour = False
-        self.graph = default_world.as_rdflib_graph()
-        self.charging_spot = ''
-
-        # Run the reasoner to obtain the inferences;
-        with self.ontology:
-            sync_reasoner(infer_property_values=True, debug=0)
+    def __init__(self, path, snapshot_dir=None, lazy=True, preference_backend='python', read_only=False,
+                 reasoner='hermit'):
+        # Load the desired ontology using the path file and run the reasoner to obtain the inferences. When a
+        # snapshot directory is given, the reasoned world is stored there and reused as long as the ontology file
+        # does not change. With read_only the snapshot is opened read-only (deltas can then not be applied), as done
+        # by the workers of a worker_pool. With reasoner='rules' the inferences are materialised by the rules of
+        # rule_materialiser instead of HermiT, which starts without the JVM.
+        if reasoner not in ontology_snapshot.REASONERS:
+            raise ValueError('Unknown reasoner: {}'.format(reasoner))
+        self.reasoner = reasoner
+        self.world, self.ontology, self.ontology_hash = ontology_snapshot.load_reasoned_world(
+            path, snapshot_dir, ontology_snapshot.REASONERS[reasoner], read_only=read_only)
+        self.inferences = self.world.get_ontology(ontology_snapshot.INFERENCES_IRI)
+        # Changes whenever the reasoned ontology changes, either through a new ontology file or an applied delta
+        self.ontology_version = self.ontology_hash
+        self.deltas_applied = 0
+        # Results of whole requests run through find_states_many, a recommendation_cache.RecommendationCache (None
+        # does not cache them)
+        self.result_cache = None
+        # Spans of the stages of find_states and counters, an instrumentation.Instrumentation (None records nothing)
+        self.instrumentation = None
 
         # Reference dictionaries between IRIs and given labels that might be useful
         self.label_to_class = {ent.label[0]: ent for ent in self.ontology.classes() if len(ent.label) > 0}
         self.label_to_prop = {prop.label[0]: prop for prop in self.ontology.properties() if len(prop.label) > 0}
-        self.individuals = []
-        for c in self.ontology.classes():
-            for indiv in c.instances():
-                self.individuals.append(indiv)
+        # Every class and individual once, with a dense integer ID
+        self.interned = intern_table.InternTable(self.ontology)
+        self.individuals = self.interned.individuals()
         self.label_to_indiv = {ent.label[0]: ent for ent in self.individuals if len(ent.label) > 0}
+        # Subjects by (property, object) for the properties that are looked up in reverse (serves, selling, ...)
+        self.reverse_index = reverse_index.ReverseIndex(self.ontology)
+        # What every health condition rules out
+        self.health_exclusions = health_exclusions.HealthExclusions(self)
+        # Travel options between every pair of neighborhoods, stored next to the snapshot
+        travel_file = None
+        if snapshot_dir is not None:
+            travel_file = ontology_snapshot.snapshot_path(path, snapshot_dir, self.ontology_hash) + '.travel.json'
+        self.travel_matrix = travel_matrix.load_or_build(self, travel_file)
+        # Compiled pref_food/pref_clothing expressions, evaluated in Python ('python') or as a single SPARQL query
+        # per request ('sparql')
+        self.preference_backend = preference_backend
+        self.plans = preference_language.PlanCache()
+        self.sparql_plans = preference_sparql.SparqlBackend()
+
+        # The rdflib graph, the reverse label dictionaries and the class/property types are rarely needed, they are
+        # built on first use unless the agent is created with lazy=False
+        if not lazy:
+            for name in ['graph', 'class_to_label', 'prop_to_label', 'class_type', 'property_type']:
+                getattr(self, name)
+
+    @functools.cached_property
+    def graph(self):
+        return self.world.as_rdflib_graph()
+
+    @functools.cached_property
+    def class_to_label(self):
+        return {ent: ent.label[0] for ent in self.ontology.classes() if len(ent.label) > 0}
+
+    @functools.cached_property
+    def prop_to_label(self):
+        return {prop: prop.label[0] for prop in self.ontology.properties() if len(prop.label) > 0}
+
+    # Types to help differentiate between classes and properties
+    @functools.cached_property
+    def class_type(self):
+        return type(list(self.ontology.classes())[0])
+
+    @functools.cached_property
+    def property_type(self):
+        return type(list(self.ontology.properties())[0])
+
+    def count(self, name, amount=1):
+        """
+        Adds to a counter of the instrumentation, if the agent is instrumented
+        """
+        if self.instrumentation is not None:
+            self.instrumentation.count(name, amount)
 
-        self.class_to_label = {ent: ent.label[0] for ent in self.ontology.classes() if len(ent.label) > 0}
-        self.prop_to_label = {prop: prop.label[0] for prop in self.ontology.properties() if len(prop.label) > 0}
+    def search(self, **conditions):
+        """
+        ontology.search, counted as an ontology search by the instrumentation
+        """
+        self.count('ontology_searches')
+        return self.ontology.search(**conditions)
 
-        # Save types to help differentiate between classes and properties later on
-        self.class_type = type(list(self.ontology.classes())[0])
-        self.property_type = type(list(self.ontology.properties())[0])
+    def apply_delta(self, delta):
+        """
+        Applies a batch of added/removed individuals and assertions (an incremental_reasoning.OntologyDelta) to the
+        reasoned ontology, re-deriving only the inferences affected by it instead of running the reasoner again.
+        Returns the changed facts (incremental_reasoning.DeltaResult).
+        """
+        result = incremental_reasoning.apply_delta(self, delta)
+        self.interned.update(result)
+        self.reverse_index.update(result)
+        self.health_exclusions.update(result)
+        self.travel_matrix.update(result)
+        self.deltas_applied += 1
+        self.ontology_version = '{}+{}'.format(self.ontology_hash, self.deltas_applied)
+        return result
 
     def infer_stores(self, items):
         """
@@ -87,7 +236,7 @@ class EnvironmentalAgent:
         stores = {}
         if len(items) > 0:
             for item in items:
-                possible_stores = list(self.ontology.search(selling=item))
+                possible_stores = self.reverse_index.subjects('selling', item)
                 stores[item] = list(possible_stores) if possible_stores else ['Online store']
         return stores
 
@@ -114,142 +263,64 @@ class EnvironmentalAgent:
             stores = ['Online store only']
             return stores
 
-    def infer_clothes(self, pref_clothing, health_cond):
+    @instrumented
+    @shared(lambda pref_clothing, health_cond, pref_locations: (
+            batch_recommendations.canonical_preferences(pref_clothing), frozenset(health_cond), tuple(pref_locations)))
+    def infer_clothes(self, pref_clothing, health_cond, pref_locations):
         """
         Infer what clothes the agent can recommend to the user, based on their clothing preferences and their health
-        conditions. Health conditions forbid certain materials and therefore certain clothing items containing those
-        materials.
+        conditions, and in what stores (in their preferred locations) they are sold. Health conditions forbid certain
+        materials and therefore certain clothing items containing those materials.
 
-        The function parses strings in the pref_clothing field of the json file where comma's are seen as and operators
-        and ,"or", takes the union of the two queries on either end. Also handles negation and the some clause.
+        The strings in the pref_clothing field of the json file are parsed by preference_language, where comma's are
+        seen as and operators and "or" takes the union of the conditions on either end. Also handles negation, the some
+        clause, maxprice and isFairTrade. Compiled preferences are cached, so relaxation passes and repeated requests
+        are not parsed again.
         """
-        health_prevented_materials = self.infer_forbidden_ingredients(health_cond)
-        health_prevented_clothing = []
-        for material in health_prevented_materials:
-            health_prevented_clothing = list(
-                set(health_prevented_clothing + list(self.ontology.search(containsMaterial=material))))
-
-        all_clothing = []
-        clothing = self.ontology.search(label="Clothing")
-        for c in clothing:
-            for i in c.instances():
-                all_clothing.append(i)
-
-        clothing_list = all_clothing
-
-        maxprice = 0
-        price = False
-        fairness = False
-        union = False
-        or_found = False
-        negation = False
-
-        for pref in pref_clothing:
-            containsMaterial = False
-            some_clause = False
-            for word in pref.split(' '):
-                if word == 'not':
-                    negation = True
-                elif word == 'material':
-                    containsMaterial = True
-                elif word == 'some':
-                    some_clause = True
-                elif word == 'maxprice':
-                    price = True
-                elif word == "isFairTrade":
-                    fairness = True
-                elif word == 'or':
-                    or_found = True
-                    union = True
-                    break
-                else:
-                    if containsMaterial:
-                        if some_clause:
-                            found_materials = list(self.label_to_class[word].instances())
-                            found_clothing = []
-                            for material in found_materials:
-                                found_clothing = list(
-                                    set(found_clothing + list(self.ontology.search(containsMaterial=material))))
-                        else:
-                            found_clothing = list(self.ontology.search(containsMaterial=self.label_to_indiv[word]))
-                    elif some_clause:
-                        found_clothing = list(self.label_to_class[word].instances())
-                        some_clause = False
-                    elif price:
-                        maxprice = int(word)
-                        price = False
-                    elif fairness:
-                        isFairTrade = word.lower()
-                    else:
-                        found_clothing = list(self.ontology.search(self.label_to_class[word]))
-
-            if negation:
-                if union:
-                    included_clothing = list(set(all_clothing) - set(found_clothing))
-                    clothing_list = list(set(clothing_list + included_clothing))
-                    union = False
-                else:
-                    clothing_list = list(set(clothing_list) - set(found_clothing))
-                negation = False
-                continue
-            if union:
-                clothing_list = list(set(clothing_list + found_clothing))
-                if or_found:
-                    or_found = False
-                    continue
-                union = False
-            else:
-                clothing_list = list(set(clothing_list) & set(found_clothing))
-
-        clothing_list_price = []
-        if maxprice > 0:
-            for cloth in clothing_list:
-                if cloth.hasPriceEur:
-                    if cloth.hasPriceEur[0] <= maxprice:
-                        clothing_list_price.append(cloth)
-        else:
-            clothing_list_price = clothing_list
-
-        clothing_list_fair = []
-        if fairness:
-            for cloth in clothing_list_price:
-                if cloth.isFairTrade and str(cloth.isFairTrade[0]).lower() == isFairTrade:
-                    clothing_list_fair.append(cloth)
+        if self.preference_backend == 'sparql':
+            preferred_clothing = self.sparql_plans.candidates(self, 'clothing', pref_clothing, health_cond)
         else:
-            clothing_list_fair = clothing_list_price
+            health_prevented_clothing = self.health_exclusions.excluded_clothing(health_cond)
 
-        preferred_clothing = list(set(clothing_list_fair) - set(health_prevented_clothing))
+            # The preferences are evaluated to a bitset over the interned IDs of the clothing items
+            clothing_list = self.plans.evaluate(self, 'clothing', pref_clothing)
+            preferred_clothing = self.interned.members(clothing_list & ~health_prevented_clothing)
 
         items_with_clothing_stores = self.infer_stores(preferred_clothing)
 
         items_with_stores_by_location = {}
         for item, clothing_store in items_with_clothing_stores.items():
-            items_with_stores_by_location[item] = self.filter_stores_on_location(preferences['pref_location'],
-                                                                                 clothing_store)
+            items_with_stores_by_location[item] = self.filter_stores_on_location(pref_locations, clothing_store)
 
         return preferred_clothing, items_with_stores_by_location
 
-    def create_clothing_recommendations(self, items_with_stores_by_location, current_location, pref_len,
-                                        loosened_prefs=[]):
+    @instrumented
+    def create_clothing_recommendations(self, items_with_stores_by_location, current_location, pref_len, context,
+                                        loosened_prefs=None):
         """
-        Creates a list of clothing recommendations (represented as recommendation states) along with their utility
-        based on the inferred clothing items, stores and travel options
+        Creates the clothing recommendations (a candidate_table.CandidateTable) along with their utility based on the
+        inferred clothing items, stores and travel options
         """
-        recommendations = []
+        preferences = context.preferences
+        if loosened_prefs is None:
+            loosened_prefs = []
+        loose_prefs = loose_preferences.LoosePreferences(self, preferences['loose_prefs'],
+                                                         loose_preferences.TRAVEL_CHECKS)
+        recommendations = candidate_table.CandidateTable(self, candidate_table.CLOTHING, RecommendationState,
+                                                         loose_prefs.names)
+        recommendations.shared_violations = loosened_prefs
         # print("INPUT DICTIONARY: ", items_with_stores_by_location)
         for item, clothing_store in items_with_stores_by_location.items():
-            n_domains = 1
             CO2_scores_per_domain = [item.hasCO2score[0]]
             # print(100, item, CO2_scores_per_domain)
             if item.hasOrigin[0]:
                 origin = item.hasOrigin[0]
-                n_domains += 1
                 CO2_scores_per_domain.append(origin.hasCO2score[0])
             # print(200, item, CO2_scores_per_domain)
             if clothing_store[0] != 'Online store only':
                 # print("REAL STORE")
-                travel_options = agent.determine_travel_options(current_location, clothing_store,
-                                                                preferences['user'])
+                travel_options = self.determine_travel_options(current_location, clothing_store,
+                                                               preferences['user'], context)
                 for clothing_store, travel_options in travel_options.items():
                     for travel_option in travel_options:
                         del CO2_scores_per_domain[
@@ -261,48 +332,30 @@ class EnvironmentalAgent:
                             CO2_scores_per_domain.append(1)
                         elif travel_option[0] == 'Public Transport':
                             CO2_scores_per_domain.append(2)
-                        elif self.charging_spot and travel_option[0].is_a[0] == self.ontology.ElectricCar:
-                            charging_spot = self.charging_spot
+                        elif context.charging_spot and travel_option[0].is_a[0] == self.ontology.ElectricCar:
+                            charging_spot = context.charging_spot
                         else:
                             CO2_scores_per_domain.append(travel_option[0].hasCO2score[0])
-                        n_domains = len(CO2_scores_per_domain)
-                        for pref in preferences['loose_prefs']:
-                            if 'duration' in pref:
-                                max_duration = int(pref.split('duration<')[1])
-                                if travel_option[1] > max_duration - 1:
-                                    loosened_prefs.append('Duration')
-                                    pref_len += 1
-                            if 'transport' in pref:
-                                list_pref_transport = list(
-                                    self.label_to_class[str(pref.split('transport=')[1])].instances())
-                                if not travel_option[0] in list_pref_transport:
-                                    loosened_prefs.append('Transport')
-                                    pref_len += 1
-
-                        recommendation = RecommendationState('Clothing', travel_option[0], [], [], clothing_store,
-                                                             item, loosened_prefs, travel_option[1]
-                                                             , charging_spot)
+                        violations = loose_prefs.violations(travel_option)
+                        pref_len += len(violations)
+                        loosened_prefs.extend(violations)
 
                         adhered_prefs = pref_len - len(loosened_prefs)
-                        percentage_loose = adhered_prefs / pref_len
-                        utility = recommendation.calculate_utility(percentage_loose,
-                                                                   CO2_scores_per_domain, n_domains)
-                        recommendations.append([recommendation, utility, adhered_prefs])
+                        recommendations.add(item, clothing_store, travel_option[0], travel_option[1],
+                                            CO2_scores_per_domain, adhered_prefs, pref_len, violations, charging_spot)
 
             else:
-                n_domains += 1
                 CO2_scores_per_domain.append(1)
 
-                recommendation = RecommendationState('Clothing', [], [], [], clothing_store, item, loosened_prefs, 0)
-
                 adhered_prefs = pref_len - len(loosened_prefs)
-                percentage_loose = adhered_prefs / pref_len
-                utility = recommendation.calculate_utility(percentage_loose,
-                                                           CO2_scores_per_domain, n_domains)
-                recommendations.append([recommendation, utility, adhered_prefs])
+                recommendations.add(item, clothing_store, [], 0, CO2_scores_per_domain, adhered_prefs, pref_len)
 
+        recommendations.score()
+        self.count('candidates', len(recommendations))
         return recommendations
 
+    @instrumented
+    @shared(lambda symptoms, user: (tuple(sorted(symptoms)), user))
     def infer_health_cond(self, symptoms, user):
         """
         Determines what health condition a user has based on their existing health conditions (from ontology) and infers
@@ -315,7 +368,7 @@ class EnvironmentalAgent:
         if len(symptoms) > 0:
             for symptom in symptoms:
                 symptom_instances.append(self.label_to_indiv[symptom])
-            results = list(self.ontology.search(hasSymptom=symptom_instances))
+            results = self.reverse_index.subjects_of_all('hasSymptom', symptom_instances)
             return list(set(health_conditions + results))
         else:
             return health_conditions
@@ -324,12 +377,20 @@ class EnvironmentalAgent:
         """
         Infer what ingredients are forbidden by the user's health conditions. Returns a list of forbidden ingredients
         """
-        list_forbidden_ingredients = []
-        if len(health_conditions) > 0:
-            for health_cond in health_conditions:
-                forbidden_ingredients = list(self.ontology.search(isForbiddenBy=health_cond))
-                list_forbidden_ingredients = list(set(list_forbidden_ingredients + forbidden_ingredients))
-        return list_forbidden_ingredients
+        return self.health_exclusions.forbidden(health_conditions)
+
+    @instrumented
+    def relax_preferences(self, domain_name, preferences, health_cond):
+        """
+        The smallest relaxation of the food or clothing preferences (domain 'food' or 'clothing') that leaves at least
+        one recipe or clothing item the health conditions allow, see preference_relaxation.relax. The relaxation
+        includes the cost of every step.
+        """
+        if domain_name == 'food':
+            excluded = self.health_exclusions.excluded_recipes(health_cond)
+        else:
+            excluded = self.health_exclusions.excluded_clothing(health_cond)
+        return preference_relaxation.relax(self, domain_name, preferences, excluded)
 
     def infer_restaurants(self, recipes):
         """
@@ -339,12 +400,13 @@ class EnvironmentalAgent:
         restaurants = {}
         if len(recipes) > 0:
             for recipe in recipes:
-                possible_restaurants = list(self.ontology.search(serves=recipe))
+                possible_restaurants = self.reverse_index.subjects('serves', recipe)
                 restaurants[recipe] = list(possible_restaurants)
         else:
             restaurants = ''
         return restaurants
 
+    @shared(lambda current_location, user: (current_location, None if current_location else user))
     def get_user_location(self, current_location, user):
         """
         Checks if the user has specified a current location in their input json file, otherwise the agent infers
@@ -355,12 +417,12 @@ class EnvironmentalAgent:
         else:
             return self.label_to_indiv[user].livesIn[0]
 
-    def check_user_transport_options(self, owned_transport, current_neighborhood):
+    def check_user_transport_options(self, owned_transport, current_neighborhood, context):
         """
         Determines what vehicles the user can use, depending on the user's proximity to their vehicle.
         Vehicles must be in either the current neighborhood of the user or in a neighborhood adjacent to the user's
         current location. Also checks if the user's electric car is charged or not and otherwise determines where
-        to charge the car and how much longer it will take.
+        to charge the car (kept in the context of the request) and how much longer it will take.
         """
         available_transport = []
         for vehicle in owned_transport:
@@ -370,190 +432,81 @@ class EnvironmentalAgent:
                     location_of_vehicle == current_neighborhood:
                 if vehicle.is_a[0] == self.ontology.ElectricCar:  # Check if electric battery is charged
                     if not vehicle.isBatteryCharged[0]:
-                        self.charging_spot = random.choice(list(location_of_vehicle.hasChargingSpot))
+                        context.charging_spot = random.choice(list(location_of_vehicle.hasChargingSpot))
                         extra_travel_time = int(vehicle.timeToChargeElectricCar[0])
                 available_transport.append([vehicle, extra_travel_time])
         return available_transport
 
-    def determine_travel_options(self, current_location, destinations, user):
+    @instrumented
+    def determine_travel_options(self, current_location, destinations, user, context):
         """
         Determines a user's travel options to their destinations (the restaurants or clothing stores),
         depending on their location, destination and owned vehicles. Also estimates how long each transportation option
         will take. Returns a dictionary of destinations and their available transportation options.
+        The routes between neighborhoods come from the precomputed travel matrix, only the vehicles the user can reach
+        are determined per request.
         """
-        city = current_location.isLocatedIn[0]
         owned_transport = list(self.label_to_indiv[user].owns)
+        available_transport = self.check_user_transport_options(owned_transport, current_location, context)
         destination_dict = {}
 
         for destination in destinations:
-            destination_dict[destination] = self.check_user_transport_options(owned_transport, current_location)
-
             # In the normal situation the destination object contains location already
-            try:
+            if isinstance(destination, str):
+                # Exceptional case where we want travel options to a direct neighborhood (given by its label)
+                destination_neighborhood = self.label_to_indiv.get(destination)
+            else:
                 destination_neighborhood = destination.isLocatedIn[0]
-                destination_city = destination.isLocatedIn[1]
-            # Exceptional case where we want travel options to a direct neighborhood
-            except AttributeError:
-                destination_neighborhood = destination
-                d_ins = self.ontology.search(label=destination_neighborhood)
-                for n in self.ontology.Neighborhood.instances():
-                    if n == d_ins[0]:
-                        destination_neighborhood = d_ins[0]
-                        destination_city = n
-
-            if city == destination_city:  # Check if current location is in the same city as the destination
-                if current_location in list(destination_neighborhood.adjacentTo) or \
-                        current_location == destination_neighborhood:  # check if neighborhoods adjacent
-                    if current_location in list(destination_neighborhood.adjacentTo):
-                        for i in destination_dict[destination]:
-                            if i[0].is_a[0] == self.ontology.Bike:
-                                i[1] += 10
-                            if i[0].is_a[0].is_a[0] == self.ontology.Car:
-                                i[1] += 5
-                        destination_dict[destination].append(['Walking', 30])
-                    else:
-                        for i in destination_dict[destination]:
-                            if i[0].is_a[0] == self.ontology.Bike:
-                                i[1] += 5
-                            if i[0].is_a[0].is_a[0] == self.ontology.Car:
-                                i[1] += 2
-                        destination_dict[destination].append(['Walking', 10])
-                else:  # neighborhoods not adjacent
-                    for i in destination_dict[destination]:
-                        if i[0].is_a[0] == self.ontology.Bike:
-                            i[1] += 15
-                        if i[0].is_a[0].is_a[0] == self.ontology.Car:
-                            i[1] += 15
-                    destination_dict[destination].append(['Public Transport', 15])
-
-            else:  # Not in the same city
-                if city == self.ontology.Amsterdam and destination_city == self.ontology.Utrecht:
-                    train = self.ontology.TrainFromAmsterdamToUtrecht
-                else:
-                    train = self.ontology.TrainFromUtrechtToAmsterdam
-                public_transport_time = 27  # Duration of train in minutes
-                extra_co2score = 0  # If user has to take a tram or a bus in the other city, CO2 score becomes worse
-
-                if current_location.hasPopulation[0] > 20000:  # Check if current neighborhood has train station
-                    public_transport_time += 5  # User needs to walk about 5 minutes
-                else:
-                    for i in destination_dict[destination]:  # Check if user has bike
-                        if i[0].is_a[0] == self.ontology.Bike:
-                            public_transport_time += int(i[0].travelTimeToNearestTrainStation[0])
-                if destination_neighborhood.hasPopulation[0] > 20000:  # Check if destination neighborhood
-                    # has train station
-                    public_transport_time += 5
-                else:  # User needs to use public transport (bus/tram) to get to destination
-                    public_transport_time += 15
-                    extra_co2score += 1
-                destination_dict[destination].append([train, public_transport_time, extra_co2score])
-                for i in destination_dict[destination]:
-                    if i[0].is_a[0].is_a[0] == self.ontology.Car:
-                        i[1] += 55
-                for i in destination_dict[destination]:  # Can no longer bike to destination
-                    if i[0].is_a[0] == self.ontology.Bike:
-                        destination_dict[destination].remove(i)
+            if destination_neighborhood is None:
+                destination_dict[destination] = []
+                continue
+            destination_dict[destination] = self.travel_matrix.options(current_location, destination_neighborhood,
+                                                                       available_transport)
         return destination_dict
 
+    @instrumented
+    @shared(lambda pref_food, health_cond: (batch_recommendations.canonical_preferences(pref_food),
+                                            frozenset(health_cond)))
     def infer_recipes(self, pref_food, health_cond):
         """
         Infers what recipes a user would like based on the user's preferences and what food is forbidden by their
-        health conditions. Like infer_clothes, this function parses the pref_food fields in the json, where comma is an
-        and operator, can also parse or, not and some operators and check for either ingredients or recipes.
+        health conditions. Like infer_clothes, the pref_food fields in the json are parsed by preference_language, where
+        comma is an and operator, with or, not and some operators and checks for either ingredients or recipes.
         Returns a dictionary with the inferred recipes as keys and the restaurants that serve those recipes as values.
         """
-        # Find what recipes aren't allowed due to health conditions
-        health_prevented_ingredients = self.infer_forbidden_ingredients(health_cond)
-        health_prevented_recipes = []
-        for ingredient in health_prevented_ingredients:
-            health_prevented_recipes = list(
-                set(health_prevented_recipes + list(self.ontology.search(containsIngredient=ingredient))))
-
-        # Keep track of all recipes and initialize logic operators
-        all_recipes = []
-        recipes = self.ontology.search(label="Recipe")
-        for c in recipes:
-            for i in c.instances():
-                all_recipes.append(i)
-        food_list = all_recipes
-        union = False
-        or_found = False
-        negation = False
-
-        # Search in ontology based on preferred food and ingredients
-        for food in pref_food:
-            containsIngredient = False
-            some_clause = False
-            for word in food.split(' '):
-                if count_upper_case_letters(word) > 1:  # Need to split label with space
-                    old_word = word
-                    word = ''
-                    for i, letter in enumerate(old_word):
-                        if i and letter.isupper() and i != 0:
-                            word += ' '
-                        word += letter
-                if word == 'not':
-                    negation = True
-                elif word == 'ingredient':
-                    containsIngredient = True
-                elif word == 'some':
-                    some_clause = True
-                elif word == 'or':
-                    or_found = True
-                    union = True
-                    break
-                else:
-                    if containsIngredient:
-                        if some_clause:
-                            found_ingredients = list(self.label_to_class[word].instances())
-                            found_recipes = []
-                            for ingredient in found_ingredients:
-                                found_recipes = list(
-                                    set(found_recipes + list(self.ontology.search(containsIngredient=ingredient))))
-                        else:
-                            found_recipes = list(self.ontology.search(containsIngredient=self.label_to_indiv[word]))
-                    elif some_clause:
-                        found_recipes = list(self.label_to_class[word].instances())
-                        some_clause = False
-                    else:
-                        found_recipes = list(self.ontology.search(self.label_to_class[word]))
-            if negation:
-                if union:
-                    included_food = list(set(all_recipes) - set(found_recipes))
-                    food_list = list(set(food_list + included_food))
-                    union = False
-                else:
-                    food_list = list(set(food_list) - set(found_recipes))
-                negation = False
-                continue
-            if union:
-                food_list = list(set(food_list + found_recipes))
-                if or_found:
-                    or_found = False
-                    continue
-                union = False
-            else:
-                food_list = list(set(food_list) & set(found_recipes))
+        if self.preference_backend == 'sparql':
+            preferred_recipes = self.sparql_plans.candidates(self, 'food', pref_food, health_cond)
+        else:
+            # Find what recipes aren't allowed due to health conditions
+            health_prevented_recipes = self.health_exclusions.excluded_recipes(health_cond)
 
-        preferred_recipes = list(set(food_list) - set(health_prevented_recipes))
+            # Recipes matching the preferences, as a bitset over the interned IDs of the recipes
+            food_list = self.plans.evaluate(self, 'food', pref_food)
+            preferred_recipes = self.interned.members(food_list & ~health_prevented_recipes)
 
         recipe_with_restaurants = self.infer_restaurants(preferred_recipes)
         return recipe_with_restaurants
 
-    def find_states(self, preferences):
+    @instrumented
+    def find_states(self, preferences, context=None):
         """
         Main function for finding recommendations based on user's preferences. This function first distinguishes
         the three main problems our agent can help a user with: restaurant, activity and clothing recommendations.
+        Returns the options of the last domain, a ranking.Ranking for restaurant, clothing and travel recommendations.
+        Everything that belongs to the request is kept in its context (a RequestContext, a new one by default), so
+        several requests can be served by the agent at the same time.
         """
+        if context is None:
+            context = RequestContext(preferences)
         if "Activity" in preferences["activity"]:
-            self.rushhour = 16 < preferences["time_of_activity"] < 22
+            context.rushhour = 16 < preferences["time_of_activity"] < 22
 
-            if self.rushhour:
-                energy = self.ontology.search(label="Unsustainable Energy")
+            if context.rushhour:
+                energy = self.search(label="Unsustainable Energy")
                 selected_energy = energy[0].instances()
 
             else:
-                energy = self.ontology.search(label="Energy")
+                energy = self.search(label="Energy")
                 selected_energy = []
                 for i in energy[0].instances():
                     for prop in i.get_properties():
@@ -563,82 +516,121 @@ class EnvironmentalAgent:
                                     if str(value).endswith(weather):
                                         selected_energy = i
 
-            possible_activities = self.ontology.search(label="Activity")
+            possible_activities = self.search(label="Activity")
             selected_activities = possible_activities[0].instances()
             selected_activities_pref = self.infer_activity(preferences, selected_activities)
             options = [[x, y] for x in selected_activities_pref for y in selected_energy]
-            sorted_options = self.recommend_activity(options)
-            self.explain_actions(preferences, sorted_options, options)
+            sorted_options = self.recommend_activity(options, preferences)
+            self.explain_actions(preferences, sorted_options, options, context)
 
         if "Restaurant" in preferences["activity"]:
-            current_location = agent.get_user_location(preferences['current_location'], preferences['user'])
-            health_conditions = agent.infer_health_cond(preferences['symptoms'], preferences['user'])
+            current_location = self.get_user_location(preferences['current_location'], preferences['user'],
+                                                      context=context)
+            health_conditions = self.infer_health_cond(preferences['symptoms'], preferences['user'],
+                                                       context=context)
             restaurants = \
-                agent.infer_recipes(preferences['pref_food'], health_conditions)
+                self.infer_recipes(preferences['pref_food'], health_conditions, context=context)
 
-            if agent.ontology.COVID in health_conditions:  # Agent believes user has COVID
+            if self.ontology.COVID in health_conditions:  # Agent believes user has COVID
                 print('From either your specified health conditions or inferred through your symptoms, '
                       'it has been concluded that you might have COVID-19.\n'
                       'Therefore the agent recommends not travelling and staying inside.')
                 return
             if len(restaurants) == 0:
-                print('Unfortunately, no restaurants were found for those preferences.')
-                print('Please input other preferences to the agent')
-                return
-            else:
-                options = agent.create_restaurant_recommendations(restaurants, current_location, preferences)
-                options.sort(key=operator.itemgetter(1), reverse=True)
-                options.sort(key=operator.itemgetter(2), reverse=True)
-                agent.offer_restaurant_recommendations(options, preferences)
+                relaxation = context.relaxation = self.relax_preferences('food', preferences['pref_food'],
+                                                                         health_conditions)
+                if relaxation is None or not relaxation.dropped:
+                    print('Unfortunately, no restaurants were found for those preferences.')
+                    print('Please input other preferences to the agent')
+                    return
+                print('Unfortunately, no recipes with all matching preferences were found. We will now try to broaden '
+                      'the request.')
+                for preference in relaxation.dropped:
+                    print('Removing preference: {}'.format(preference))
+                restaurants = self.infer_recipes(relaxation.kept, health_conditions, context=context)
+            if len(restaurants) > 0:
+                options = ranking.Ranking(
+                    self.create_restaurant_recommendations(restaurants, current_location, context,
+                                                           k=RESTAURANTS_SHOWN),
+                    ranking.RESTAURANT_ORDER)
+                self.offer_restaurant_recommendations(options, preferences)
 
         if "Clothing" in preferences["activity"]:
             total_pref_len = len(preferences['pref_clothing'])
             loosened_prefs = []
-            current_location = agent.get_user_location(preferences['current_location'], preferences['user'])
-            health_conditions = agent.infer_health_cond(preferences['symptoms'], preferences['user'])
+            current_location = self.get_user_location(preferences['current_location'], preferences['user'],
+                                                      context=context)
+            health_conditions = self.infer_health_cond(preferences['symptoms'], preferences['user'],
+                                                       context=context)
             preferred_clothing, items_with_stores_by_location = \
-                (agent.infer_clothes(preferences['pref_clothing'], health_conditions))
+                (self.infer_clothes(preferences['pref_clothing'], health_conditions, preferences['pref_location'],
+                                    context=context))
 
             if len(preferred_clothing) == 0:
-
-                while len(preferred_clothing) == 0:
-                    print(
-                        'Unfortunately, no clothes with all matching preferences were found. We will now try to broaden the request.')
-                    if len(preferences['pref_clothing']) > 0:
-                        print('Removing preference: {}'.format(preferences['pref_clothing'][-1]))
-                    # print(preferences['pref_clothing'])
-                    loosened_prefs.append(preferences['pref_clothing'].pop(-1))
-                    # print(preferences['pref_clothing'])
-                    preferred_clothing, items_with_stores_by_location = \
-                        (agent.infer_clothes(preferences['pref_clothing'], health_conditions))
-                options = agent.create_clothing_recommendations(items_with_stores_by_location, current_location,
-                                                                total_pref_len, loosened_prefs)
-                options.sort(key=operator.itemgetter(2, 1), reverse=True)
-                agent.offer_clothing_recommendations(options, preferences)
+                print(
+                    'Unfortunately, no clothes with all matching preferences were found. We will now try to broaden the request.')
+                # Drops the fewest preferences that leave at least one clothing item
+                relaxation = context.relaxation = self.relax_preferences('clothing', preferences['pref_clothing'],
+                                                                         health_conditions)
+                if relaxation is None:
+                    print('Unfortunately, no clothes were found, even without your preferences.')
+                    return
+                for preference in relaxation.dropped:
+                    print('Removing preference: {}'.format(preference))
+                loosened_prefs.extend(relaxation.dropped)
+                preferred_clothing, items_with_stores_by_location = \
+                    (self.infer_clothes(relaxation.kept, health_conditions, preferences['pref_location'],
+                                        context=context))
+                options = ranking.Ranking(
+                    self.create_clothing_recommendations(items_with_stores_by_location, current_location,
+                                                         total_pref_len, context, loosened_prefs),
+                    ranking.CLOTHING_ORDER)
+                self.offer_clothing_recommendations(options, preferences)
 
             else:
-                options = agent.create_clothing_recommendations(items_with_stores_by_location, current_location,
-                                                                total_pref_len)
-                options.sort(key=operator.itemgetter(2, 1), reverse=True)
-                agent.offer_clothing_recommendations(options, preferences)
+                options = ranking.Ranking(
+                    self.create_clothing_recommendations(items_with_stores_by_location, current_location,
+                                                         total_pref_len, context),
+                    ranking.CLOTHING_ORDER)
+                self.offer_clothing_recommendations(options, preferences)
         if "Transportation" in preferences["activity"]:
             # Get current location, health conditions and available travel options
-            current_location = agent.get_user_location(preferences['current_location'], preferences['user'])
-            health_conditions = agent.infer_health_cond(preferences['symptoms'], preferences['user'])
-            travel_options = agent.determine_travel_options(current_location, preferences['pref_location'],
-                                                            preferences['user'])
+            current_location = self.get_user_location(preferences['current_location'], preferences['user'],
+                                                      context=context)
+            health_conditions = self.infer_health_cond(preferences['symptoms'], preferences['user'],
+                                                       context=context)
+            travel_options = self.determine_travel_options(current_location, preferences['pref_location'],
+                                                           preferences['user'], context)
             # Create travel recommendations
-            options = agent.create_travel_recommendations(travel_options, preferences['loose_prefs'])
+            options = ranking.Ranking(self.create_travel_recommendations(travel_options, preferences['loose_prefs']),
+                                      ranking.TRAVEL_ORDER)
             # Check for Covid
             restricted = False
-            if agent.ontology.COVID19 in health_conditions:
+            if self.ontology.COVID19 in health_conditions:
                 restricted = True
             # Offer travel recommendations
-            options.sort(key=operator.itemgetter(3, 1), reverse=True)
-            agent.offer_travel_recommendations(options, restricted, preferences)
+            self.offer_travel_recommendations(options, restricted, preferences)
 
         return options
 
+    def find_states_many(self, requests, share=True):
+        """
+        Finds the recommendations for many users at once, requests being (name, preferences) pairs (see
+        batch_recommendations.load_requests). The requests are run grouped by what they have in common, and the user
+        location, health conditions, recipes and clothing items are only inferred once for all requests with the same
+        location, symptoms and (equivalent) food or clothing preferences. With a result_cache, requests seen before
+        are answered from the cache. Returns a batch_recommendations.Batch with the result of every request, in the
+        order of the requests, and the throughput of the batch.
+        """
+        batch = batch_recommendations.Batch(requests, share, RESTAURANTS_SHOWN)
+
+        def find_states(preferences):
+            return self.find_states(preferences, RequestContext(preferences, batch.shared_work))
+
+        for index in batch.ordered():
+            batch.run(index, find_states, self.result_cache, self.ontology_version)
+        return batch
+
     def filter_activities(self, activities, user):
         """
         Filters activities based on if they are household activities.
@@ -654,6 +646,7 @@ class EnvironmentalAgent:
 
         return list(set(activities) - set(filter_activities))
 
+    @instrumented
     def infer_activity(self, preferences, selected_activities):
         """
         Infers what activities the user can do an wants to do.
@@ -670,7 +663,8 @@ class EnvironmentalAgent:
         return [[activity, 0] if activity.name not in activities_pref else [activity, 1] for activity in
                 selected_activities]
 
-    def recommend_activity(self, options):
+    @instrumented
+    def recommend_activity(self, options, preferences):
         """
         Filters activities based on if they are household activities
         """
@@ -690,7 +684,7 @@ class EnvironmentalAgent:
 
         return sorted_options
 
-    def explain_actions(self, preferences, sorted_options, options):
+    def explain_actions(self, preferences, sorted_options, options, context):
         print("\nDear {},".format(preferences["user"]))
         x = list(list(sorted_options.keys())[0])[0]
         print(
@@ -699,8 +693,8 @@ class EnvironmentalAgent:
         # list(sorted_options.values())[0]))
 
         if preferences["time_of_activity"] >= 20 and "Activity" in preferences["activity"]:
-            self.rushhour = True
-            sorted_options = self.recommend_activity(options)
+            context.rushhour = True
+            sorted_options = self.recommend_activity(options, preferences)
             print(
                 "An alternative option is to wait {} hour. In that case, you use sustainable energy if it is still {}.\n"
                 "In that case you could also {} or {} in which you only use sustainable energy.".format(
@@ -719,73 +713,79 @@ class EnvironmentalAgent:
                 transport = option.transportation.is_a[0].label[0]
         return transport
 
+    @instrumented
     def offer_clothing_recommendations(self, options, preferences):
         """
-        Print function for offering the best clothing recommendation.
+        Print function for offering the best clothing recommendation, options being a ranking.Ranking
         """
         print('\nDear {},'.format(preferences["user"]))
+        best = options.top(2)
 
-        if len(options[0][0].pref_not_adhered_to) == 0:
+        if len(best[0][0].pref_not_adhered_to) == 0:
             print(
                 'For your entered preferences, we found {}'.format(len(options)), 'recommendation(s).')
 
-            if not isinstance(options[0][0].clothing_store, list):
-                transport1, transport2 = self.create_transport_string(options[0][0])
+            if not isinstance(best[0][0].clothing_store, list):
+                transport1 = self.create_transport_string(best[0][0])
                 print(
                     'Of these recommendations, the most environmentally friendly choice which completely pertains to all your '
-                    'preferences is the following garment: {0}, which has an environmental score of {}'.format(options[0][0].clothing_item.hasCO2score[0]),
-                'and which can be obtained in {1}.'.format(
-                        options[0][0].clothing_item.label[0], options[0][0].clothing_store.label[0]))
-                print('{}'.format(options[0][0].clothing_store.label[0]), 'is located in the neighborhood of {}'.format(
-                    options[0][0].clothing_store.isLocatedIn[0].label[0]),
-                      'in {}.'.format(options[0][0].clothing_store.isLocatedIn[1].label[0]))
+                    'preferences is the following garment: {0}, which has an environmental score of {1} and which can be '
+                    'obtained in {2}.'.format(best[0][0].clothing_item.label[0], best[0][0].clothing_item.hasCO2score[0],
+                                              best[0][0].clothing_store.label[0]))
+                print('{}'.format(best[0][0].clothing_store.label[0]), 'is located in the neighborhood of {}'.format(
+                    best[0][0].clothing_store.isLocatedIn[0].label[0]),
+                      'in {}.'.format(best[0][0].clothing_store.isLocatedIn[1].label[0]))
                 print('It is recommended to travel to this clothing store '
-                      'by {}'.format(transport1), 'which is estimated to take {}'.format(options[0][2]),
+                      'by {}'.format(transport1), 'which is estimated to take {}'.format(best[0][2]),
                       'minutes of travel time.\n')
-                if options[0][0].charging_spot:
+                if best[0][0].charging_spot:
                     print('It seems your electric car needs charging, which will take around {}'.format(
-                        options[0][0].transportation.timeToChargeElectricCar[0]),
+                        best[0][0].transportation.timeToChargeElectricCar[0]),
                           ' minutes. The nearest car charging spot can be found on {}'.format(
-                              options[0][0].charging_spot.label[0].split('Charging')[1]))
+                              best[0][0].charging_spot.label[0].split('Charging')[1]))
             else:
                 print(
                     'Of these recommendations, the most environmentally friendly choice which completely pertains to all your '
                     'preferences is the following garment: {}, which can be purchased in an online store.'.format(
-                        options[0][0].clothing_item.label[0]))
+                        best[0][0].clothing_item.label[0]))
 
             if len(options) > 1:
-                if options[1][1] > options[0][1]:
+                if best[1][1] > best[0][1]:
                     print(
                         'However, a more environmentally friendly option was found when we ignored your preference of '
-                        '{}.'.format(options[1][0].pref_not_adhered_to), ' If you are able to loosen this preference, '
+                        '{}.'.format(best[1][0].pref_not_adhered_to), ' If you are able to loosen this preference, '
                                                                          'we would recommend the following:\n')
                     print(
                         'The recommendation with the best environmental score is to get the following item:'
-                        ' {}.'.format(options[1][0].clothing_item.label[0]))
+                        ' {}.'.format(best[1][0].clothing_item.label[0]))
 
         else:
 
-            options.sort(key=operator.itemgetter(1), reverse=True)
+            best = options.top(1, ranking.CLOTHING_UTILITY_ORDER)
             print(
                 'No options could be found that adhere to all of your preferences. However, we found {0} recommendation(s) '
-                'when we ignored the following condition: {1}'.format(len(options), options[0][0].pref_not_adhered_to))
+                'when we ignored the following condition: {1}'.format(len(options), best[0][0].pref_not_adhered_to))
+            if not isinstance(best[0][0].clothing_store, list):
+                obtained = 'and which can be obtained in {}.'.format(best[0][0].clothing_store.label[0])
+            else:
+                obtained = 'and which can be purchased in an online store.'
             print('The most environmentally friendly option our agent discovered is the following Fair Trade garment: {}'.format(
-                options[0][0].clothing_item.label[0]), 'which has an environmental score of {}'.format(options[0][0].clothing_item.hasCO2score[0]),
-                'and which can be obtained in {}.'.format(options[0][0].clothing_store.label[0]))
-
-            if not isinstance(options[0][0].clothing_store, list):
-                transport = self.create_transport_string(options[0][0])
-                print('{}'.format(options[0][0].clothing_store.label[0]), 'is located in the neighborhood of {}'.format(
-                    options[0][0].clothing_store.isLocatedIn[0].label[0]),
-                      'in {}.'.format(options[0][0].clothing_store.isLocatedIn[1].label[0]))
+                best[0][0].clothing_item.label[0]), 'which has an environmental score of {}'.format(best[0][0].clothing_item.hasCO2score[0]),
+                obtained)
+
+            if not isinstance(best[0][0].clothing_store, list):
+                transport = self.create_transport_string(best[0][0])
+                print('{}'.format(best[0][0].clothing_store.label[0]), 'is located in the neighborhood of {}'.format(
+                    best[0][0].clothing_store.isLocatedIn[0].label[0]),
+                      'in {}.'.format(best[0][0].clothing_store.isLocatedIn[1].label[0]))
                 print('It is recommended to travel to this clothing store '
-                      'by {}'.format(transport), 'which is estimated to take {}'.format(options[0][0].duration),
-                      'minutes of travel time and has an environmental score of {}.'.format(options[0][0].transportation.hasCO2score[0]),'\n')
-                if options[0][0].charging_spot:
+                      'by {}'.format(transport), 'which is estimated to take {}'.format(best[0][0].duration),
+                      'minutes of travel time and has an environmental score of {}.'.format(best[0][0].transportation.hasCO2score[0]),'\n')
+                if best[0][0].charging_spot:
                     print('It seems your electric car needs charging, which will take around {}'.format(
-                        options[0][0].transportation.timeToChargeElectricCar[0]),
+                        best[0][0].transportation.timeToChargeElectricCar[0]),
                           'minutes. The nearest car charging spot can be found on {}'.format(
-                              options[0][0].charging_spot.label[0].split('Charging')[0]))
+                              best[0][0].charging_spot.label[0].split('Charging')[0]))
             else:
                 print('For these recommendation, the only possible option is to purchase the item online.')
 
@@ -828,9 +828,10 @@ class EnvironmentalAgent:
         else:
             print('')
 
+    @instrumented
     def offer_restaurant_recommendations(self, options, preferences):
         """
-        Loops through options and offers the options with the top 5 utility
+        Offers the top restaurant options (RESTAURANTS_SHOWN) of a ranking.Ranking
         """
         print('\nDear {},'.format(preferences["user"]))
         print(
@@ -839,57 +840,57 @@ class EnvironmentalAgent:
         print('The agent has ranked the recommendation based on their environmental impact and will explain its'
               'recommendation using environmental scores for certain choices where 1 is the best and 5 the worst. \n')
         if len(options) > 0:
-            for index, option in enumerate(options[:]):
-                if index == 3:
-                    break
+            for index, option in enumerate(options.top(RESTAURANTS_SHOWN)):
                 transport = self.create_transport_string(option[0])
                 self.explain_restaurant_option(option[0], index, transport)
 
+    @instrumented
     def offer_travel_recommendations(self, options, restricted, preferences):
         """
-        Prints the top travel option based on utility
+        Prints the top travel option of a ranking.Ranking based on utility
         """
         print('\nDear {},'.format(preferences["user"]))
         print(
             'For your entered preferences, {}'.format(len(options)), 'recommendations were found.')
-        if len(options[0][0].pref_not_adhered_to) == 0:
+        best = options.top(2)
+        if len(best[0][0].pref_not_adhered_to) == 0:
 
             print(
                 'Of these recommendations, the most environmentally friendly option which completely pertains to all your '
                 'preferences is to travel by {}, which is estimated to take {} minutes of travel time.\n'.format(
-                    options[0][0].transportation.is_a[0].label[0], options[0][2]))
+                    self.create_transport_string(best[0][0]), best[0][2]))
 
-            if options[0][0].charging_spot:
+            if best[0][0].charging_spot:
                 print('It seems your electric car needs charging, which will take around {}'.format(
-                    options[0][0].transportation.timeToChargeElectricCar[0]),
+                    best[0][0].transportation.timeToChargeElectricCar[0]),
                     ' minutes. The nearest car charging spot can be found on {}'.format(
-                        options[0][0].charging_spot.label[0].split('Charging')[0]))
+                        best[0][0].charging_spot.label[0].split('Charging')[0]))
 
-            if options[1][1] > options[0][1]:
+            if len(best) > 1 and best[1][1] > best[0][1]:
                 print('However, a more environmentally friendly option was found when we ignore your preference of '
-                      '{}.'.format(options[1][0].pref_not_adhered_to), ' If you are able to loosen this preference, '
+                      '{}.'.format(best[1][0].pref_not_adhered_to), ' If you are able to loosen this preference, '
                                                                        'we would recommend the following:\n')
                 print(
                     'The most environmentally friendly option is to travel by {}, which is estimated to take {} minutes of travel time.\n'.format(
-                        options[1][0].transportation.is_a[0].label[0], options[1][2]))
+                        self.create_transport_string(best[1][0]), best[1][2]))
 
-            if restricted:
+            if restricted and len(best) > 1:
                 print(
                     'However, due to symptoms applicable to a COVID-19 infection the use of public transportation cannot be recommended.'
                     ' We recommend the following:')
                 print(
                     'The best option is to travel by {}, which is estimated to take {} minutes of travel time.'.format(
-                        options[1][0].transportation.is_a[0].label[0], options[1][2]))
+                        self.create_transport_string(best[1][0]), best[1][2]))
 
 
         else:
-            options.sort(key=operator.itemgetter(1), reverse=True)
+            best = options.top(1, ranking.TRAVEL_UTILITY_ORDER)
             print('No options could be found that adheres to all your preferences. The most environmentally friendly '
                   'option the agent could find, is when your preference of {}'.format(
-                options[0][0].pref_not_adhered_to),
+                best[0][0].pref_not_adhered_to),
                 ' is ignored.\n.')
             print('This recommends to travel by {}, which is estimated to take {} minutes of travel time.\n'.format(
-                options[0][0].transportation.is_a[0].label[0], options[0][2]))
+                self.create_transport_string(best[0][0]), best[0][2]))
 
     def check_restaurant_location_cuisine(self, restaurant_city, restaurant_cuisine, preferences):
         """
@@ -913,74 +914,105 @@ class EnvironmentalAgent:
                     unsatisfied_prefs.append('Location')
         return unsatisfied_prefs, cuisine_importance
 
-    def create_restaurant_recommendations(self, recipe_restaurants, current_location, preferences):
+    @instrumented
+    def create_restaurant_recommendations(self, recipe_restaurants, current_location, context, k=None):
         """
         Creates restaurant recommendations based on the inferred recipes the user would enjoy, what restaurants
         serve those recipes, the user's preferences and the user's current location. The loose preferences are counted
         and the amount of satisfied user preferences is calculated before entering this information in the utility
         function along with the CO2 scores (1-5) per domain (here: recipe and travel option).
+        With k, only the candidates that can still be among the best k are created: every recipe and restaurant is a
+        branch of the search (see candidate_search) with an upper bound from the recipe's CO2 score and the best travel
+        option to the restaurant. The counters of the search are kept in the search_stats of the returned table.
+        The bounds need the travel options, so these are still determined for every restaurant before the search
+        starts (once per restaurant, not per recipe): the search saves creating and scoring candidates, not the
+        travel work.
         """
-        recommendations = []
-        for recipe, restaurants in recipe_restaurants.items():
-            travel_options = agent.determine_travel_options(current_location, restaurants,
-                                                            preferences['user'])
-            for restaurant, travel_options in travel_options.items():
-                restaurant_cuisine = restaurant.hasCuisine[0]
-                restaurant_city = restaurant.isLocatedIn[0].isLocatedIn[0]
-                for travel_option in travel_options:
+        preferences = context.preferences
+        loose_prefs = loose_preferences.LoosePreferences(self, preferences['loose_prefs'],
+                                                         loose_preferences.RESTAURANT_CHECKS)
+        recommendations = candidate_table.CandidateTable(self, candidate_table.RESTAURANT, RecommendationState,
+                                                         ['Cuisine', 'Location'] + loose_prefs.names)
+        n_prefs = len(preferences["loose_prefs"])
+
+        def travel_co2score(travel_option):
+            if len(travel_option) == 3:
+                return travel_option[0].hasCO2score[0] + travel_option[2]
+            elif travel_option[0] == 'Walking':
+                return 1
+            elif travel_option[0] == 'Public Transport':
+                return 2
+            return travel_option[0].hasCO2score[0]
+
+        def expand(recipe, restaurant, travel_options, unsatisfied_prefs, cuisine_importance, charging_spot):
+            for travel_option in travel_options:
+                violations = unsatisfied_prefs + loose_prefs.violations(travel_option)
+                adhered_prefs = n_prefs - cuisine_importance
+                CO2_scores_per_domain = [recipe.hasCO2score[0], travel_co2score(travel_option)]
+                option_charging_spot = ''
+                if len(travel_option) != 3 and not isinstance(travel_option[0], str) and charging_spot and \
+                        travel_option[0].is_a[0] == self.ontology.ElectricCar:
+                    option_charging_spot = charging_spot
+                adhered_prefs = adhered_prefs - len(violations)
+                utility = utility_scoring.utility(adhered_prefs, n_prefs, CO2_scores_per_domain)
+                yield (adhered_prefs, utility), (recipe, restaurant, travel_option[0], travel_option[1],
+                                                 CO2_scores_per_domain, adhered_prefs, n_prefs, violations,
+                                                 option_charging_spot)
+
+        def branches():
+            # The travel options only depend on the restaurant, they are determined once for all recipes it serves
+            restaurants = list(dict.fromkeys(restaurant for restaurants in recipe_restaurants.values()
+                                             for restaurant in restaurants))
+            restaurant_travel = self.determine_travel_options(current_location, restaurants, preferences['user'],
+                                                              context)
+            position = 0
+            for recipe, restaurants in recipe_restaurants.items():
+                for restaurant in dict.fromkeys(restaurants):
+                    travel_options = restaurant_travel[restaurant]
+                    if not travel_options:
+                        continue
+                    restaurant_cuisine = restaurant.hasCuisine[0]
+                    restaurant_city = restaurant.isLocatedIn[0].isLocatedIn[0]
                     unsatisfied_prefs, cuisine_importance = \
                         self.check_restaurant_location_cuisine(restaurant_city, restaurant_cuisine, preferences)
-                    adhered_prefs = len(preferences["loose_prefs"]) - cuisine_importance
-                    CO2_scores_per_domain = [recipe.hasCO2score[0]]
-                    charging_spot = ''
-                    if len(travel_option) == 3:
-                        CO2_score = travel_option[0].hasCO2score[0] + travel_option[2]
-                        CO2_scores_per_domain.append(CO2_score)
-                    elif travel_option[0] == 'Walking':
-                        CO2_scores_per_domain.append(1)
-                    elif travel_option[0] == 'Public Transport':
-                        CO2_scores_per_domain.append(2)
-                    elif self.charging_spot and travel_option[0].is_a[0] == self.ontology.ElectricCar:
-                        charging_spot = self.charging_spot
-                        CO2_scores_per_domain.append(travel_option[0].hasCO2score[0])
-                    else:
-                        CO2_scores_per_domain.append(travel_option[0].hasCO2score[0])
-                    n_domains = len(CO2_scores_per_domain)
-                    for pref in preferences['loose_prefs']:
-                        if 'transport' in pref:
-                            list_pref_transport = list(
-                                self.label_to_class[str(pref.split('transport=')[1])].instances())
-                            if not travel_option[0] in list_pref_transport:
-                                unsatisfied_prefs.append('Transport')
-                        if 'duration' in pref:
-                            max_duration = int(pref.split('duration<')[1])
-                            if travel_option[1] > max_duration - 1:
-                                unsatisfied_prefs.append('Duration')
-
-                    recommendation = RecommendationState('Restaurant', travel_option[0], restaurant, recipe, [],
-                                                         [], unsatisfied_prefs,
-                                                         travel_option[1], charging_spot, env_score=CO2_scores_per_domain)
-                    adhered_prefs = adhered_prefs - len(unsatisfied_prefs)
-                    percentage_loose = adhered_prefs / len(preferences["loose_prefs"])
-                    utility = recommendation.calculate_utility(percentage_loose,
-                                                               CO2_scores_per_domain, n_domains)
-                    recommendations.append([recommendation, utility, adhered_prefs])
+                    # The travel options can only fail more preferences and add CO2
+                    best_adhered_prefs = n_prefs - cuisine_importance - len(unsatisfied_prefs)
+                    best_co2scores = [recipe.hasCO2score[0], min(travel_co2score(travel_option)
+                                                                 for travel_option in travel_options)]
+                    bound = (best_adhered_prefs,
+                             utility_scoring.utility(max(best_adhered_prefs, 0), n_prefs, best_co2scores))
+                    yield candidate_search.Branch(
+                        position, bound, len(travel_options),
+                        functools.partial(expand, recipe, restaurant, travel_options, unsatisfied_prefs,
+                                          cuisine_importance, context.charging_spot))
+                    position += len(travel_options)
+
+        recommendations.search_stats = candidate_search.SearchStats()
+        found = sorted(candidate_search.search(branches(), k, recommendations.search_stats), key=lambda row: row[0])
+        for position, key, candidate in found:
+            recommendations.add(*candidate)
+        recommendations.pruned = recommendations.search_stats.candidates - len(found)
+        recommendations.score()
+        self.count('candidates', len(recommendations))
+        self.count('candidates_pruned', recommendations.pruned)
         return recommendations
 
+    @instrumented
     def create_travel_recommendations(self, travel_options, loose_prefs):
         """
         Creates travel recommendation similarly to how restaurant recommendations are created, and calculates the
         utility for these travel options using the percentage of satisfied preferences and the CO2 scores of the travel
         options.
         """
-        recommendations = []
+        compiled_prefs = loose_preferences.LoosePreferences(self, loose_prefs, loose_preferences.TRAVEL_CHECKS)
+        recommendations = candidate_table.CandidateTable(self, candidate_table.TRAVEL, RecommendationState,
+                                                         compiled_prefs.names)
         CO2_scores_per_domain = []
 
         for neighborhood, travel_options in travel_options.items():
             for travel_option in travel_options:
                 adhered_prefs = len(loose_prefs)
                 del CO2_scores_per_domain[1:]
-                pref_not_adhered_to = []
                 charging_spot = ''
 
                 if len(travel_option) == 3:
@@ -991,25 +1023,12 @@ class EnvironmentalAgent:
                     CO2_scores_per_domain.append(2)
                 else:
                     CO2_scores_per_domain.append(travel_option[0].hasCO2score[0])
-                n_domains = len(CO2_scores_per_domain)
-                for pref in preferences['loose_prefs']:
-                    if 'duration' in pref:
-                        max_duration = int(pref.split('duration<')[1])
-                        if travel_option[1] > max_duration - 1:
-                            pref_not_adhered_to.append('Duration')
-                    if 'transport' in pref:
-                        list_pref_transport = list(
-                            self.label_to_class[str(pref.split('transport=')[1])].instances())
-                        if not travel_option[0] in list_pref_transport:
-                            pref_not_adhered_to.append('Transport')
-
-                recommendation = RecommendationState('Restaurant', travel_option[0], [],
-                                                     [], pref_not_adhered_to, travel_option[1], charging_spot)
+                pref_not_adhered_to = compiled_prefs.violations(travel_option)
                 adhered_prefs = adhered_prefs - len(pref_not_adhered_to)
-                percentage_loose = adhered_prefs / len(loose_prefs)
-                utility = recommendation.calculate_utility(percentage_loose,
-                                                           CO2_scores_per_domain, n_domains)
-                recommendations.append([recommendation, utility, travel_option[1], adhered_prefs])
+                recommendations.add(None, neighborhood, travel_option[0], travel_option[1], CO2_scores_per_domain,
+                                    adhered_prefs, len(loose_prefs), pref_not_adhered_to, charging_spot)
+        recommendations.score()
+        self.count('candidates', len(recommendations))
         return recommendations
 
 
@@ -1017,12 +1036,62 @@ if __name__ == "__main__":
     """
     Main function for creating the agent with the ontology and providing a json file as input
     """
-    with open('./Users/bob.json', 'r') as openfile:
-        # Reading from json file
-        preferences = json.load(openfile)
-    agent = EnvironmentalAgent("IAG_Group10_Ontology.owl")
-    options = agent.find_states(preferences)
-
-    # Code for random agent to recommend random clothing item and store, commented out as it's only used for evaluation
-    #random_agent = random_agent.RandomRecommendationAgent("IAG_Group10_Ontology.owl")
-    #random_agent.recommend_random_clothing(preferences)
+    parser = argparse.ArgumentParser(description="Group 10's environmental agent")
+    parser.add_argument('user_files', nargs='*', default=['./Users/bob.json'],
+                        help='json files with the preferences, or directories of them')
+    parser.add_argument('--snapshot-dir', default='.snapshots', help='directory for reasoned ontology snapshots')
+    parser.add_argument('--preference-backend', choices=['python', 'sparql'], default='python',
+                        help='evaluate pref_food/pref_clothing in Python or as a single SPARQL query')
+    parser.add_argument('--reasoner', choices=['hermit', 'rules'], default='hermit',
+                        help='reason the ontology with HermiT or materialise the inferences with Python rules')
+    parser.add_argument('--baseline', action='store_true',
+                        help='also recommend a random clothing item with the random agent (used for evaluation)')
+    parser.add_argument('--json', action='store_true',
+                        help='print the results of a batch of users as json instead of their recommendations')
+    parser.add_argument('--workers', type=int, default=1, help='run a batch of users on this many worker processes')
+    parser.add_argument('--pool-mode', choices=['fork', 'snapshot', 'thread'], default='snapshot',
+                        help='let spawned workers open the snapshot read-only, fork the workers, or run '
+                             'them as threads sharing one agent')
+    parser.add_argument('--metrics', choices=['json', 'prometheus'],
+                        help='time the stages of find_states and print the spans and counters afterwards, as json '
+                             'lines or in the Prometheus text format')
+    args = parser.parse_args()
+    if args.metrics is not None and args.workers > 1:
+        parser.error('--metrics needs the requests to run in this process (--workers 1)')
+
+    user_files = batch_recommendations.user_files(args.user_files)
+    if args.workers > 1:
+        # The workers send back lightweight results only, see worker_pool
+        import worker_pool
+        requests = batch_recommendations.load_requests(user_files)
+        with worker_pool.WorkerPool("IAG_Group10_Ontology.owl", args.workers, args.pool_mode, args.snapshot_dir,
+                                    args.preference_backend, args.reasoner) as pool:
+            batch_recommendations.print_batch(pool.recommend(requests), args.json)
+    else:
+        agent = EnvironmentalAgent("IAG_Group10_Ontology.owl", snapshot_dir=args.snapshot_dir,
+                                   preference_backend=args.preference_backend, reasoner=args.reasoner)
+        if args.metrics is not None:
+            import instrumentation
+            agent.instrumentation = instrumentation.Instrumentation()
+        if len(user_files) == 1 and not args.json:
+            with open(user_files[0], 'r') as openfile:
+                # Reading from json file
+                preferences = json.load(openfile)
+            options = agent.find_states(preferences)
+            requests = [batch_recommendations.Request(user_files[0], preferences)]
+        else:
+            # Many users: their requests share work, see find_states_many
+            requests = batch_recommendations.load_requests(user_files)
+            batch_recommendations.print_batch(agent.find_states_many(requests), args.json)
+        if args.metrics == 'json':
+            print(agent.instrumentation.json_lines(agent), end='')
+        elif args.metrics == 'prometheus':
+            print(agent.instrumentation.prometheus(agent), end='')
+
+    # The random agent recommends a random clothing item and store, it is only loaded when asked for as it is only
+    # used for evaluation
+    if args.baseline:
+        import random_agent
+        random_agent = random_agent.RandomRecommendationAgent("IAG_Group10_Ontology.owl")
+        for request in requests:
+            random_agent.recommend_random_clothing(request.preferences)
@@ -0,0 +1,86 @@
+import threading
+from collections import namedtuple
+
+# What a health condition rules out: everything forbidden by it, split into the forbidden ingredients and materials
+# (lists), and the recipes and clothing items containing something forbidden (bitsets over the interned IDs, see
+# InternTable.bitset)
+Exclusion = namedtuple('Exclusion', ['forbidden', 'ingredients', 'materials', 'recipes', 'clothing'])
+
+# Properties whose changes can change an exclusion
+EXCLUSION_PROPERTIES = ['isForbiddenBy', 'containsIngredient', 'containsMaterial']
+
+
+class HealthExclusions:
+    """
+    Table mapping every health condition to what it rules out, computed once after reasoning. The exclusions of a
+    request are then the union of the entries of the user's health conditions. There are only a handful of health
+    conditions, so the table is rebuilt as a whole when a delta touches one of the exclusion properties. Safe to share
+    between the threads serving requests: the table is only replaced once it is complete, and an entry computed by
+    two threads at once is simply stored twice.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.table = {}
+        self.lock = threading.Lock()
+        self.build()
+
+    def build(self):
+        agent = self.agent
+        conditions = list(agent.ontology.HealthCondition.instances())
+        conditions += [condition for condition in agent.reverse_index.subjects_by_prop[agent.ontology.isForbiddenBy]
+                       if condition not in conditions]
+        table = {condition: self.exclusion(condition) for condition in conditions}
+        with self.lock:
+            self.table = table
+
+    def exclusion(self, condition):
+        agent = self.agent
+        forbidden = agent.reverse_index.subjects('isForbiddenBy', condition)
+        return Exclusion(
+            forbidden,
+            [entity for entity in forbidden if isinstance(entity, agent.ontology.Ingredient)],
+            [entity for entity in forbidden if isinstance(entity, agent.ontology.Material)],
+            agent.interned.bitset(agent.reverse_index.subjects_of_any('containsIngredient', forbidden)),
+            agent.interned.bitset(agent.reverse_index.subjects_of_any('containsMaterial', forbidden)))
+
+    def entry(self, condition):
+        """
+        The exclusion of a health condition, computed when it is not in the table yet
+        """
+        with self.lock:
+            exclusion = self.table.get(condition)
+        if exclusion is None:
+            exclusion = self.exclusion(condition)
+            with self.lock:
+                self.table[condition] = exclusion
+        return exclusion
+
+    def forbidden(self, conditions):
+        """
+        Every ingredient and material forbidden by one of the health conditions
+        """
+        found = {}
+        for condition in conditions:
+            found.update(dict.fromkeys(self.entry(condition).forbidden))
+        return list(found)
+
+    def excluded_recipes(self, conditions):
+        bits = 0
+        for condition in conditions:
+            bits |= self.entry(condition).recipes
+        return bits
+
+    def excluded_clothing(self, conditions):
+        bits = 0
+        for condition in conditions:
+            bits |= self.entry(condition).clothing
+        return bits
+
+    def update(self, delta_result):
+        """
+        Rebuilds the table if the delta changed what a health condition rules out
+        """
+        if delta_result.removed_storids or any(prop.python_name in EXCLUSION_PROPERTIES
+                                               for subject, prop, value, added in delta_result.facts):
+            self.build()
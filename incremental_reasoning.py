@@ -0,0 +1,317 @@
+from owlready2 import *
+import rule_materialiser
+
+
+class OntologyDelta:
+    """
+    A batch of changes to the reasoned ontology: new and removed individuals and added and removed assertions.
+    Individuals and classes can be given as owlready2 entities, labels or names; properties by their python name.
+    Individuals created in the same delta can be referred to by their name.
+    """
+
+    def __init__(self):
+        self.new_individuals = []
+        self.removed_individuals = []
+        self.added = []
+        self.removed = []
+
+    def add_individual(self, name, class_ref, label=None):
+        self.new_individuals.append((name, class_ref, label))
+        return self
+
+    def remove_individual(self, individual_ref):
+        self.removed_individuals.append(individual_ref)
+        return self
+
+    def add(self, subject_ref, prop_name, value):
+        self.added.append((subject_ref, prop_name, value))
+        return self
+
+    def remove(self, subject_ref, prop_name, value):
+        self.removed.append((subject_ref, prop_name, value))
+        return self
+
+    def __len__(self):
+        return len(self.new_individuals) + len(self.removed_individuals) + len(self.added) + len(self.removed)
+
+
+class DeltaResult:
+    """
+    What applying a delta changed. Next to the asserted changes, facts lists every fact that became true (True) or
+    stopped being true (False) as (subject, property, value, added), including the inverse and symmetric mirrors that
+    owlready2 derives on access and the transitive links that were (re)materialised. Indexes built on top of the
+    ontology can use it to update themselves without a full rebuild.
+    """
+
+    def __init__(self):
+        self.new_individuals = []
+        self.removed_individuals = []
+        self.removed_storids = []
+        self.facts = []
+        self.seen_facts = set()
+        # Asserted values added and removed by the delta
+        self.added = 0
+        self.removed = 0
+        self.inferred_added = 0
+        self.inferred_removed = 0
+        self.subjects_rederived = 0
+        # Subjects whose inferred links had to be moved behind their asserted ones
+        self.subjects_reordered = 0
+        # Individuals that became (classified) or stopped being (declassified) a member of a defined class
+        self.classified = 0
+        self.declassified = 0
+
+    def record(self, subject, prop, value, added):
+        facts = [(subject, prop, value, added)]
+        if isinstance(prop, ObjectPropertyClass):
+            if prop.inverse_property:
+                facts.append((value, prop.inverse_property, subject, added))
+            if SymmetricProperty in prop.is_a:
+                facts.append((value, prop, subject, added))
+        for fact in facts:
+            if fact not in self.seen_facts:
+                self.seen_facts.add(fact)
+                self.facts.append(fact)
+
+
+def resolve_individual(agent, ref, created):
+    """
+    Finds the individual an entity, name or label refers to
+    """
+    if not isinstance(ref, str):
+        return ref
+    if ref in created:
+        return created[ref]
+    if ref in agent.label_to_indiv:
+        return agent.label_to_indiv[ref]
+    individual = agent.ontology[ref]
+    if individual is None:
+        raise KeyError('Unknown individual: {}'.format(ref))
+    return individual
+
+
+def resolve_class(agent, ref):
+    """
+    Finds the class an entity, name or label refers to
+    """
+    if not isinstance(ref, str):
+        return ref
+    if ref in agent.label_to_class:
+        return agent.label_to_class[ref]
+    cls = agent.ontology[ref]
+    if cls is None:
+        raise KeyError('Unknown class: {}'.format(ref))
+    return cls
+
+
+def resolve_property(agent, prop_name):
+    prop = agent.ontology[prop_name] or agent.label_to_prop.get(prop_name)
+    if prop is None:
+        raise KeyError('Unknown property: {}'.format(prop_name))
+    return prop
+
+
+def transitive_properties(agent):
+    return [prop for prop in agent.ontology.object_properties() if TransitiveProperty in prop.is_a]
+
+
+def defined_classes(agent):
+    return [cls for cls in agent.ontology.classes() if cls.equivalent_to]
+
+
+def located_through(world, prop, individual):
+    """
+    All subjects linked to the individual through the transitive property. As the closure is materialised, the
+    direct (asserted or inferred) links are all there is.
+    """
+    return set(world._get_obj_triples_po_s(prop.storid, individual.storid))
+
+
+def rederive_transitive(agent, prop, subjects, result):
+    """
+    Recomputes the materialised closure of a transitive property for the given subjects from their asserted links.
+    The values of every subject are kept in the order the reasoner gives them, the asserted (most specific) ones
+    first and the inferred closure after them: inferred links that ended up before an asserted one (when an asserted
+    link was replaced) are taken out and appended again.
+    """
+    world = agent.world
+    for subject_storid in subjects:
+        subject = world._get_by_storid(subject_storid)
+        if subject is None:
+            continue
+        asserted = list(agent.ontology._get_obj_triples_sp_o(subject_storid, prop.storid))
+        closure = []
+        seen = set(asserted) | {subject_storid}
+        queue = list(asserted)
+        while queue:
+            current = queue.pop(0)
+            for target in agent.ontology._get_obj_triples_sp_o(current, prop.storid):
+                if target not in seen:
+                    seen.add(target)
+                    closure.append(target)
+                    queue.append(target)
+        inferred = set(agent.inferences._get_obj_triples_sp_o(subject_storid, prop.storid))
+        values = getattr(subject, prop.python_name)
+        for target in inferred - set(closure) - set(asserted):
+            value = world._get_by_storid(target)
+            values.remove(value)
+            result.record(subject, prop, value, False)
+            result.inferred_removed += 1
+        storids = [value.storid for value in values]
+        last_asserted = max((index for index, storid in enumerate(storids) if storid in asserted), default=-1)
+        misplaced = set(storids[:last_asserted]) - set(asserted)
+        for target in misplaced:
+            values.remove(world._get_by_storid(target))
+        with agent.inferences:
+            for target in closure:
+                if target not in inferred:
+                    value = world._get_by_storid(target)
+                    values.append(value)
+                    result.record(subject, prop, value, True)
+                    result.inferred_added += 1
+                elif target in misplaced:
+                    values.append(world._get_by_storid(target))
+        if misplaced:
+            result.subjects_reordered += 1
+        result.subjects_rederived += 1
+
+
+def add_domain_range_types(agent, subject, prop, value):
+    """
+    Types the subject (and object) of a new assertion with the domain (and range) of its property, like the
+    reasoner does for individuals that are not yet known to be an instance of it
+    """
+    typed = [(subject, prop.domain)]
+    if isinstance(prop, ObjectPropertyClass):
+        typed.append((value, prop.range))
+    with agent.inferences:
+        for individual, classes in typed:
+            for cls in classes:
+                if isinstance(cls, ThingClass) and not isinstance(individual, cls):
+                    individual.is_a.append(cls)
+
+
+def reclassify(agent, storids, defined, result):
+    """
+    Re-checks the given individuals against the defined classes (see rule_materialiser.satisfies): an individual
+    whose facts now satisfy the definition of a class becomes a member of it in the inferences ontology, and an
+    inferred membership whose definition no longer holds is dropped
+    """
+    world = agent.world
+    for storid in storids:
+        individual = world._get_by_storid(storid)
+        if not isinstance(individual, Thing):
+            continue
+        inferred = set(agent.inferences._get_obj_triples_sp_o(storid, rdf_type))
+        for cls in defined:
+            holds = any(rule_materialiser.satisfies(individual, definition) for definition in cls.equivalent_to)
+            if holds and not isinstance(individual, cls):
+                with agent.inferences:
+                    individual.is_a.append(cls)
+                result.classified += 1
+            elif not holds and cls.storid in inferred:
+                individual.is_a.remove(cls)
+                result.declassified += 1
+
+
+def set_value(subject, prop, value, add):
+    """
+    Adds or removes one value of a property, taking functional properties (which owlready2 does not expose as a
+    list) into account
+    """
+    if FunctionalProperty in prop.is_a:
+        setattr(subject, prop.python_name, value if add else None)
+    elif add:
+        getattr(subject, prop.python_name).append(value)
+    else:
+        getattr(subject, prop.python_name).remove(value)
+
+
+def apply_delta(agent, delta):
+    """
+    Applies a delta to the agent's reasoned world. Only the inferences touched by the delta are re-derived: the
+    closure of transitive properties (isLocatedIn) for the subjects whose links changed and everything located in
+    them, and the domain/range types of new assertions. Inverse (serves, selling/availableIn) and symmetric
+    (adjacentTo) links are resolved by owlready2 on access, so they are only reported in the result.
+    The individuals the delta touches (and those whose closure changed) are re-checked against the defined classes.
+    The amount of work depends on the size of the delta and the subjects it reaches, not on the size of the
+    ontology.
+    """
+    result = DeltaResult()
+    world = agent.world
+    created = {}
+    transitive = transitive_properties(agent)
+    rederive = {prop: set() for prop in transitive}
+    touched = set()
+    removed = set()
+
+    with agent.ontology:
+        for name, class_ref, label in delta.new_individuals:
+            individual = resolve_class(agent, class_ref)(name, namespace=agent.ontology)
+            if label:
+                individual.label = [label]
+                agent.label_to_indiv[label] = individual
+            agent.individuals.append(individual)
+            created[name] = individual
+            result.new_individuals.append(individual)
+            touched.add(individual.storid)
+
+        for subject_ref, prop_name, value in delta.removed:
+            subject = resolve_individual(agent, subject_ref, created)
+            prop = resolve_property(agent, prop_name)
+            if isinstance(prop, ObjectPropertyClass):
+                value = resolve_individual(agent, value, created)
+            set_value(subject, prop, value, False)
+            result.record(subject, prop, value, False)
+            result.removed += 1
+            touched.add(subject.storid)
+            if isinstance(prop, ObjectPropertyClass):
+                touched.add(value.storid)
+            if prop in rederive:
+                rederive[prop].add(subject.storid)
+                rederive[prop].update(located_through(world, prop, subject))
+
+        for subject_ref, prop_name, value in delta.added:
+            subject = resolve_individual(agent, subject_ref, created)
+            prop = resolve_property(agent, prop_name)
+            if isinstance(prop, ObjectPropertyClass):
+                value = resolve_individual(agent, value, created)
+            set_value(subject, prop, value, True)
+            result.record(subject, prop, value, True)
+            result.added += 1
+            touched.add(subject.storid)
+            if isinstance(prop, ObjectPropertyClass):
+                touched.add(value.storid)
+            add_domain_range_types(agent, subject, prop, value)
+            if prop in rederive:
+                rederive[prop].add(subject.storid)
+                rederive[prop].update(located_through(world, prop, subject))
+
+        for individual_ref in delta.removed_individuals:
+            individual = resolve_individual(agent, individual_ref, created)
+            for prop in transitive:
+                rederive[prop].update(located_through(world, prop, individual))
+                rederive[prop].discard(individual.storid)
+            for prop in individual.get_properties():
+                for value in prop[individual]:
+                    result.record(individual, prop, value, False)
+            for subject, prop in individual.get_inverse_properties():
+                result.record(subject, prop, individual, False)
+            for label in individual.label:
+                if agent.label_to_indiv.get(label) is individual:
+                    del agent.label_to_indiv[label]
+            removed.add(individual.storid)
+            result.removed_individuals.append(individual.name)
+            result.removed_storids.append(individual.storid)
+            destroy_entity(individual)
+        if removed:
+            # One pass for all the individuals removed by the delta
+            agent.individuals = [other for other in agent.individuals if other.storid not in removed]
+
+    for prop, subjects in rederive.items():
+        rederive_transitive(agent, prop, subjects, result)
+        touched.update(subjects)
+    defined = defined_classes(agent)
+    if defined:
+        reclassify(agent, touched - removed, defined, result)
+    return result
@@ -0,0 +1,175 @@
+import bisect
+import contextlib
+import json
+import threading
+import time
+from collections import deque, namedtuple
+
+# Upper bounds (in seconds) of the histogram buckets of every stage, the last bucket (+Inf) takes the rest
+BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Percentiles reported per stage, computed over the most recent durations of the stage
+QUANTILES = [0.5, 0.95, 0.99]
+RECENT = 4096
+
+# Spans that are kept for export, the oldest ones are dropped first
+MAX_SPANS = 10000
+
+# Prefix of the exported metric names
+PREFIX = 'group10'
+
+# One timed call of a stage: the stage name, when it started (seconds since the epoch), how long it took and the
+# thread it ran on. Spans of stages called from another stage (determine_travel_options from the candidate creation,
+# ...) lie within the span of that stage.
+Span = namedtuple('Span', ['stage', 'start', 'seconds', 'thread'])
+
+
+class Histogram:
+    """
+    Durations of one stage: counts per bucket (see BUCKETS), their number and sum since the start, and the most
+    recent durations for the percentiles
+    """
+
+    def __init__(self, recent=RECENT):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=recent)
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def percentile(self, fraction):
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def as_dict(self):
+        summary = {'count': self.count, 'sum_seconds': round(self.sum, 6),
+                   'mean_ms': round(1000 * self.sum / self.count, 3) if self.count else None}
+        for fraction in QUANTILES:
+            value = self.percentile(fraction)
+            summary['p{}_ms'.format(round(100 * fraction))] = round(1000 * value, 3) if value is not None else None
+        return summary
+
+
+def cache_counters(agent):
+    """
+    The hit and miss counters the caches of an agent keep themselves (since the agent was created), by cache
+    """
+    caches = {'plans': agent.plans, 'sparql_plans': agent.sparql_plans, 'trains': agent.travel_matrix.network,
+              'results': agent.result_cache}
+    return {name: {'hits': cache.hits, 'misses': cache.misses} for name, cache in caches.items() if cache is not None}
+
+
+class Instrumentation:
+    """
+    Spans per stage of find_states and counters (candidates created, ontology searches, ...) of an agent, set as
+    agent.instrumentation (None, the default, records nothing). Safe to share between the threads serving requests.
+    The measurements can be read in-process (stats) or exported as json lines or in the Prometheus text format.
+    """
+
+    def __init__(self, max_spans=MAX_SPANS, recent=RECENT, clock=time.perf_counter):
+        self.max_spans = max_spans
+        self.recent = recent
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.spans = deque(maxlen=self.max_spans)
+            self.histograms = {}
+            self.counters = {}
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        """
+        Times the block as a span of the stage
+        """
+        wall = time.time()
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(stage, wall, self.clock() - start)
+
+    def record(self, stage, wall, seconds):
+        with self.lock:
+            self.spans.append(Span(stage, wall, seconds, threading.current_thread().name))
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram(self.recent)
+            histogram.observe(seconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def stats(self, agent=None):
+        """
+        The summary (count, mean, percentiles) of every stage and the counters, with the cache counters of the agent
+        """
+        with self.lock:
+            stats = {'stages': {stage: histogram.as_dict() for stage, histogram in sorted(self.histograms.items())},
+                     'counters': dict(sorted(self.counters.items()))}
+        if agent is not None:
+            stats['caches'] = cache_counters(agent)
+        return stats
+
+    def json_lines(self, agent=None):
+        """
+        The spans, then the summary of every stage and the counters, as json objects, one per line
+        """
+        with self.lock:
+            spans = list(self.spans)
+        lines = [json.dumps(dict(span._asdict(), type='span')) for span in spans]
+        stats = self.stats(agent)
+        lines.extend(json.dumps(dict(summary, type='stage', stage=stage)) for stage, summary in stats['stages'].items())
+        lines.append(json.dumps(dict(stats['counters'], type='counters')))
+        if 'caches' in stats:
+            lines.append(json.dumps(dict(stats['caches'], type='caches')))
+        return '\n'.join(lines) + '\n'
+
+    def prometheus(self, agent=None):
+        """
+        The stage durations (a histogram, and a summary with the percentiles of the recent durations), the counters
+        and the cache counters of the agent in the Prometheus text format
+        """
+        with self.lock:
+            histograms = {stage: (list(histogram.buckets), histogram.count, histogram.sum,
+                                  [histogram.percentile(fraction) for fraction in QUANTILES], list(histogram.recent))
+                          for stage, histogram in sorted(self.histograms.items())}
+            counters = dict(sorted(self.counters.items()))
+        lines = ['# HELP {}_stage_seconds Time spent per stage of find_states'.format(PREFIX),
+                 '# TYPE {}_stage_seconds histogram'.format(PREFIX)]
+        for stage, (buckets, count, total, percentiles, recent) in histograms.items():
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ['+Inf'], buckets):
+                cumulative += bucket
+                lines.append('{}_stage_seconds_bucket{{stage="{}",le="{}"}} {}'.format(PREFIX, stage, bound,
+                                                                                      cumulative))
+            lines.append('{}_stage_seconds_sum{{stage="{}"}} {}'.format(PREFIX, stage, total))
+            lines.append('{}_stage_seconds_count{{stage="{}"}} {}'.format(PREFIX, stage, count))
+        lines += ['# HELP {}_stage_recent_seconds Percentiles of the most recent durations per stage'.format(PREFIX),
+                  '# TYPE {}_stage_recent_seconds summary'.format(PREFIX)]
+        for stage, (buckets, count, total, percentiles, recent) in histograms.items():
+            for fraction, value in zip(QUANTILES, percentiles):
+                lines.append('{}_stage_recent_seconds{{stage="{}",quantile="{}"}} {}'.format(PREFIX, stage, fraction,
+                                                                                            value))
+            lines.append('{}_stage_recent_seconds_sum{{stage="{}"}} {}'.format(PREFIX, stage, sum(recent)))
+            lines.append('{}_stage_recent_seconds_count{{stage="{}"}} {}'.format(PREFIX, stage, len(recent)))
+        for name, value in counters.items():
+            lines += ['# TYPE {}_{}_total counter'.format(PREFIX, name),
+                      '{}_{}_total {}'.format(PREFIX, name, value)]
+        if agent is not None:
+            caches = cache_counters(agent)
+            for kind in ['hits', 'misses']:
+                lines.append('# TYPE {}_cache_{}_total counter'.format(PREFIX, kind))
+                lines.extend('{}_cache_{}_total{{cache="{}"}} {}'.format(PREFIX, kind, name, counts[kind])
+                             for name, counts in caches.items())
+        return '\n'.join(lines) + '\n'
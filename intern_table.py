@@ -0,0 +1,223 @@
+import math
+import sys
+import threading
+from array import array
+from owlready2 import *
+
+# Numeric data properties kept as a column in the intern table, missing values are stored as NaN
+NUMERIC_ATTRIBUTES = ['hasCO2score', 'hasPriceEur', 'hasPopulation']
+
+KIND_CLASS = 0
+KIND_INDIVIDUAL = 1
+
+
+class InternTable:
+    """
+    Deduplicated table mapping every class and individual of the ontology to a dense integer ID, with columns for
+    the label, the primary (first asserted) class and the key numeric attributes. Indexes and set operations can work
+    on these integers instead of on owlready2 objects. IDs are never reused: removed individuals leave a hole
+    (entity None) so IDs handed out earlier stay valid.
+    """
+
+    def __init__(self, ontology):
+        self.ontology = ontology
+        self.entities = []
+        self.labels = []
+        self.kinds = array('b')
+        self.primary_class = array('i')
+        self.columns = {name: array('d') for name in NUMERIC_ATTRIBUTES}
+        self.storid_to_id = {}
+        self.label_to_id = {}
+        # Entities can be interned while requests are served from other threads (see candidate_table)
+        self.lock = threading.RLock()
+
+        for cls in ontology.classes():
+            self.add(cls)
+        for individual in ontology.individuals():
+            self.add(individual)
+        for cls in list(ontology.classes()):
+            for individual in cls.instances():
+                self.add(individual)
+
+        # Read every numeric attribute with a single query per property instead of one per individual
+        for name in NUMERIC_ATTRIBUTES:
+            prop = ontology[name]
+            if prop is None:
+                continue
+            column = self.columns[name]
+            for subject, value in prop.get_relations():
+                entity_id = self.storid_to_id.get(subject.storid)
+                if entity_id is not None and math.isnan(column[entity_id]):
+                    column[entity_id] = value
+
+    def add(self, entity):
+        """
+        Interns an entity, returns its ID (the existing one if it was already interned). The primary class is interned
+        first and the ID is only published once every column has its row, so threads reading the table never see a
+        partly added entity.
+        """
+        entity_id = self.storid_to_id.get(entity.storid)
+        if entity_id is not None:
+            return entity_id
+        with self.lock:
+            entity_id = self.storid_to_id.get(entity.storid)
+            if entity_id is not None:
+                return entity_id
+            if isinstance(entity, ThingClass):
+                kind = KIND_CLASS
+                primary_class = -1
+            else:
+                kind = KIND_INDIVIDUAL
+                classes = [cls for cls in entity.is_a if isinstance(cls, ThingClass)]
+                primary_class = self.add(classes[0]) if classes else -1
+            entity_id = len(self.entities)
+            self.entities.append(entity)
+            label = entity.label[0] if len(entity.label) > 0 else ''
+            self.labels.append(label)
+            self.kinds.append(kind)
+            self.primary_class.append(primary_class)
+            for name in NUMERIC_ATTRIBUTES:
+                self.columns[name].append(math.nan)
+            if label and label not in self.label_to_id:
+                self.label_to_id[label] = entity_id
+            self.storid_to_id[entity.storid] = entity_id
+            return entity_id
+
+    def remove(self, storid):
+        """
+        Leaves a hole for a removed entity
+        """
+        entity_id = self.storid_to_id.pop(storid, None)
+        if entity_id is None:
+            return
+        if self.label_to_id.get(self.labels[entity_id]) == entity_id:
+            del self.label_to_id[self.labels[entity_id]]
+        self.entities[entity_id] = None
+        for name in NUMERIC_ATTRIBUTES:
+            self.columns[name][entity_id] = math.nan
+
+    def refresh(self, entity):
+        """
+        Re-reads the label, primary class and numeric attributes of an interned entity
+        """
+        entity_id = self.add(entity)
+        label = entity.label[0] if len(entity.label) > 0 else ''
+        if label != self.labels[entity_id]:
+            if self.label_to_id.get(self.labels[entity_id]) == entity_id:
+                del self.label_to_id[self.labels[entity_id]]
+            self.labels[entity_id] = label
+            if label and label not in self.label_to_id:
+                self.label_to_id[label] = entity_id
+        if self.kinds[entity_id] == KIND_INDIVIDUAL:
+            classes = [cls for cls in entity.is_a if isinstance(cls, ThingClass)]
+            self.primary_class[entity_id] = self.add(classes[0]) if classes else -1
+        for name in NUMERIC_ATTRIBUTES:
+            values = getattr(entity, name, None) or []
+            self.columns[name][entity_id] = values[0] if values else math.nan
+
+    def update(self, delta_result):
+        """
+        Keeps the table in sync with a delta applied to the ontology (see incremental_reasoning)
+        """
+        for individual in delta_result.new_individuals:
+            self.add(individual)
+        for storid in delta_result.removed_storids:
+            self.remove(storid)
+        for subject, prop, value, added in delta_result.facts:
+            if getattr(subject, 'storid', None) in self.storid_to_id:
+                if prop.python_name in NUMERIC_ATTRIBUTES or prop.python_name == 'label':
+                    self.refresh(subject)
+
+    def id_of(self, entity):
+        return self.storid_to_id[entity.storid]
+
+    def ids_of(self, entities):
+        return [self.storid_to_id[entity.storid] for entity in entities]
+
+    def entity(self, entity_id):
+        return self.entities[entity_id]
+
+    def individuals(self):
+        """
+        Every interned individual once, in ID order
+        """
+        return [entity for entity_id, entity in enumerate(self.entities)
+                if entity is not None and self.kinds[entity_id] == KIND_INDIVIDUAL]
+
+    def bitset(self, entities):
+        """
+        Bitset of the given entities: a Python int with bit i set for the entity with ID i. Union, intersection and
+        difference of entity sets are then single operations on the ints (a | b, a & b, a & ~b).
+        """
+        bits = bytearray((len(self.entities) + 7) // 8)
+        for entity in entities:
+            entity_id = self.storid_to_id[entity.storid]
+            bits[entity_id >> 3] |= 1 << (entity_id & 7)
+        return int.from_bytes(bits, 'little')
+
+    def members(self, bits):
+        """
+        The entities in a bitset, in ID order
+        """
+        found = []
+        binary = bin(bits)[:1:-1]  # Lowest bit first
+        entity_id = binary.find('1')
+        while entity_id >= 0:
+            found.append(self.entities[entity_id])
+            entity_id = binary.find('1', entity_id + 1)
+        return found
+
+    def value(self, name, entity_id):
+        """
+        Numeric attribute of an entity, None when the entity has no value for it
+        """
+        value = self.columns[name][entity_id]
+        return None if math.isnan(value) else value
+
+    def __len__(self):
+        return len(self.entities)
+
+
+def deep_size(obj, seen=None):
+    """
+    Approximate memory used by a container and the strings, numbers and containers it holds. owlready2 entities
+    are shared between all structures, so they are counted as a single reference only.
+    """
+    if seen is None:
+        seen = set()
+    if isinstance(obj, (Thing, EntityClass)) or id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_size(key, seen) + deep_size(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_size(item, seen)
+    return size
+
+
+def memory_report(agent):
+    """
+    Compares the memory used by the intern table with the label dictionaries and the per-class individuals list the
+    agent builds from the ontology (with an individual appearing once for every class it belongs to)
+    """
+    ontology = agent.ontology
+    individuals_per_class = []
+    for cls in ontology.classes():
+        for individual in cls.instances():
+            individuals_per_class.append(individual)
+    label_to_indiv = {ent.label[0]: ent for ent in individuals_per_class if len(ent.label) > 0}
+    label_to_class = {ent.label[0]: ent for ent in ontology.classes() if len(ent.label) > 0}
+    class_to_label = {ent: ent.label[0] for ent in ontology.classes() if len(ent.label) > 0}
+
+    table = agent.interned
+    table_parts = [table.entities, table.labels, table.kinds, table.primary_class, table.storid_to_id,
+                   table.label_to_id] + list(table.columns.values())
+    return {
+        'individuals_per_class': {'entries': len(individuals_per_class), 'bytes': deep_size(individuals_per_class)},
+        'label_dicts': {'entries': len(label_to_indiv) + len(label_to_class) + len(class_to_label),
+                        'bytes': deep_size([label_to_indiv, label_to_class, class_to_label])},
+        'intern_table': {'entries': len(table), 'bytes': deep_size(table_parts)},
+    }
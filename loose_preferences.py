@@ -0,0 +1,60 @@
+# The loose preferences checked on every travel option, in the order they are checked within one preference. The
+# restaurant recommendations check the transport before the duration, clothing and travel the other way around.
+RESTAURANT_CHECKS = ['transport', 'duration']
+TRAVEL_CHECKS = ['duration', 'transport']
+
+
+class DurationLimit:
+    """
+    duration<N: the travel option has to take less than N minutes
+    """
+    name = 'Duration'
+
+    def __init__(self, max_duration):
+        self.max_duration = max_duration
+
+    def violated(self, travel_option):
+        return travel_option[1] > self.max_duration - 1
+
+
+class TransportClass:
+    """
+    transport=Class: the travel option has to be an instance of the class
+    """
+    name = 'Transport'
+
+    def __init__(self, instances):
+        self.instances = set(instances)
+
+    def violated(self, travel_option):
+        return travel_option[0] not in self.instances
+
+
+def compile_check(agent, check, pref):
+    if check == 'duration':
+        return DurationLimit(int(pref.split('duration<')[1]))
+    return TransportClass(agent.label_to_class[str(pref.split('transport=')[1])].instances())
+
+
+class LoosePreferences:
+    """
+    The loose preferences of a request compiled once into predicates on travel options, in the order in which they
+    used to be checked (checks being RESTAURANT_CHECKS or TRAVEL_CHECKS)
+    """
+
+    def __init__(self, agent, loose_prefs, checks):
+        self.predicates = [compile_check(agent, check, pref) for pref in loose_prefs for check in checks
+                           if check in pref]
+
+    @property
+    def names(self):
+        """
+        The names of all checks, in order (the violation names of a candidate table)
+        """
+        return [predicate.name for predicate in self.predicates]
+
+    def violations(self, travel_option):
+        """
+        The names of the checks the travel option fails, in order
+        """
+        return [predicate.name for predicate in self.predicates if predicate.violated(travel_option)]
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+from owlready2 import *
+
+# Settings the reasoner is run with, part of the snapshot key so changing them forces a new reasoning pass
+REASONER_SETTINGS = {'reasoner': 'hermit', 'infer_property_values': True}
+
+# Settings of the reasoner-free startup: the inferences the agent relies on are materialised by the rules of
+# rule_materialiser, without starting the JVM
+RULE_SETTINGS = {'reasoner': 'rules'}
+
+# The reasoner settings by the name the agent is created with
+REASONERS = {'hermit': REASONER_SETTINGS, 'rules': RULE_SETTINGS}
+
+# Inferred facts are kept in their own ontology (owlready2's default one for inferences), so that they can be told
+# apart from the asserted facts when the ontology is updated incrementally
+INFERENCES_IRI = 'http://inferrences/'
+
+# Bumped whenever the layout of a snapshot changes, so that older snapshots are rebuilt
+SNAPSHOT_FORMAT = 2
+
+
+def ontology_hash(path, reasoner_settings=REASONER_SETTINGS):
+    """
+    Content hash of the ontology file together with the reasoner settings (and the snapshot format and owlready2
+    version, since the quadstore layout depends on them). Used as the key of a snapshot.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as openfile:
+        for chunk in iter(lambda: openfile.read(1 << 16), b''):
+            digest.update(chunk)
+    digest.update(json.dumps(reasoner_settings, sort_keys=True).encode())
+    digest.update('{}:{}'.format(SNAPSHOT_FORMAT, VERSION).encode())
+    return digest.hexdigest()
+
+
+def snapshot_path(path, snapshot_dir, digest):
+    """
+    Location of the SQLite quadstore holding the reasoned world for the given ontology file and hash
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(snapshot_dir, '{}-{}.sqlite3'.format(name, digest[:16]))
+
+
+def run_reasoner(world, reasoner_settings=REASONER_SETTINGS):
+    """
+    Runs the reasoner (or the rule materialiser) over the world, inferred facts are stored in the inferences ontology
+    of the world
+    """
+    if reasoner_settings['reasoner'] == 'rules':
+        # Imported here, as the rule materialiser uses this module to check its inferences against HermiT
+        import rule_materialiser
+        rule_materialiser.materialise(world, world.get_ontology(INFERENCES_IRI))
+        return
+    with world.get_ontology(INFERENCES_IRI):
+        sync_reasoner(world, infer_property_values=reasoner_settings['infer_property_values'], debug=0)
+
+
+def build_snapshot(path, target, reasoner_settings=REASONER_SETTINGS):
+    """
+    Loads and reasons the ontology into a new SQLite quadstore at target. The quadstore is written to a temporary
+    file first and moved into place afterwards, so a crash halfway never leaves a broken snapshot behind.
+    Returns the base IRI of the ontology, which is needed to find it back in the quadstore.
+    """
+    tmp_target = '{}.{}.tmp'.format(target, os.getpid())
+    if os.path.exists(tmp_target):
+        os.remove(tmp_target)
+    world = World(filename=tmp_target)
+    ontology = world.get_ontology(os.path.abspath(path)).load()
+    run_reasoner(world, reasoner_settings)
+    base_iri = ontology.base_iri
+    world.save()
+    world.close()
+
+    with open(tmp_target + '.json', 'w') as openfile:
+        json.dump({'base_iri': base_iri, 'source': os.path.basename(path), 'reasoner': reasoner_settings},
+                  openfile)
+    os.replace(tmp_target + '.json', target + '.json')
+    os.replace(tmp_target, target)
+    return base_iri
+
+
+def open_snapshot(target, exclusive=False, read_only=False):
+    """
+    Opens an existing snapshot, returns the world and the reasoned ontology. Snapshots are opened non-exclusively
+    by default so several processes can read the same file. A read-only snapshot can not be changed (by deltas), but
+    any number of processes can open it and share its pages through the operating system's file cache.
+    """
+    with open(target + '.json', 'r') as openfile:
+        meta = json.load(openfile)
+    world = World(filename=target, exclusive=exclusive, read_only=read_only)
+    ontology = world.get_ontology(meta['base_iri'])
+    return world, ontology
+
+
+def load_reasoned_world(path, snapshot_dir=None, reasoner_settings=REASONER_SETTINGS, read_only=False):
+    """
+    Returns the reasoned world and ontology for the ontology file at path, along with its hash (the ontology
+    version). Without a snapshot directory the ontology is loaded in the default world and reasoned every time.
+    With a snapshot directory the reasoned world is read from the matching snapshot, which is only (re)built when
+    the hash of the ontology file or of the reasoner settings changes, and opened read-only if asked for.
+    """
+    digest = ontology_hash(path, reasoner_settings)
+    if snapshot_dir is None:
+        ontology = get_ontology(path)
+        ontology.load()
+        run_reasoner(default_world, reasoner_settings)
+        return default_world, ontology, digest
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    target = snapshot_path(path, snapshot_dir, digest)
+    if not os.path.exists(target):
+        build_snapshot(path, target, reasoner_settings)
+    world, ontology = open_snapshot(target, read_only=read_only)
+    return world, ontology, digest
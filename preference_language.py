@@ -0,0 +1,318 @@
+"""
+The preference mini-language of the pref_food and pref_clothing fields. A preference list is parsed into an
+expression tree, which is compiled against the ontology into a plan evaluating to a bitset over the interned IDs of
+the items of a domain (recipes or clothing).
+
+Semantics:
+- every entry of the list is a condition, the entries are combined with and
+- 'or' (as an entry of its own or as a word inside an entry) makes the conditions on either side alternatives, it binds
+  tighter than the list: ['A', 'B', 'or', 'C'] is A and (B or C). A dangling 'or' is ignored.
+- 'not' negates the condition it is part of
+- a label on its own stands for the instances of the class (or the individual) with that label
+- 'ingredient X' / 'material X' are the items containing X, 'ingredient some X' the items containing some instance of
+  the class X (the word order of 'some' and 'ingredient' does not matter)
+- 'maxprice N' are the items costing at most N euro, 'isFairTrade true/false' the items with that fair trade status
+Labels are looked up as written first and then with the CamelCase words split ('PlantBased' -> 'Plant Based').
+"""
+import functools
+import threading
+from collections import OrderedDict, namedtuple
+
+KEYWORD_NOT = 'not'
+KEYWORD_OR = 'or'
+KEYWORD_SOME = 'some'
+KEYWORDS_CONTAINS = ('ingredient', 'material')
+KEYWORD_MAXPRICE = 'maxprice'
+KEYWORD_FAIRTRADE = 'isFairTrade'
+
+# Compiled plans (sub-expressions and domain universes included) a PlanCache keeps, least recently used ones are
+# evicted beyond it
+MAX_PLANS = 4096
+
+
+def node_type(name, fields):
+    """
+    An expression tree node: a namedtuple that is only equal to (and hashes differently from) nodes of the same type,
+    so that And({a, b}) and Or({a, b}) are different keys
+    """
+    base = namedtuple(name, fields)
+    return type(name, (base,), {
+        '__slots__': (),
+        '__eq__': lambda self, other: type(self) is type(other) and tuple.__eq__(self, other),
+        '__ne__': lambda self, other: not (type(self) is type(other) and tuple.__eq__(self, other)),
+        '__hash__': lambda self: hash((name, tuple.__hash__(self))),
+    })
+
+
+Instances = node_type('Instances', ['label'])
+Contains = node_type('Contains', ['label', 'some'])
+MaxPrice = node_type('MaxPrice', ['value'])
+FairTrade = node_type('FairTrade', ['value'])
+Not = node_type('Not', ['operand'])
+And = node_type('And', ['operands'])
+Or = node_type('Or', ['operands'])
+
+# Where the items of a domain come from and which property links them to what they contain
+Domain = namedtuple('Domain', ['root_label', 'contains'])
+DOMAINS = {
+    'food': Domain('Recipe', 'containsIngredient'),
+    'clothing': Domain('Clothing', 'containsMaterial'),
+}
+
+
+def make_and(operands):
+    """
+    Normalised conjunction: nested conjunctions are flattened and the operands kept as a frozenset, so that the order
+    and repetition of conditions do not matter
+    """
+    flat = set()
+    for operand in operands:
+        if isinstance(operand, And):
+            flat.update(operand.operands)
+        else:
+            flat.add(operand)
+    if len(flat) == 1:
+        return flat.pop()
+    return And(frozenset(flat))
+
+
+def make_or(operands):
+    """
+    Normalised disjunction, like make_and
+    """
+    flat = set()
+    for operand in operands:
+        if isinstance(operand, Or):
+            flat.update(operand.operands)
+        else:
+            flat.add(operand)
+    if len(flat) == 1:
+        return flat.pop()
+    return Or(frozenset(flat))
+
+
+def make_not(operand):
+    if isinstance(operand, Not):
+        return operand.operand
+    return Not(operand)
+
+
+def value_of(keyword, words):
+    value = next(words, None)
+    if value is None:
+        raise ValueError('Missing value after {} in preferences'.format(keyword))
+    return value
+
+
+def parse_condition(words):
+    """
+    Parses the words of one condition (a list entry or one side of an 'or'), returns None if it has no content
+    """
+    negate = False
+    contains = False
+    some = False
+    filters = []
+    operands = []
+    words = iter(words)
+    for word in words:
+        if word == KEYWORD_NOT:
+            negate = True
+        elif word in KEYWORDS_CONTAINS:
+            contains = True
+        elif word == KEYWORD_SOME:
+            some = True
+        elif word == KEYWORD_MAXPRICE:
+            filters.append(MaxPrice(float(value_of(word, words))))
+        elif word == KEYWORD_FAIRTRADE:
+            filters.append(FairTrade(value_of(word, words).lower() == 'true'))
+        elif contains:
+            operands.append(Contains(word, some))
+        else:
+            operands.append(Instances(word))
+            some = False
+    if not operands and not filters:
+        return None
+    if not operands:
+        return make_not(make_and(filters)) if negate else make_and(filters)
+    condition = make_and(operands)
+    if negate:
+        condition = make_not(condition)
+    return make_and(filters + [condition])
+
+
+@functools.lru_cache(maxsize=1024)
+def parse_cached(preferences):
+    conjuncts = []
+    joined = False
+    for preference in preferences:
+        segment = []
+        for word in preference.split() + [None]:
+            if word is not None and word != KEYWORD_OR:
+                segment.append(word)
+                continue
+            condition = parse_condition(segment)
+            if condition is not None:
+                if joined and conjuncts:
+                    conjuncts[-1].append(condition)
+                else:
+                    conjuncts.append([condition])
+                joined = False
+            if word == KEYWORD_OR:
+                joined = True
+            segment = []
+    return make_and(make_or(alternatives) for alternatives in conjuncts)
+
+
+def parse(preferences):
+    """
+    Parses a pref_food/pref_clothing list into a normalised expression tree. Equivalent lists (the same conditions in
+    another order, repeated conditions) give equal trees. Parsed lists are cached, so a repeated list is not parsed
+    again.
+    """
+    return parse_cached(tuple(preferences))
+
+
+def count_upper_case_letters(str_obj):
+    """
+    Counts the amount of upper case letters
+    """
+    count = 0
+    for elem in str_obj:
+        if elem.isupper():
+            count += 1
+    return count
+
+
+def split_camel_case(word):
+    """
+    'PlantBased' -> 'Plant Based', words with a single capital are left as they are
+    """
+    if count_upper_case_letters(word) < 2:
+        return word
+    split = ''
+    for i, letter in enumerate(word):
+        if i and letter.isupper():
+            split += ' '
+        split += letter
+    return split
+
+
+def resolve(agent, label, prefer_class):
+    """
+    The class or individual a label in the preferences refers to
+    """
+    for candidate in (label, split_camel_case(label)):
+        cls = agent.label_to_class.get(candidate)
+        individual = agent.label_to_indiv.get(candidate)
+        if cls is not None and (prefer_class or individual is None):
+            return cls
+        if individual is not None:
+            return individual
+    raise KeyError('Unknown label in preferences: {}'.format(label))
+
+
+class PlanCache:
+    """
+    Compiled plans per (domain, normalised expression), least recently used first. A plan is the bitset of the items
+    of the domain matching the expression; every sub-expression is compiled once and shared between the plans it
+    appears in. The cache is bounded by max_plans (the universes of the domains and the sub-expressions count as
+    plans too) and emptied when the ontology version of the agent changes (after a delta). Safe to share between the
+    threads serving requests: a plan compiled by two threads at once is simply stored twice.
+    """
+
+    def __init__(self, max_plans=MAX_PLANS):
+        self.max_plans = max_plans
+        self.version = None
+        self.compiled = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        The compiled plan of a key, None when it is not cached
+        """
+        with self.lock:
+            bits = self.compiled.get(key)
+            if bits is not None:
+                self.compiled.move_to_end(key)
+            return bits
+
+    def put(self, key, bits):
+        with self.lock:
+            self.compiled[key] = bits
+            self.compiled.move_to_end(key)
+            while len(self.compiled) > self.max_plans:
+                self.compiled.popitem(last=False)
+                self.evictions += 1
+        return bits
+
+    def evaluate(self, agent, domain_name, preferences):
+        """
+        The bitset of the items of the domain matching the preference list
+        """
+        expression = parse(preferences)
+        key = (domain_name, expression)
+        with self.lock:
+            if self.version != agent.ontology_version:
+                self.compiled.clear()
+                self.version = agent.ontology_version
+            bits = self.compiled.get(key)
+            if bits is not None:
+                self.compiled.move_to_end(key)
+                self.hits += 1
+                return bits
+            self.misses += 1
+        return self.compile(agent, domain_name, expression)
+
+    def compile(self, agent, domain_name, expression):
+        key = (domain_name, expression)
+        bits = self.get(key)
+        if bits is not None:
+            return bits
+        domain = DOMAINS[domain_name]
+        universe = self.universe(agent, domain_name)
+        if isinstance(expression, And):
+            bits = universe
+            for operand in expression.operands:
+                bits &= self.compile(agent, domain_name, operand)
+        elif isinstance(expression, Or):
+            bits = 0
+            for operand in expression.operands:
+                bits |= self.compile(agent, domain_name, operand)
+        elif isinstance(expression, Not):
+            bits = universe & ~self.compile(agent, domain_name, expression.operand)
+        elif isinstance(expression, Instances):
+            entity = resolve(agent, expression.label, prefer_class=True)
+            if isinstance(entity, type):
+                bits = universe & agent.interned.bitset(entity.instances())
+            else:
+                bits = universe & agent.interned.bitset([entity])
+        elif isinstance(expression, Contains):
+            entity = resolve(agent, expression.label, prefer_class=expression.some)
+            values = entity.instances() if isinstance(entity, type) else [entity]
+            bits = universe & agent.interned.bitset(agent.reverse_index.subjects_of_any(domain.contains, values))
+        elif isinstance(expression, MaxPrice):
+            prices = agent.interned.columns['hasPriceEur']  # NaN (no price) is never <= the maximum
+            bits = agent.interned.bitset(item for item in agent.interned.members(universe)
+                                         if prices[agent.interned.id_of(item)] <= expression.value)
+        elif isinstance(expression, FairTrade):
+            bits = universe & agent.interned.bitset(
+                item for item, value in agent.ontology.isFairTrade.get_relations() if value == expression.value)
+        else:
+            raise TypeError('Unknown preference expression: {!r}'.format(expression))
+        return self.put(key, bits)
+
+    def universe(self, agent, domain_name):
+        """
+        Every item of the domain
+        """
+        key = (domain_name, None)
+        bits = self.get(key)
+        if bits is None:
+            items = []
+            for cls in agent.search(label=DOMAINS[domain_name].root_label):
+                items.extend(cls.instances())
+            bits = self.put(key, agent.interned.bitset(items))
+        return bits
@@ -0,0 +1,80 @@
+import itertools
+import time
+from collections import namedtuple
+import preference_language
+
+# The result of a relaxation:
+# - kept: the preference entries that are kept, dropped: the ones that are dropped (only entries with a condition,
+#   not a lone 'or')
+# - bits: the items matching the kept preferences (and not excluded), as a bitset over the interned IDs
+# - clause_seconds: time spent evaluating the clauses, steps: a Step per relaxation size that was tried
+Relaxation = namedtuple('Relaxation', ['kept', 'dropped', 'bits', 'clause_seconds', 'steps'])
+
+# One level of the subset lattice: the number of dropped clauses, how many subsets were tried and the time it took
+Step = namedtuple('Step', ['dropped', 'subsets', 'seconds'])
+
+
+def has_condition(entry):
+    return any(word != preference_language.KEYWORD_OR for word in entry.split())
+
+
+def clauses(preferences):
+    """
+    Groups a preference list into its clauses, the conditions that are combined with and (see preference_language):
+    an entry starting with 'or', or following an entry ending with 'or' (or a lone 'or'), belongs to the clause
+    before it. Returns a list of lists of entries.
+    """
+    groups = []
+    joined = False
+    for entry in preferences:
+        words = entry.split()
+        if not words:
+            continue
+        if groups and (joined or words[0] == preference_language.KEYWORD_OR or not has_condition(entry)):
+            groups[-1].append(entry)
+        elif has_condition(entry):
+            groups.append([entry])
+        joined = words[-1] == preference_language.KEYWORD_OR
+    return groups
+
+
+def relax(agent, domain_name, preferences, excluded=0):
+    """
+    Finds the smallest set of clauses to drop from the preferences so that at least one item of the domain matches
+    (leaving out the excluded items, a bitset). Every clause is evaluated once through the plan cache of the agent;
+    the subsets of kept clauses are then combined from these cached bitsets, smallest relaxations first. Among
+    relaxations of the same size, dropping later clauses is preferred. Returns a Relaxation, or None if no item
+    matches even without any preference.
+    """
+    start = time.perf_counter()
+    groups = clauses(preferences)
+    universe = agent.plans.universe(agent, domain_name) & ~excluded
+    clause_bits = [agent.plans.evaluate(agent, domain_name, group) for group in groups]
+    clause_seconds = time.perf_counter() - start
+
+    # Bitset of every combination of kept clauses (a tuple of clause indices) tried so far, built from the bitset of
+    # the combination without its last clause
+    combined = {(): universe}
+
+    def bits_of(kept):
+        if kept not in combined:
+            combined[kept] = bits_of(kept[:-1]) & clause_bits[kept[-1]]
+        return combined[kept]
+
+    steps = []
+    indices = range(len(groups))
+    for size in range(len(groups) + 1):
+        start = time.perf_counter()
+        subsets = 0
+        for dropped in itertools.combinations(reversed(indices), size):
+            subsets += 1
+            kept = tuple(index for index in indices if index not in dropped)
+            bits = bits_of(kept)
+            if bits:
+                steps.append(Step(size, subsets, time.perf_counter() - start))
+                return Relaxation(
+                    [entry for index in kept for entry in groups[index]],
+                    [entry for index in sorted(dropped) for entry in groups[index] if has_condition(entry)],
+                    bits, clause_seconds, steps)
+        steps.append(Step(size, subsets, time.perf_counter() - start))
+    return None
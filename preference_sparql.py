@@ -0,0 +1,128 @@
+import threading
+import preference_language
+from preference_language import And, Contains, FairTrade, Instances, MaxPrice, Not, Or
+
+# Class membership, including the instances of subclasses (like Class.instances())
+TYPE_PATH = 'rdf:type/rdfs:subClassOf*'
+
+
+def iri(entity):
+    return '<{}>'.format(entity.iri)
+
+
+class SparqlTranslator:
+    """
+    Translates a preference expression (see preference_language) and the health exclusions of one domain into a
+    single SPARQL query selecting the matching items as ?item
+    """
+
+    def __init__(self, agent, domain_name):
+        self.agent = agent
+        self.domain = preference_language.DOMAINS[domain_name]
+        self.root = agent.label_to_class[self.domain.root_label]
+        self.contains = iri(agent.ontology[self.domain.contains])
+        self.variables = 0
+
+    def variable(self):
+        self.variables += 1
+        return '?v{}'.format(self.variables)
+
+    def universe(self):
+        return '?item {} {} .'.format(TYPE_PATH, iri(self.root))
+
+    def patterns(self, expression):
+        """
+        The graph patterns (a list of strings) restricting ?item to the expression
+        """
+        if isinstance(expression, And):
+            patterns = []
+            for operand in sorted(expression.operands, key=repr):
+                patterns.extend(self.patterns(operand))
+            return patterns
+        if isinstance(expression, Or):
+            # Every alternative binds ?item to the domain itself, as a negation can not bind it
+            groups = ['{{ {} {} }}'.format(self.universe(), ' '.join(self.patterns(operand)))
+                      for operand in sorted(expression.operands, key=repr)]
+            return [' UNION '.join(groups)]
+        if isinstance(expression, Not):
+            return ['FILTER NOT EXISTS {{ {} }}'.format(' '.join(self.patterns(expression.operand)))]
+        if isinstance(expression, Instances):
+            entity = preference_language.resolve(self.agent, expression.label, prefer_class=True)
+            if isinstance(entity, type):
+                return ['?item {} {} .'.format(TYPE_PATH, iri(entity))]
+            return ['FILTER (?item = {})'.format(iri(entity))]
+        if isinstance(expression, Contains):
+            entity = preference_language.resolve(self.agent, expression.label, prefer_class=expression.some)
+            if isinstance(entity, type):
+                value = self.variable()
+                return ['?item {} {} . {} {} {} .'.format(self.contains, value, value, TYPE_PATH, iri(entity))]
+            return ['?item {} {} .'.format(self.contains, iri(entity))]
+        if isinstance(expression, MaxPrice):
+            price = self.variable()
+            return ['?item {} {} . FILTER ({} <= {})'.format(iri(self.agent.ontology.hasPriceEur), price, price,
+                                                              expression.value)]
+        if isinstance(expression, FairTrade):
+            return ['?item {} {} .'.format(iri(self.agent.ontology.isFairTrade),
+                                           'true' if expression.value else 'false')]
+        raise TypeError('Unknown preference expression: {!r}'.format(expression))
+
+    def health_patterns(self, health_conditions):
+        """
+        Excludes the items containing an ingredient or material forbidden by one of the health conditions
+        """
+        if not health_conditions:
+            return []
+        forbidden = self.variable()
+        condition = self.variable()
+        return ['FILTER NOT EXISTS {{ ?item {} {} . {} {} {} . VALUES {} {{ {} }} }}'.format(
+            self.contains, forbidden, forbidden, iri(self.agent.ontology.isForbiddenBy), condition, condition,
+            ' '.join(iri(health_condition) for health_condition in health_conditions))]
+
+    def query(self, expression, health_conditions):
+        patterns = [self.universe()] + self.patterns(expression) + self.health_patterns(health_conditions)
+        return 'SELECT DISTINCT ?item WHERE {{\n  {}\n}}'.format('\n  '.join(patterns))
+
+
+class SparqlBackend:
+    """
+    Evaluates preferences with one SPARQL query per request on owlready2's native (SQLite backed) SPARQL engine,
+    instead of building the candidate sets in Python. Prepared queries are cached per (domain, normalised expression,
+    health conditions) until the ontology version of the agent changes. Safe to share between the threads serving
+    requests: a query prepared by two threads at once is simply stored twice.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.prepared = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def query(self, agent, domain_name, preferences, health_conditions):
+        """
+        The SPARQL query text for a request
+        """
+        expression = preference_language.parse(preferences)
+        return SparqlTranslator(agent, domain_name).query(expression, sorted(health_conditions, key=iri))
+
+    def candidates(self, agent, domain_name, preferences, health_conditions):
+        """
+        The items of the domain matching the preferences and not excluded by the health conditions, in ID order like
+        the Python evaluator
+        """
+        key = (domain_name, preference_language.parse(preferences), frozenset(health_conditions))
+        with self.lock:
+            if self.version != agent.ontology_version:
+                self.prepared = {}
+                self.version = agent.ontology_version
+            prepared = self.prepared.get(key)
+            if prepared is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if prepared is None:
+            prepared = agent.world.prepare_sparql(self.query(agent, domain_name, preferences, health_conditions))
+            with self.lock:
+                self.prepared[key] = prepared
+        items = [row[0] for row in prepared.execute()]
+        return sorted(items, key=agent.interned.id_of)
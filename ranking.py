@@ -0,0 +1,44 @@
+import heapq
+
+# Orderings of the recommendation options (columns of a CandidateTable), best first. Restaurants used to be sorted by
+# utility and then (stable) by adhered preferences, which gives the same order as one sort on (adhered preferences,
+# utility).
+RESTAURANT_ORDER = ('adhered_prefs', 'utility')
+CLOTHING_ORDER = ('adhered_prefs', 'utility')
+TRAVEL_ORDER = ('adhered_prefs', 'utility')
+# When no option adheres to all preferences, the best option is the one with the highest utility. These used to be
+# stable sorts by utility of the lists ranked above, so ties are still broken by the orderings above.
+CLOTHING_UTILITY_ORDER = ('utility', 'adhered_prefs')
+TRAVEL_UTILITY_ORDER = ('utility', 'adhered_prefs')
+
+
+def top_k(options, k, key):
+    """
+    The best k options by key, in the same order (ties included) as sorted(options, key=key, reverse=True)[:k], but
+    with a heap of k options instead of sorting all of them. k=None ranks all options.
+    """
+    if k is None:
+        return sorted(options, key=key, reverse=True)
+    return heapq.nlargest(k, options, key=key)
+
+
+class Ranking:
+    """
+    The options of one request (a CandidateTable) with their ordering. Only the best options that are asked for are
+    ranked and turned into recommendations, the number of options found stays available through len.
+    """
+
+    def __init__(self, table, order):
+        self.table = table
+        self.order = order
+
+    def __len__(self):
+        return len(self.table) + self.table.pruned
+
+    def top(self, k, order=None):
+        """
+        The best k options as [state, utility, ...] records (see CandidateTable.record), by the ordering of the
+        ranking or by another ordering
+        """
+        rows = top_k(range(len(self.table)), k, self.table.sort_key(self.order if order is None else order))
+        return [self.table.record(row) for row in rows]
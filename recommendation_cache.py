@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Limits of a cache: number of entries, bytes of the entries (their json size) and seconds an entry is kept (None keeps
+# entries until they are evicted or the ontology changes)
+MAX_ENTRIES = 1024
+MAX_BYTES = 16 << 20
+TTL = None
+
+# Fields of the preferences whose order does not change the recommendations
+UNORDERED_FIELDS = ['symptoms']
+
+
+def normalised(value):
+    """
+    The value with the whitespace in its strings collapsed, nested lists and dictionaries included
+    """
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, list):
+        return [normalised(element) for element in value]
+    if isinstance(value, dict):
+        return {key: normalised(element) for key, element in value.items()}
+    return value
+
+
+def canonical_request(preferences):
+    """
+    Canonical form of the preferences of a request, as a string: keys in order, whitespace collapsed and the unordered
+    fields sorted. Requests with the same canonical form get the same recommendations.
+    """
+    preferences = normalised(preferences)
+    for field in UNORDERED_FIELDS:
+        if isinstance(preferences.get(field), list):
+            preferences[field] = sorted(preferences[field], key=json.dumps)
+    return json.dumps(preferences, sort_keys=True, separators=(',', ':'))
+
+
+def entry_size(key, value):
+    """
+    Bytes an entry is counted for: the size of its key and of its value as json
+    """
+    if hasattr(value, '_asdict'):
+        value = value._asdict()
+    return len(key) + len(json.dumps(value, default=str))
+
+
+class RecommendationCache:
+    """
+    Results of requests (batch_recommendations.RequestResult) by canonical_request, least recently used first. The
+    cache is bounded by its number of entries and their bytes, and entries can expire after ttl seconds. Every entry
+    is tagged with the ontology version of the agent it was computed with: all entries are dropped when the version
+    changes (after a delta), and results computed with an older version are not stored.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.version = None
+        # key -> (value, version, expires, size)
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # The cache can be shared by requests served from several threads
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def check_version(self, version):
+        if version != self.version:
+            self.invalidations += len(self.entries)
+            self.entries.clear()
+            self.bytes = 0
+            self.version = version
+
+    def remove(self, key):
+        value, version, expires, size = self.entries.pop(key)
+        self.bytes -= size
+
+    def get(self, key, version):
+        """
+        The cached value of a key for an ontology version, None when it is not cached (or no longer valid)
+        """
+        with self.lock:
+            return self.lookup(key, version)
+
+    def lookup(self, key, version):
+        self.check_version(version)
+        entry = self.entries.get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= self.clock():
+            self.remove(key)
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, version):
+        """
+        Stores the value of a key computed with an ontology version, evicting the least recently used entries beyond
+        the limits. Values of another version than the one of the last get (computed before a delta) and values
+        larger than the whole cache are not stored.
+        """
+        with self.lock:
+            return self.store(key, value, version)
+
+    def store(self, key, value, version):
+        if self.version is None:
+            self.check_version(version)
+        if version != self.version:
+            return False
+        size = entry_size(key, value)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return False
+        if key in self.entries:
+            self.remove(key)
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        self.entries[key] = (value, version, expires, size)
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+                    'evictions': self.evictions, 'expirations': self.expirations, 'invalidations': self.invalidations}
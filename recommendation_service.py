@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import batch_recommendations
+import group10_agent
+import instrumentation
+import recommendation_cache
+
+# Requests that are computed (or waiting for the executor) at the same time at most, further requests get a 503
+# answer until one of them is done. Identical requests waiting for the same computation only count once.
+MAX_PENDING = 64
+
+# Threads of the executor running find_states, all sharing the agent (every request has its own context)
+THREADS = 4
+
+# Longest request head (request line and headers) that is accepted
+MAX_HEAD = 1 << 16
+
+# Largest request body (the preferences) that is accepted
+MAX_BODY = 1 << 20
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           422: 'Unprocessable Entity', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def request_key(preferences):
+    """
+    Identical preferences (see recommendation_cache.canonical_request) give the same key, concurrent requests with the
+    same key share one computation
+    """
+    return recommendation_cache.canonical_request(preferences)
+
+
+class RecommendationService:
+    """
+    Long-running HTTP service around one EnvironmentalAgent, the ontology being loaded and reasoned once.
+    POST /recommendations with the preferences of a user (the json of the Users files) returns the ranked
+    recommendations as json (a batch_recommendations.RequestResult); GET /stats returns the counters of the service,
+    and GET /metrics the stages and counters of an instrumented agent in the Prometheus text format.
+    find_states runs on a pool of threads sharing the agent, so the event loop keeps accepting requests in the
+    meantime. Connections are kept alive between requests.
+    """
+
+    def __init__(self, agent, max_pending=MAX_PENDING, threads=THREADS):
+        self.agent = agent
+        self.max_pending = max_pending
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads, thread_name_prefix='find_states')
+        # Computations that are not done yet, by request key
+        self.pending = {}
+        self.stats = {'requests': 0, 'computed': 0, 'coalesced': 0, 'rejected': 0, 'errors': 0, 'connections': 0}
+
+    def find_states(self, preferences):
+        """
+        Runs one request on an executor thread, returns its batch_recommendations.RequestResult
+        """
+        return self.agent.find_states_many([batch_recommendations.Request('request', preferences)]).results[0]
+
+    async def recommend(self, preferences):
+        """
+        The result of a request as a dictionary. A request identical to one that is still being computed waits for
+        that computation instead of starting its own.
+        """
+        key = request_key(preferences)
+        future = self.pending.get(key)
+        coalesced = future is not None
+        if coalesced:
+            self.stats['coalesced'] += 1
+        else:
+            if len(self.pending) >= self.max_pending:
+                self.stats['rejected'] += 1
+                raise HttpError(503, 'Too many pending requests, try again later')
+            self.stats['computed'] += 1
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self.find_states, preferences)
+            self.pending[key] = future
+            future.add_done_callback(lambda done: self.pending.pop(key, None))
+        result = await asyncio.shield(future)
+        return dict(result._asdict(), coalesced=coalesced)
+
+    async def route(self, method, target, body):
+        """
+        Returns the status and the json payload of a request
+        """
+        path = target.split('?', 1)[0]
+        if path == '/recommendations':
+            if method != 'POST':
+                raise HttpError(405, 'Use POST with the preferences as json')
+            try:
+                preferences = json.loads(body)
+            except ValueError as error:
+                raise HttpError(400, 'Invalid json: {}'.format(error))
+            if not isinstance(preferences, dict):
+                raise HttpError(400, 'The preferences have to be a json object')
+            result = await self.recommend(preferences)
+            return (422 if result['error'] is not None else 200), result
+        if path == '/stats':
+            stats = dict(self.stats, pending=len(self.pending), ontology_version=self.agent.ontology_version)
+            if self.agent.result_cache is not None:
+                stats['cache'] = self.agent.result_cache.stats()
+            if self.agent.instrumentation is not None:
+                stats['instrumentation'] = self.agent.instrumentation.stats()
+            return 200, stats
+        if path == '/metrics':
+            if self.agent.instrumentation is None:
+                raise HttpError(404, 'The service was started without --metrics')
+            return 200, self.agent.instrumentation.prometheus(self.agent)
+        raise HttpError(404, 'Unknown path: {}'.format(path))
+
+    async def handle(self, reader, writer):
+        """
+        Serves the requests of one connection until the client closes it or asks for it to be closed
+        """
+        self.stats['connections'] += 1
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.respond(writer, 431, {'error': 'Request head too large'}, False)
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    await self.respond(writer, 400, {'error': 'Invalid request line'}, False)
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                try:
+                    length = int(headers.get('content-length', 0))
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # The end of the body is unknown, so the connection can not be used for another request
+                    await self.respond(writer, 400, {'error': 'Invalid Content-Length'}, False)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {'error': 'Request body larger than {} bytes'.format(MAX_BODY)},
+                                       False)
+                    break
+                try:
+                    body = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                self.stats['requests'] += 1
+                try:
+                    status, payload = await self.route(method, target, body)
+                except HttpError as error:
+                    self.stats['errors'] += 1
+                    status, payload = error.status, {'error': str(error)}
+                except Exception as error:
+                    self.stats['errors'] += 1
+                    status, payload = 500, {'error': '{}: {}'.format(type(error).__name__, error)}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        """
+        Writes a response, payload being json or already formatted text (the metrics)
+        """
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n'.format(
+            status, REASONS[status], content_type, len(body), 'keep-alive' if keep_alive else 'close')
+        if status == 503:
+            head += 'Retry-After: 1\r\n'
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def start(self, host='127.0.0.1', port=8010):
+        """
+        Starts listening, returns the asyncio server (port 0 picks a free port, see server.sockets)
+        """
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD)
+
+    async def serve(self, host='127.0.0.1', port=8010):
+        server = await self.start(host, port)
+        print('Serving recommendations on http://{}:{}/recommendations'.format(*server.sockets[0].getsockname()[:2]))
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+if __name__ == "__main__":
+    """
+    Runs the service until it is interrupted
+    """
+    parser = argparse.ArgumentParser(description="HTTP service for Group 10's environmental agent")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8010)
+    parser.add_argument('--snapshot-dir', default='.snapshots', help='directory for reasoned ontology snapshots')
+    parser.add_argument('--preference-backend', choices=['python', 'sparql'], default='python',
+                        help='evaluate pref_food/pref_clothing in Python or as a single SPARQL query')
+    parser.add_argument('--reasoner', choices=['hermit', 'rules'], default='hermit',
+                        help='reason the ontology with HermiT or materialise the inferences with Python rules')
+    parser.add_argument('--max-pending', type=int, default=MAX_PENDING,
+                        help='requests computed or waiting at the same time before new ones are turned away')
+    parser.add_argument('--threads', type=int, default=THREADS, help='threads running find_states')
+    parser.add_argument('--cache-entries', type=int, default=recommendation_cache.MAX_ENTRIES,
+                        help='results kept in the result cache (0 disables the cache)')
+    parser.add_argument('--cache-bytes', type=int, default=recommendation_cache.MAX_BYTES)
+    parser.add_argument('--cache-ttl', type=float, default=recommendation_cache.TTL,
+                        help='seconds a cached result is kept (by default until evicted or the ontology changes)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='time the stages of find_states, served as GET /metrics in the Prometheus text format')
+    args = parser.parse_args()
+
+    agent = group10_agent.EnvironmentalAgent("IAG_Group10_Ontology.owl", snapshot_dir=args.snapshot_dir,
+                                             preference_backend=args.preference_backend, reasoner=args.reasoner)
+    if args.cache_entries > 0:
+        agent.result_cache = recommendation_cache.RecommendationCache(args.cache_entries, args.cache_bytes,
+                                                                      args.cache_ttl)
+    if args.metrics:
+        agent.instrumentation = instrumentation.Instrumentation()
+    service = RecommendationService(agent, args.max_pending, args.threads)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
@@ -0,0 +1,73 @@
+from owlready2 import *
+
+# Properties the agent looks up in reverse (which subjects have this object as value)
+INDEXED_PROPERTIES = ['selling', 'serves', 'containsIngredient', 'containsMaterial', 'isForbiddenBy', 'hasSymptom']
+
+
+class ReverseIndex:
+    """
+    Maps (property, object) to the subjects that have the object as value for the property, for the properties the
+    agent queries in reverse. Built once with a single query per property, after which every lookup is a dictionary
+    access instead of an ontology.search over the quadstore. Like search, it includes the facts asserted through the
+    inverse property (availableIn for selling) and the inferred facts.
+    """
+
+    # The subjects of every object are kept in a dictionary (as an insertion ordered set), so that results come out
+    # in the order ontology.search would return them and updates are O(1)
+    def __init__(self, ontology, prop_names=INDEXED_PROPERTIES):
+        self.ontology = ontology
+        self.subjects_by_prop = {}
+        for name in prop_names:
+            prop = ontology[name]
+            if prop is None:
+                continue
+            subjects_by_object = self.subjects_by_prop[prop] = {}
+            for subject, value in prop.get_relations():
+                subjects_by_object.setdefault(value, {})[subject] = None
+
+    def subjects(self, prop_name, value):
+        """
+        The subjects having value for the property, like ontology.search(prop_name=value)
+        """
+        return list(self.subjects_by_prop[self.ontology[prop_name]].get(value, ()))
+
+    def subjects_of_any(self, prop_name, values):
+        """
+        The subjects having at least one of the values for the property
+        """
+        subjects_by_object = self.subjects_by_prop[self.ontology[prop_name]]
+        found = {}
+        for value in values:
+            found.update(subjects_by_object.get(value, {}))
+        return list(found)
+
+    def subjects_of_all(self, prop_name, values):
+        """
+        The subjects having every one of the values for the property, like ontology.search(prop_name=[...])
+        """
+        subjects_by_object = self.subjects_by_prop[self.ontology[prop_name]]
+        values = list(values)
+        if not values:
+            return []
+        found = list(subjects_by_object.get(values[0], ()))
+        for value in values[1:]:
+            others = subjects_by_object.get(value, {})
+            found = [subject for subject in found if subject in others]
+        return found
+
+    def update(self, delta_result):
+        """
+        Keeps the index in sync with a delta applied to the ontology (see incremental_reasoning). The facts of the
+        delta result include the inverse mirrors, so facts asserted through availableIn reach the selling entries, and
+        the facts of removed individuals, so they disappear both as subject and as object.
+        """
+        for subject, prop, value, added in delta_result.facts:
+            subjects_by_object = self.subjects_by_prop.get(prop)
+            if subjects_by_object is None:
+                continue
+            if added:
+                subjects_by_object.setdefault(value, {})[subject] = None
+            elif subject in subjects_by_object.get(value, {}):
+                del subjects_by_object[value][subject]
+                if not subjects_by_object[value]:
+                    del subjects_by_object[value]
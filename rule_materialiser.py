@@ -0,0 +1,227 @@
+import argparse
+import json
+import os
+import time
+from collections import namedtuple
+from owlready2 import *
+
+# What a materialisation added: the links of the closures of transitive properties, the types of individuals
+# following from the domain and range of their properties, the memberships of defined classes, the number of passes
+# it took and whether the last pass added nothing (the fixpoint was reached)
+Materialised = namedtuple('Materialised', ['transitive', 'typed', 'defined', 'passes', 'converged'])
+
+
+class NotConverged(Exception):
+    """
+    Raised when the rules still add facts after the most passes a materialisation may take, the inferred facts are
+    then incomplete
+    """
+
+    def __init__(self, materialised):
+        super().__init__('The rules still added facts after {} passes'.format(materialised.passes))
+        self.materialised = materialised
+
+
+def transitive_closure(world, inferences, prop):
+    """
+    Appends the links of the closure of a transitive property that are not asserted yet to the inferences ontology,
+    after the asserted ones like the reasoner does (so the first value stays the asserted, most specific one).
+    Returns the number of links added.
+    """
+    direct = {}
+    for subject, _, target in world._get_obj_triples_spo_spo(None, prop.storid, None):
+        direct.setdefault(subject, []).append(target)
+    added = 0
+    with inferences:
+        for subject_storid, asserted in direct.items():
+            seen = set(asserted) | {subject_storid}
+            closure = []
+            queue = list(asserted)
+            while queue:
+                current = queue.pop(0)
+                for target in direct.get(current, []):
+                    if target not in seen:
+                        seen.add(target)
+                        closure.append(target)
+                        queue.append(target)
+            if not closure:
+                continue
+            subject = world._get_by_storid(subject_storid)
+            values = getattr(subject, prop.python_name)
+            for target in closure:
+                values.append(world._get_by_storid(target))
+            added += len(closure)
+    return added
+
+
+def typing_classes(prop):
+    """
+    The classes the subjects (domain) and objects (range) of a property are instances of: the domains and ranges of
+    the property and its super properties, and those of its inverse the other way around
+    """
+    domains = []
+    ranges = []
+    for ancestor in prop.ancestors():
+        if isinstance(ancestor, PropertyClass):
+            domains.extend(ancestor.domain)
+            ranges.extend(ancestor.range)
+    inverse = getattr(prop, 'inverse_property', None)
+    if inverse is not None:
+        domains.extend(inverse.range)
+        ranges.extend(inverse.domain)
+    return ([cls for cls in domains if isinstance(cls, ThingClass)],
+            [cls for cls in ranges if isinstance(cls, ThingClass)])
+
+
+def add_types(inferences, individual, classes):
+    """
+    Adds the classes the individual is not yet known to be an instance of to its types, the most specific ones first
+    so that the classes they imply are not added as well. Returns the number of types added.
+    """
+    added = 0
+    with inferences:
+        for cls in sorted(set(classes), key=lambda cls: -len(cls.ancestors())):
+            if not isinstance(individual, cls):
+                individual.is_a.append(cls)
+                added += 1
+    return added
+
+
+def satisfies(individual, definition):
+    """
+    Whether the facts about an individual show it belongs to a class expression. Only what can be proven from the
+    facts at hand is considered (named classes, intersections, unions, some and value restrictions); universal and
+    cardinality restrictions can not be proven without closing the world, so they never hold.
+    """
+    if isinstance(definition, ThingClass):
+        return isinstance(individual, definition)
+    if isinstance(definition, And):
+        return all(satisfies(individual, part) for part in definition.Classes)
+    if isinstance(definition, Or):
+        return any(satisfies(individual, part) for part in definition.Classes)
+    if isinstance(definition, Restriction) and isinstance(definition.property, PropertyClass):
+        values = definition.property[individual]
+        if definition.type == SOME:
+            if isinstance(definition.value, (ThingClass, And, Or, Restriction)):
+                return any(satisfies(value, definition.value) for value in values if isinstance(value, Thing))
+            return len(values) > 0
+        if definition.type == VALUE:
+            return definition.value in values
+    return False
+
+
+def materialise(world, inferences, ontology=None, max_passes=None):
+    """
+    Materialises the inferences the agent relies on into the inferences ontology, without running a reasoner:
+    - the closures of transitive properties (isLocatedIn)
+    - the types following from the domains and ranges of the property assertions (an individual only asserted as a
+      Thing that lives somewhere is a Person)
+    - the membership of defined classes (classes equivalent to a class expression, see satisfies)
+    The rules are applied until none of them adds anything; as they only ever add facts, that point is always
+    reached. With max_passes, NotConverged is raised when the last allowed pass still added facts. Inverse
+    (availableIn/selling, ...) and symmetric (adjacentTo) links are not stored, owlready2 resolves them on access, as
+    it does after running the reasoner.
+    """
+    ontologies = [ontology] if ontology is not None else [onto for onto in world.ontologies.values()
+                                                           if onto is not inferences]
+    transitive = [prop for onto in ontologies for prop in onto.object_properties() if TransitiveProperty in prop.is_a]
+    properties = [prop for onto in ontologies for prop in onto.properties()]
+    typing = {prop: typing_classes(prop) for prop in properties}
+    defined = [cls for onto in ontologies for cls in onto.classes() if cls.equivalent_to]
+    counts = {'transitive': 0, 'typed': 0, 'defined': 0}
+    passes = 0
+    added = None
+    while added != 0 and (max_passes is None or passes < max_passes):
+        passes += 1
+        added = 0
+        for prop in transitive:
+            added += transitive_closure(world, inferences, prop)
+        counts['transitive'] += added
+        individuals = [individual for onto in ontologies for individual in onto.individuals()]
+        for individual in individuals:
+            for prop in individual.get_properties():
+                domains, ranges = typing.get(prop, ([], []))
+                typed = add_types(inferences, individual, domains)
+                if ranges and isinstance(prop, ObjectPropertyClass):
+                    for value in prop[individual]:
+                        if isinstance(value, Thing):
+                            typed += add_types(inferences, value, ranges)
+                counts['typed'] += typed
+                added += typed
+            for cls in defined:
+                if not isinstance(individual, cls) and any(satisfies(individual, definition)
+                                                           for definition in cls.equivalent_to):
+                    counts['defined'] += add_types(inferences, individual, [cls])
+                    added += 1
+        # The closures are complete after the first pass, further passes only follow new types
+        transitive = []
+    materialised = Materialised(counts['transitive'], counts['typed'], counts['defined'], passes, added == 0)
+    if not materialised.converged:
+        raise NotConverged(materialised)
+    return materialised
+
+
+def entailed_facts(ontology):
+    """
+    What the agent sees of a reasoned ontology, as (subject, predicate, object) names: the classes of every
+    individual, and the values of every property as owlready2 returns them (inverse and symmetric links included).
+    Only classes of the ontology are considered, the error classes HermiT adds for axioms the OWL API can not parse
+    are left out.
+    """
+    classes = set(ontology.classes())
+    facts = set()
+    for individual in ontology.individuals():
+        for cls in individual.INDIRECT_is_a:
+            if cls in classes:
+                facts.add((individual.name, 'type', cls.name))
+        for prop in ontology.properties():
+            if isinstance(prop, AnnotationPropertyClass):
+                continue
+            for value in prop[individual]:
+                facts.add((individual.name, prop.name, value.name if isinstance(value, Thing) else repr(value)))
+    return facts
+
+
+def compare_facts(expected, actual):
+    """
+    The facts only the reasoner (missing) or only the rules (extra) entail, by predicate
+    """
+    differences = {'missing': {}, 'extra': {}}
+    for kind, facts in [('missing', expected - actual), ('extra', actual - expected)]:
+        for subject, predicate, value in sorted(facts):
+            differences[kind].setdefault(predicate, []).append([subject, value])
+    return differences
+
+
+def check(path):
+    """
+    Reasons the ontology file with HermiT and with the rules, each in a world of its own, and compares the facts they
+    entail (see entailed_facts). Returns the time both took and the differences.
+    """
+    import ontology_snapshot
+    report = {}
+    facts = {}
+    for name, settings in ontology_snapshot.REASONERS.items():
+        world = World()
+        ontology = world.get_ontology(os.path.abspath(path)).load()
+        start = time.perf_counter()
+        ontology_snapshot.run_reasoner(world, settings)
+        report['{}_seconds'.format(name)] = round(time.perf_counter() - start, 3)
+        facts[name] = entailed_facts(ontology)
+        world.close()
+    differences = compare_facts(facts['hermit'], facts['rules'])
+    report['facts'] = len(facts['hermit'])
+    report['missing'] = sum(len(pairs) for pairs in differences['missing'].values())
+    report['extra'] = sum(len(pairs) for pairs in differences['extra'].values())
+    report['differences'] = differences
+    return report
+
+
+if __name__ == "__main__":
+    """
+    Checks the rules against HermiT on an ontology file
+    """
+    parser = argparse.ArgumentParser(description='Compare the rule materialiser with HermiT')
+    parser.add_argument('path', nargs='?', default='IAG_Group10_Ontology.owl', help='the ontology file')
+    args = parser.parse_args()
+    print(json.dumps(check(args.path), indent=2))
@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import random
+from collections import namedtuple
+from owlready2 import *
+import batch_recommendations
+
+BASE_ONTOLOGY = "IAG_Group10_Ontology.owl"
+SEED = 10
+
+# The kinds of individuals the generator adds, with the class their individuals belong to (users are the individuals
+# that live in a neighborhood, not all of them are asserted to be a Person; a Neighborhood is a City too, cities are
+# the cities that are not a neighborhood)
+KIND_CLASSES = {'cities': 'City', 'neighborhoods': 'Neighborhood', 'restaurants': 'Restaurant', 'recipes': 'Recipe',
+                'ingredients': 'Ingredient', 'clothing_items': 'Clothing', 'stores': 'ClothingStore',
+                'vehicles': 'PrivateTransportation', 'users': None}
+KINDS = list(KIND_CLASSES)
+
+# Charging spots of every generated neighborhood (an electric car that is not charged needs one near it)
+CHARGING_SPOTS = 2
+
+# Minutes a generated bike takes to the nearest train station, when its template does not say (the agent needs it for
+# trips by train from a neighborhood without a station)
+STATION_MINUTES = (5, 20)
+
+# Trains between neighboring cities of the generated chain of cities
+TRAIN_DISTANCE = 40
+TRAIN_CO2_PER_KM = 0.037
+
+# A generated ontology:
+# - path: the .owl file it was saved to
+# - counts: the number of individuals of every kind (shipped and generated)
+# - users: (user label, home neighborhood label) of the generated users
+# - cities, neighborhoods: the labels of all cities and of all neighborhoods located in a city
+Synthetic = namedtuple('Synthetic', ['path', 'counts', 'users', 'cities', 'neighborhoods'])
+
+
+def individuals(ontology, kind):
+    """
+    The individuals of a kind (see KIND_CLASSES) in an ontology, in a fixed order
+    """
+    if KIND_CLASSES[kind] is None:
+        found = ontology.search(livesIn='*')
+    else:
+        found = getattr(ontology, KIND_CLASSES[kind]).instances()
+    if kind == 'cities':
+        found = [city for city in found if not isinstance(city, ontology.Neighborhood)]
+    return sorted(set(found), key=lambda individual: individual.name)
+
+
+def base_counts(base=BASE_ONTOLOGY):
+    """
+    The number of individuals of every kind in an ontology file (the counts at scale 1)
+    """
+    world = World()
+    ontology = world.get_ontology(os.path.abspath(base)).load()
+    counts = {kind: len(individuals(ontology, kind)) for kind in KINDS}
+    world.close()
+    return counts
+
+
+def scaled_counts(scale, base=BASE_ONTOLOGY):
+    """
+    The counts of every kind scale times the counts of the base ontology
+    """
+    return {kind: count * scale for kind, count in base_counts(base).items()}
+
+
+def copy_values(individual, template, properties):
+    """
+    Gives an individual the values of a template individual for the named properties, and all its data properties
+    """
+    for prop in template.get_properties():
+        if isinstance(prop, DataPropertyClass) or prop.python_name in properties:
+            setattr(individual, prop.python_name, list(prop[template]))
+
+
+class Generator:
+    """
+    Adds generated individuals to a loaded ontology, following the layout of the shipped individuals: every generated
+    individual copies the class, the data properties and the fixed vocabulary (cuisine, origin, materials, health
+    conditions, ...) of a shipped individual of the same kind (its template), while where it is and what it is
+    linked to (neighborhoods, recipes, ingredients, stores, owners) is drawn from all individuals, generated ones
+    included.
+    """
+
+    def __init__(self, ontology, seed=SEED, prefix='Gen'):
+        self.ontology = ontology
+        self.random = random.Random(seed)
+        self.prefix = prefix
+        self.templates = {kind: individuals(ontology, kind) for kind in KINDS}
+        self.all = {kind: list(found) for kind, found in self.templates.items()}
+        self.generated = {kind: [] for kind in KINDS}
+
+    def new(self, kind, cls, index, template=None, properties=()):
+        name = '{}{}{}'.format(self.prefix, cls.name, index)
+        individual = cls(name, namespace=self.ontology, label=['{} {} {}'.format(self.prefix, cls.name, index)])
+        if template is not None:
+            copy_values(individual, template, properties)
+        if kind is not None:
+            self.all[kind].append(individual)
+            self.generated[kind].append(individual)
+        return individual
+
+    def template(self, kind, index):
+        templates = self.templates[kind]
+        return templates[index % len(templates)]
+
+    def located_neighborhoods(self):
+        return [neighborhood for neighborhood in self.all['neighborhoods'] if neighborhood.isLocatedIn]
+
+    def add(self, counts):
+        """
+        Adds individuals until every kind has the number of individuals of counts (kinds that already have as many
+        are left alone)
+        """
+        missing = {kind: max(0, counts.get(kind, 0) - len(self.all[kind])) for kind in KINDS}
+        self.add_cities(missing['cities'])
+        self.add_neighborhoods(missing['neighborhoods'])
+        self.add_stations_and_trains()
+        self.add_ingredients(missing['ingredients'])
+        self.add_recipes(missing['recipes'])
+        self.add_restaurants(missing['restaurants'])
+        self.add_stores(missing['stores'])
+        self.add_clothing_items(missing['clothing_items'])
+        self.add_users(missing['users'])
+        self.add_vehicles(missing['vehicles'])
+
+    def add_cities(self, count):
+        for index in range(count):
+            self.new('cities', self.ontology.City, index)
+
+    def add_neighborhoods(self, count):
+        """
+        New neighborhoods go to the new cities first, then to all cities in turn, each adjacent to the previous new
+        neighborhood of its city and with its own charging spots
+        """
+        cities = self.generated['cities'] + self.templates['cities']
+        previous = {}
+        for index in range(count):
+            city = cities[index % len(cities)]
+            neighborhood = self.new('neighborhoods', self.ontology.Neighborhood, index)
+            neighborhood.isLocatedIn = [city]
+            neighborhood.hasPopulation = [self.random.randint(5000, 150000)]
+            neighborhood.hasArea = [self.random.randint(100000, 30000000)]
+            if city in previous:
+                neighborhood.adjacentTo = [previous[city]]
+            previous[city] = neighborhood
+            for spot in range(CHARGING_SPOTS):
+                charging_spot = self.new(None, self.ontology.ChargingSpot, index * CHARGING_SPOTS + spot)
+                charging_spot.isLocatedIn = [neighborhood]
+                neighborhood.hasChargingSpot.append(charging_spot)
+
+    def add_stations_and_trains(self):
+        """
+        Gives every new city a train station in its first neighborhood and connects it with trains (both ways) to
+        the city before it, so all cities form one network
+        """
+        cities = self.templates['cities'] + self.generated['cities']
+        first_neighborhood = {}
+        for neighborhood in self.generated['neighborhoods']:
+            first_neighborhood.setdefault(neighborhood.isLocatedIn[0], neighborhood)
+        for index, city in enumerate(self.generated['cities']):
+            if city in first_neighborhood:
+                station = self.new(None, self.ontology.TrainStation, index)
+                station.isLocatedIn = [first_neighborhood[city]]
+                city.hasTrainStation = [station]
+            previous = cities[len(self.templates['cities']) + index - 1]
+            for origin, destination in [(previous, city), (city, previous)]:
+                train = self.ontology.Train('{}TrainFrom{}To{}'.format(self.prefix, origin.name, destination.name),
+                                            namespace=self.ontology,
+                                            label=['Train From {} To {}'.format(origin.label[0], destination.label[0])])
+                train.travelDistance = [TRAIN_DISTANCE]
+                train.emitsCO2PerKm = [TRAIN_CO2_PER_KM]
+                train.hasCO2score = [2]
+
+    def add_ingredients(self, count):
+        for index in range(count):
+            template = self.template('ingredients', index)
+            self.new('ingredients', template.is_a[0], index, template, ['isForbiddenBy'])
+
+    def add_recipes(self, count):
+        """
+        Every ingredient of the template recipe is replaced by an ingredient of the same class: the recipe classes
+        restrict the number of ingredients and the ingredient classes are disjoint, so ingredients drawn from any class
+        could make the ontology inconsistent
+        """
+        by_class = {}
+        for ingredient in self.all['ingredients']:
+            by_class.setdefault(ingredient.is_a[0], []).append(ingredient)
+        for index in range(count):
+            template = self.template('recipes', index)
+            recipe = self.new('recipes', template.is_a[0], index, template, ['isFromCuisine'])
+            recipe.containsIngredient = [self.random.choice(by_class[ingredient.is_a[0]])
+                                         for ingredient in template.containsIngredient]
+
+    def add_restaurants(self, count):
+        """
+        Restaurants serve one to three recipes of their cuisine
+        """
+        by_cuisine = {}
+        for recipe in self.all['recipes']:
+            for cuisine in recipe.isFromCuisine:
+                by_cuisine.setdefault(cuisine, []).append(recipe)
+        neighborhoods = self.located_neighborhoods()
+        for index in range(count):
+            template = self.template('restaurants', index)
+            restaurant = self.new('restaurants', self.ontology.Restaurant, index, template, ['hasCuisine'])
+            restaurant.isLocatedIn = [self.random.choice(neighborhoods)]
+            recipes = by_cuisine.get(restaurant.hasCuisine[0], self.all['recipes']) if restaurant.hasCuisine else \
+                self.all['recipes']
+            restaurant.serves = self.random.sample(recipes, min(len(recipes), self.random.randint(1, 3)))
+
+    def add_stores(self, count):
+        neighborhoods = self.located_neighborhoods()
+        for index in range(count):
+            store = self.new('stores', self.ontology.ClothingStore, index)
+            store.isLocatedIn = [self.random.choice(neighborhoods)]
+
+    def add_clothing_items(self, count):
+        for index in range(count):
+            template = self.template('clothing_items', index)
+            item = self.new('clothing_items', template.is_a[0], index, template, ['hasOrigin', 'containsMaterial'])
+            item.hasPriceEur = [self.random.randint(5, 150)]
+            item.availableIn = [self.random.choice(self.all['stores'])]
+
+    def add_users(self, count):
+        neighborhoods = self.located_neighborhoods()
+        for index in range(count):
+            template = self.template('users', index)
+            user = self.new('users', self.ontology.Person, index, template, ['hasHealthCondition', 'ownsAtHome'])
+            user.livesIn = [self.random.choice(neighborhoods)]
+
+    def add_vehicles(self, count):
+        """
+        Vehicles belong to the users in turn (generated users first) and are parked where their owner lives
+        """
+        owners = self.generated['users'] + self.templates['users']
+        for index in range(count):
+            template = self.template('vehicles', index)
+            vehicle = self.new('vehicles', template.is_a[0], index, template)
+            owner = owners[index % len(owners)]
+            vehicle.hasOwner = [owner]
+            vehicle.isLocatedIn = [owner.livesIn[0]]
+            if isinstance(vehicle, self.ontology.Bike) and not vehicle.travelTimeToNearestTrainStation:
+                vehicle.travelTimeToNearestTrainStation = [self.random.randint(*STATION_MINUTES)]
+
+
+def generate(path, counts, base=BASE_ONTOLOGY, seed=SEED):
+    """
+    Writes an ontology with the individuals of the base ontology plus generated ones up to counts (a number per kind,
+    see scaled_counts) to path, returns a Synthetic. The same counts and seed always give the same ontology.
+    """
+    world = World()
+    ontology = world.get_ontology(os.path.abspath(base)).load()
+    generator = Generator(ontology, seed)
+    with ontology:
+        generator.add(counts)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    ontology.save(file=path, format='rdfxml')
+    synthetic = Synthetic(path, {kind: len(found) for kind, found in generator.all.items()},
+                          [(user.label[0], user.livesIn[0].label[0]) for user in generator.generated['users']],
+                          [city.label[0] for city in generator.all['cities']],
+                          [neighborhood.label[0] for neighborhood in generator.located_neighborhoods()])
+    world.close()
+    return synthetic
+
+
+def synthetic_requests(synthetic, templates, count, seed=SEED):
+    """
+    count requests (batch_recommendations.Request) of the generated users, each following a template request (a
+    request of the Users files) in turn: the same activity and preferences, from the home of the user and with a
+    preferred location drawn from the generated ontology (a neighborhood for transportation, a city otherwise).
+    Without generated users the template requests are used as they are.
+    """
+    generator = random.Random(seed)
+    requests = []
+    for index in range(count):
+        template = templates[index % len(templates)]
+        preferences = dict(template.preferences)
+        if synthetic.users:
+            user, home = synthetic.users[index % len(synthetic.users)]
+            preferences['user'] = user
+            preferences['current_location'] = home
+            if preferences.get('pref_location'):
+                labels = synthetic.neighborhoods if preferences.get('activity') == 'Transportation' else \
+                    synthetic.cities
+                preferences['pref_location'] = [generator.choice(labels)]
+        name = '{}-{}.json'.format(preferences['user'].lower().replace(' ', '_'), index)
+        requests.append(batch_recommendations.Request(name, preferences))
+    return requests
+
+
+def write_requests(requests, directory):
+    """
+    Writes every request as a user json file (named after the request) into directory
+    """
+    os.makedirs(directory, exist_ok=True)
+    for request in requests:
+        with open(os.path.join(directory, request.name), 'w') as openfile:
+            json.dump(request.preferences, openfile, indent=2)
+
+
+if __name__ == "__main__":
+    """
+    Writes a generated ontology, and optionally requests of its users
+    """
+    parser = argparse.ArgumentParser(description="Synthetic ontologies for Group 10's environmental agent")
+    parser.add_argument('output', help='the .owl file to write')
+    parser.add_argument('--scale', type=int, default=10, help='times the number of individuals of the base ontology')
+    for kind in KINDS:
+        parser.add_argument('--{}'.format(kind.replace('_', '-')), type=int, help='number of {} (instead of scale '
+                            'times the base ontology)'.format(kind.replace('_', ' ')))
+    parser.add_argument('--base', default=BASE_ONTOLOGY)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--users-dir', help='directory to write user json files for the generated users to')
+    parser.add_argument('--requests', type=int, default=100, help='number of user files written to --users-dir')
+    args = parser.parse_args()
+
+    counts = scaled_counts(args.scale, args.base)
+    for kind in KINDS:
+        if getattr(args, kind) is not None:
+            counts[kind] = getattr(args, kind)
+    synthetic = generate(args.output, counts, args.base, args.seed)
+    print('Wrote {}: {}'.format(args.output, '  '.join('{} {}'.format(kind, count)
+                                                         for kind, count in synthetic.counts.items())))
+    if args.users_dir is not None:
+        templates = [request for request in batch_recommendations.load_requests(['./Users'])
+                     if 'activity' in request.preferences]
+        write_requests(synthetic_requests(synthetic, templates, args.requests, args.seed), args.users_dir)
+        print('Wrote {} user files to {}'.format(args.requests, args.users_dir))
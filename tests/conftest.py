@@ -0,0 +1,31 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import batch_recommendations
+import group10_agent
+
+ONTOLOGY_PATH = os.path.join(ROOT, 'IAG_Group10_Ontology.owl')
+USERS_PATH = os.path.join(ROOT, 'Users')
+
+
+@pytest.fixture(scope='session')
+def agent(tmp_path_factory):
+    """
+    One agent on the shipped ontology, reasoned with HermiT, for all tests
+    """
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=str(tmp_path_factory.mktemp('snapshots')))
+    yield agent
+    agent.world.close()
+
+
+@pytest.fixture(scope='session')
+def users():
+    """
+    The preferences of the shipped users, by file name (without .json)
+    """
+    return {os.path.splitext(os.path.basename(request.name))[0]: request.preferences
+            for request in batch_recommendations.load_requests([USERS_PATH])}
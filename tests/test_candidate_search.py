@@ -0,0 +1,80 @@
+import random
+import pytest
+import candidate_search
+import group10_agent
+import ranking
+
+
+def random_branches(generator, count):
+    """
+    Branches of up to five candidates with random keys, each bounded by the best key of its candidates
+    """
+    branches = []
+    position = 0
+    for _ in range(count):
+        pairs = [((generator.randint(0, 3), generator.randint(0, 20)), 'candidate{}'.format(position + index))
+                 for index in range(generator.randint(0, 5))]
+        bound = max(key for key, _ in pairs) if pairs else (0, 0)
+        branches.append(candidate_search.Branch(position, bound, len(pairs), lambda pairs=pairs: iter(pairs)))
+        position += len(pairs)
+    return branches
+
+
+def best(found, k):
+    # Highest key first, ties to the earlier position, like the stable sort of the ranking
+    return sorted(found, key=lambda entry: (candidate_search.negated(entry[1]), entry[0]))[:k]
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('k', [0, 1, 3, 10])
+def test_search_finds_the_exhaustive_top_k(seed, k):
+    branches = random_branches(random.Random(seed), 30)
+    exhaustive = list(candidate_search.search(branches, None))
+    assert len(exhaustive) == sum(branch.size for branch in branches)
+    stats = candidate_search.SearchStats()
+    found = list(candidate_search.search(branches, k, stats))
+    assert best(found, k) == best(exhaustive, k)
+    assert stats.expanded_candidates == len(found)
+    assert stats.expanded_candidates + stats.pruned_candidates == stats.candidates
+
+
+def test_search_prunes_branches_that_can_not_get_in():
+    branches = [candidate_search.Branch(0, (1, 5), 2, lambda: iter([((1, 5), 'a'), ((1, 4), 'b')])),
+                candidate_search.Branch(2, (0, 9), 1, lambda: iter([((0, 9), 'c')])),
+                candidate_search.Branch(3, (1, 5), 1, lambda: iter([((1, 5), 'd')]))]
+    stats = candidate_search.SearchStats()
+    found = list(candidate_search.search(branches, 2, stats))
+    assert [candidate for _, _, candidate in best(found, 2)] == ['a', 'd']
+    assert stats.pruned_branches == 1
+    assert stats.pruned_candidates == 1
+
+
+def restaurant_options(agent, preferences, k):
+    """
+    The number of restaurant options and the best ones, as (food, restaurant, utility), created with the search for
+    the best k (or every candidate with k=None)
+    """
+    health_cond = agent.infer_health_cond(preferences['symptoms'], preferences['user'])
+    recipe_restaurants = agent.infer_recipes(preferences['pref_food'], health_cond)
+    if not recipe_restaurants:
+        relaxation = agent.relax_preferences('food', preferences['pref_food'], health_cond)
+        recipe_restaurants = agent.infer_recipes(relaxation.kept, health_cond)
+    current_location = agent.get_user_location(preferences['current_location'], preferences['user'])
+    table = agent.create_restaurant_recommendations(recipe_restaurants, current_location,
+                                                    group10_agent.RequestContext(preferences), k=k)
+    options = ranking.Ranking(table, ranking.RESTAURANT_ORDER)
+    return len(options), [(option[0].food.name, option[0].restaurant.name, option[1])
+                          for option in options.top(group10_agent.RESTAURANTS_SHOWN)]
+
+
+@pytest.mark.parametrize('name, count, restaurants', [
+    ('michelle', 15, ["Renato'sOsteria"]),
+    ('sophie', 10, ['ShisoSushi', "Renato'sOsteria", 'SushiKoi']),
+    ('isaac', 13, ['SushiKoi', 'SushiKoi', 'BellaItalia']),
+])
+def test_search_shows_the_options_of_every_candidate(agent, users, name, count, restaurants):
+    exhaustive = restaurant_options(agent, users[name], None)
+    searched = restaurant_options(agent, users[name], group10_agent.RESTAURANTS_SHOWN)
+    assert searched == exhaustive
+    assert exhaustive[0] == count
+    assert [restaurant for _, restaurant, _ in exhaustive[1]][:len(restaurants)] == restaurants
@@ -0,0 +1,35 @@
+import concurrent.futures
+import pytest
+import batch_recommendations
+import group10_agent
+from benchmark import comparable
+from conftest import ONTOLOGY_PATH, USERS_PATH
+
+COPIES = 8
+THREADS = 8
+
+
+@pytest.mark.parametrize('preference_backend', ['python', 'sparql'])
+def test_threads_give_the_serial_results(tmp_path, preference_backend):
+    """
+    Many requests served at the same time by one agent whose lazy caches (plans, prepared queries, health
+    exclusions, routes and train trees) start out empty give the same results as run one after the other
+    """
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=str(tmp_path),
+                                             preference_backend=preference_backend)
+    agent.health_exclusions.table = {}
+    agent.travel_matrix.routes = {}
+    agent.travel_matrix.network = None
+    requests = batch_recommendations.load_requests([USERS_PATH]) * COPIES
+
+    def run(request):
+        return agent.find_states_many([request], share=False).results[0]
+
+    with concurrent.futures.ThreadPoolExecutor(THREADS) as executor:
+        results = list(executor.map(run, requests))
+    serial = [run(request) for request in requests]
+    assert [comparable(result) for result in results] == [comparable(result) for result in serial]
+    # charly.json has no activity, its KeyError is part of the expected output
+    assert [result.error is None for result in serial] == [not result.name.endswith('charly.json') for result in serial]
+    assert agent.travel_matrix.network.hits + agent.travel_matrix.network.misses > 0
+    agent.world.close()
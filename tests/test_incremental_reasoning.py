@@ -0,0 +1,84 @@
+import os
+import pytest
+from owlready2 import World
+import batch_recommendations
+import group10_agent
+import incremental_reasoning
+import ranking
+from conftest import ONTOLOGY_PATH, USERS_PATH
+
+
+def restaurant_options(agent, preferences):
+    """
+    Every restaurant option of a request as (utility, food, restaurant, transportation), in a fixed order: how ties
+    are ordered depends on the order of the individuals in the ontology file
+    """
+    health_cond = agent.infer_health_cond(preferences['symptoms'], preferences['user'])
+    recipe_restaurants = agent.infer_recipes(preferences['pref_food'], health_cond)
+    if not recipe_restaurants:
+        relaxation = agent.relax_preferences('food', preferences['pref_food'], health_cond)
+        recipe_restaurants = agent.infer_recipes(relaxation.kept, health_cond)
+    current_location = agent.get_user_location(preferences['current_location'], preferences['user'])
+    table = agent.create_restaurant_recommendations(recipe_restaurants, current_location,
+                                                    group10_agent.RequestContext(preferences))
+    options = ranking.Ranking(table, ranking.RESTAURANT_ORDER)
+    return sorted((round(option[1], 9), option[0].food.name, option[0].restaurant.name, str(option[0].transportation))
+                  for option in options.top(len(options)))
+
+
+@pytest.fixture(scope='module')
+def moved(tmp_path_factory):
+    """
+    An agent on the shipped ontology after moving Sushi Koi from Binnenstad to Lombok with a delta, and what the
+    delta changed
+    """
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=str(tmp_path_factory.mktemp('snapshots')))
+    restaurant = agent.ontology.SushiKoi
+    result = agent.apply_delta(incremental_reasoning.OntologyDelta()
+                               .remove(restaurant, 'isLocatedIn', agent.ontology.Binnenstad)
+                               .add(restaurant, 'isLocatedIn', agent.ontology.Lombok))
+    yield agent, result
+    agent.world.close()
+
+
+@pytest.fixture(scope='module')
+def reasoned(tmp_path_factory):
+    """
+    An agent on a copy of the ontology file in which Sushi Koi is asserted to be in Lombok, reasoned from scratch
+    """
+    directory = tmp_path_factory.mktemp('moved')
+    world = World()
+    ontology = world.get_ontology(ONTOLOGY_PATH).load()
+    ontology.SushiKoi.isLocatedIn.remove(ontology.Binnenstad)
+    ontology.SushiKoi.isLocatedIn.append(ontology.Lombok)
+    path = str(directory / 'moved.owl')
+    ontology.save(path)
+    world.close()
+    agent = group10_agent.EnvironmentalAgent(path, snapshot_dir=str(directory))
+    yield agent
+    agent.world.close()
+
+
+def test_moved_restaurant_keeps_its_neighborhood_first(moved):
+    agent, result = moved
+    assert agent.ontology.SushiKoi.isLocatedIn == [agent.ontology.Lombok, agent.ontology.Utrecht]
+    assert (result.added, result.removed) == (1, 1)
+    # Utrecht stays inferred, it only moves behind the new neighborhood
+    assert (result.inferred_added, result.inferred_removed) == (0, 0)
+    assert result.subjects_reordered == 1
+
+
+def test_moved_restaurant_is_recommended_as_if_reasoned_again(moved, reasoned, users):
+    agent, _ = moved
+    assert restaurant_options(agent, users['isaac']) == restaurant_options(reasoned, users['isaac'])
+
+
+def test_moved_restaurant_output(moved):
+    agent, _ = moved
+    batch = agent.find_states_many(batch_recommendations.load_requests([os.path.join(USERS_PATH, 'isaac.json')]))
+    result = batch.results[0]
+    assert result.error is None
+    assert 'For your entered preferences, 13 recommendations were found.' in result.output
+    assert 'Sushi Koi is located in the neighborhood of Lombok in Utrecht.' in result.output
+    assert {field: result.top[0][field] for field in ['restaurant', 'food', 'transportation', 'duration']} == {
+        'restaurant': 'Sushi Koi', 'food': 'Vegetable Sushi', 'transportation': 'Public Transport', 'duration': 15}
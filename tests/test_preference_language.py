@@ -0,0 +1,48 @@
+import pytest
+import preference_language
+from preference_language import And, Contains, Instances, MaxPrice, Not, Or
+
+A = Instances('A')
+B = Instances('B')
+C = Instances('C')
+
+
+def test_list_or_binds_tighter_than_the_list_and():
+    assert preference_language.parse(['A', 'B', 'or', 'C']) == And(frozenset([A, Or(frozenset([B, C]))]))
+    assert preference_language.parse(['A', 'or', 'B', 'C']) == And(frozenset([Or(frozenset([A, B])), C]))
+
+
+def test_or_inside_an_entry_gives_alternatives():
+    assert preference_language.parse(['A or B']) == Or(frozenset([A, B]))
+    assert preference_language.parse(['A or B', 'C']) == preference_language.parse(['A', 'or', 'B', 'C'])
+    assert preference_language.parse(['maxprice 10 or not ingredient some Fish']) == Or(frozenset(
+        [MaxPrice(10.0), Not(Contains('Fish', True))]))
+
+
+@pytest.mark.parametrize('preferences', [['A', 'or'], ['A or'], ['or', 'A'], ['or A'], ['A', 'or', ' ']])
+def test_dangling_or_is_ignored(preferences):
+    assert preference_language.parse(preferences) == A
+
+
+def test_order_and_repetition_do_not_matter():
+    assert preference_language.parse(['A', 'B', 'or', 'C']) == preference_language.parse(['C', 'or', 'B', 'A', 'A'])
+
+
+def members(agent, preferences):
+    return sorted(entity.name for entity in agent.interned.members(agent.plans.evaluate(agent, 'food', preferences)))
+
+
+@pytest.mark.parametrize('name, expression, recipes', [
+    ('michelle', Or(frozenset([Contains('Spinach', False), Not(Contains('AnimalBased', True))])),
+     ['GreenCurry', 'RedCurry', 'SpinachGnocci', 'StrawberryMilkshake', 'VeganBurger', 'VegetableSushi']),
+    ('sophie', Or(frozenset([Contains('Fish', True), Contains('Shellfish', True)])),
+     ['CreamySalmonPasta', 'LemonFishPasta', 'SalmonSushi', 'ShrimpSushi']),
+])
+def test_users_with_or(agent, users, name, expression, recipes):
+    preferences = users[name]['pref_food']
+    assert preference_language.parse(preferences) == expression
+    assert members(agent, preferences) == recipes
+    # The alternatives are the union of what every side matches on its own
+    sides = [entry for entry in preferences if entry != 'or']
+    assert recipes == sorted(set().union(*(members(agent, [side]) for side in sides)))
+    assert members(agent, [' or '.join(sides)]) == recipes
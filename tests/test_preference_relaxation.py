@@ -0,0 +1,85 @@
+import itertools
+import pytest
+import batch_recommendations
+import preference_relaxation
+from conftest import USERS_PATH
+
+
+def smallest_drop(agent, domain_name, preferences, excluded):
+    """
+    The fewest clauses that must be dropped for anything to match, found by evaluating every subset of kept clauses
+    as a preference list of its own
+    """
+    groups = preference_relaxation.clauses(preferences)
+    universe = agent.plans.universe(agent, domain_name) & ~excluded
+    for size in range(len(groups) + 1):
+        for dropped in itertools.combinations(range(len(groups)), size):
+            kept = [entry for index, group in enumerate(groups) if index not in dropped for entry in group]
+            if agent.plans.evaluate(agent, domain_name, kept) & universe:
+                return size
+    return None
+
+
+def test_clauses_group_or_joined_entries():
+    assert preference_relaxation.clauses(['ingredient Spinach', 'or', 'not ingredient some AnimalBased']) == [
+        ['ingredient Spinach', 'or', 'not ingredient some AnimalBased']]
+    assert preference_relaxation.clauses(['material some NaturalMaterial', 'isFairTrade true', 'maxprice 49']) == [
+        ['material some NaturalMaterial'], ['isFairTrade true'], ['maxprice 49']]
+
+
+@pytest.mark.parametrize('domain_name, preferences, kept, dropped', [
+    ('clothing', ['material some NaturalMaterial', 'isFairTrade true', 'maxprice 49'],
+     ['material some NaturalMaterial', 'isFairTrade true'], ['maxprice 49']),
+    ('clothing', ['maxprice 5', 'material some NaturalMaterial', 'isFairTrade true', 'maxprice 60', 'maxprice 49',
+                  'isFairTrade false'],
+     ['material some NaturalMaterial', 'maxprice 60', 'maxprice 49', 'isFairTrade false'],
+     ['maxprice 5', 'isFairTrade true']),
+    ('food', ['some ingredient PlantBased', 'ingredient some Fish'],
+     ['some ingredient PlantBased'], ['ingredient some Fish']),
+    ('food', ['ingredient some Fish', 'not ingredient some Fish', 'ingredient Spinach', 'or', 'ingredient Rice',
+              'ingredient some Shellfish', 'maxprice 1'],
+     ['not ingredient some Fish', 'ingredient Spinach', 'or', 'ingredient Rice', 'ingredient some Shellfish'],
+     ['ingredient some Fish', 'maxprice 1']),
+])
+def test_relax_drops_the_fewest_clauses(agent, domain_name, preferences, kept, dropped):
+    relaxation = preference_relaxation.relax(agent, domain_name, preferences)
+    assert relaxation.kept == kept
+    assert relaxation.dropped == dropped
+    assert len(dropped) == smallest_drop(agent, domain_name, preferences, 0)
+    # The sizes are tried in order and the first one that matches anything is the one returned
+    assert [step.dropped for step in relaxation.steps] == list(range(len(dropped) + 1))
+
+
+def test_relax_keeps_everything_when_something_matches(agent, users):
+    relaxation = preference_relaxation.relax(agent, 'food', users['michelle']['pref_food'])
+    assert relaxation.dropped == []
+    assert relaxation.kept == users['michelle']['pref_food']
+    assert [step.dropped for step in relaxation.steps] == [0]
+
+
+def test_relax_leaves_out_the_excluded_items(agent, users):
+    isaac = users['isaac']
+    health_cond = agent.infer_health_cond(isaac['symptoms'], isaac['user'])
+    # The plant based recipes are there, but the lactose intolerance of Isaac rules all of them out
+    assert preference_relaxation.relax(agent, 'food', isaac['pref_food']).dropped == []
+    relaxation = agent.relax_preferences('food', isaac['pref_food'], health_cond)
+    assert relaxation.kept == []
+    assert relaxation.dropped == ['some ingredient PlantBased']
+    excluded = agent.health_exclusions.excluded_recipes(health_cond)
+    assert len(relaxation.dropped) == smallest_drop(agent, 'food', isaac['pref_food'], excluded)
+
+
+@pytest.mark.parametrize('name, removed, found, first', [
+    ('alex', 'maxprice 49', "we found 2 recommendation(s) when we ignored the following condition: ['maxprice 49']",
+     {'clothing_store': 'Kilo Kilo', 'clothing_item': 'Recycled Sails Raincoat',
+      'pref_not_adhered_to': ['maxprice 49']}),
+    ('isaac', 'some ingredient PlantBased', 'For your entered preferences, 13 recommendations were found.',
+     {'restaurant': 'Sushi Koi', 'food': 'Vegetable Sushi'}),
+])
+def test_relaxed_output_of_users(agent, name, removed, found, first):
+    batch = agent.find_states_many(batch_recommendations.load_requests(['{}/{}.json'.format(USERS_PATH, name)]))
+    result = batch.results[0]
+    assert result.error is None
+    assert 'Removing preference: {}\n'.format(removed) in result.output
+    assert found in result.output
+    assert {field: result.top[0][field] for field in first} == first
@@ -0,0 +1,88 @@
+import batch_recommendations
+import recommendation_cache
+from conftest import USERS_PATH
+
+
+class Clock:
+    """
+    A clock that only moves when told to
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_the_ttl():
+    clock = Clock()
+    cache = recommendation_cache.RecommendationCache(ttl=10, clock=clock)
+    assert cache.put('request', 'result', 'v1')
+    clock.now = 9.5
+    assert cache.get('request', 'v1') == 'result'
+    clock.now = 10
+    assert cache.get('request', 'v1') is None
+    assert len(cache) == 0
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['expirations']) == (1, 1, 1)
+    assert stats['bytes'] == 0
+
+
+def test_entries_without_ttl_do_not_expire():
+    clock = Clock()
+    cache = recommendation_cache.RecommendationCache(clock=clock)
+    cache.put('request', 'result', 'v1')
+    clock.now = 1e9
+    assert cache.get('request', 'v1') == 'result'
+
+
+def test_a_new_version_invalidates_every_entry():
+    cache = recommendation_cache.RecommendationCache()
+    cache.put('first', 'result', 'v1')
+    cache.put('second', 'result', 'v1')
+    assert cache.get('first', 'v2') is None
+    assert len(cache) == 0
+    assert cache.stats()['invalidations'] == 2
+    # A result computed before the change is not stored for the new version
+    assert not cache.put('first', 'stale', 'v1')
+    assert cache.get('first', 'v2') is None
+    assert cache.put('first', 'fresh', 'v2')
+    assert cache.get('first', 'v2') == 'fresh'
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = recommendation_cache.RecommendationCache(max_entries=2)
+    cache.put('first', 'result', 'v1')
+    cache.put('second', 'result', 'v1')
+    cache.get('first', 'v1')
+    cache.put('third', 'result', 'v1')
+    assert cache.get('second', 'v1') is None
+    assert cache.get('first', 'v1') == 'result'
+    assert cache.stats()['evictions'] == 1
+    small = recommendation_cache.RecommendationCache(max_bytes=recommendation_cache.entry_size('first', 'result'))
+    small.put('first', 'result', 'v1')
+    small.put('other', 'result', 'v1')
+    assert list(small.entries) == ['other']
+
+
+def test_equivalent_requests_share_a_key(users):
+    preferences = dict(users['sophie'], symptoms=['Headache', 'Nausea'])
+    reordered = dict(reversed(list(preferences.items())), symptoms=['Nausea', ' Headache'])
+    assert recommendation_cache.canonical_request(preferences) == recommendation_cache.canonical_request(reordered)
+    other = dict(preferences, pref_food=list(reversed(preferences['pref_food'])) + ['maxprice 10'])
+    assert recommendation_cache.canonical_request(preferences) != recommendation_cache.canonical_request(other)
+
+
+def test_agent_answers_from_the_cache_until_the_ontology_changes(agent, monkeypatch):
+    monkeypatch.setattr(agent, 'result_cache', recommendation_cache.RecommendationCache())
+    requests = batch_recommendations.load_requests(['{}/sophie.json'.format(USERS_PATH)])
+    first = agent.find_states_many(requests).results[0]
+    second = agent.find_states_many(requests).results[0]
+    assert not first.cached and second.cached
+    assert second.output == first.output and second.top == first.top
+    monkeypatch.setattr(agent, 'ontology_version', '{}+changed'.format(agent.ontology_version))
+    third = agent.find_states_many(requests).results[0]
+    assert not third.cached
+    assert third.output == first.output
+    assert agent.result_cache.stats()['invalidations'] == 1
@@ -0,0 +1,77 @@
+import pytest
+import group10_agent
+import train_network
+from benchmark import routing_delta
+from conftest import ONTOLOGY_PATH
+
+
+def test_train_between_amsterdam_and_utrecht(agent):
+    ontology = agent.ontology
+    network = train_network.TrainNetwork(agent)
+    journey = network.journey(ontology.Amsterdam, ontology.Utrecht)
+    # The train minutes and the extra car minutes the agent always used for the 40 km between the cities
+    assert (journey.duration, journey.distance) == (27, 40)
+    assert round(journey.distance * train_network.CAR_MINUTES_PER_KM) == 55
+    assert [leg.train for leg in journey.legs] == [ontology.TrainFromAmsterdamToUtrecht]
+    assert [leg.train for leg in network.journey(ontology.Utrecht, ontology.Amsterdam).legs] == [
+        ontology.TrainFromUtrechtToAmsterdam]
+    assert network.journey(ontology.Amsterdam, ontology.Amsterdam) is None
+
+
+def test_shortest_path_trees_are_cached(agent):
+    ontology = agent.ontology
+    network = train_network.TrainNetwork(agent)
+    network.journey(ontology.Amsterdam, ontology.Utrecht)
+    network.journey(ontology.Amsterdam, ontology.Utrecht)
+    network.journey(ontology.Amsterdam, ontology.Amsterdam)
+    assert (network.hits, network.misses) == (2, 1)
+    network.journey(ontology.Utrecht, ontology.Amsterdam)
+    assert (network.hits, network.misses) == (2, 2)
+    assert set(network.trees) == {ontology.Amsterdam, ontology.Utrecht}
+
+
+@pytest.mark.parametrize('origin, destination, duration, station_access, co2score', [
+    # No station in De Pijp (the bike to the station is added per user) and a bus or tram in Binnenstad
+    ('DePijp', 'Binnenstad', 27 + 15, True, 1),
+    # A five minute walk to the station in Amsterdam-Oost
+    ('Amsterdam-Oost', 'Binnenstad', 5 + 27 + 15, False, 1),
+    ('Binnenstad', 'BinnenstadAmsterdam', 27 + 5, True, 0),
+])
+def test_routes_between_cities(agent, origin, destination, duration, station_access, co2score):
+    route = agent.travel_matrix.compute_route(agent.ontology[origin], agent.ontology[destination])
+    assert (route.kind, route.duration, route.station_access, route.co2score) == (
+        'train', duration, station_access, co2score)
+    assert route.vehicle_offsets == {'Car': 55}
+
+
+@pytest.fixture(scope='module')
+def network_agent(tmp_path_factory):
+    """
+    An agent with six more cities, not connected to Amsterdam and Utrecht: a ring of 40 km trains and a 60 km train
+    from every city to the one halfway the ring
+    """
+    agent = group10_agent.EnvironmentalAgent(ONTOLOGY_PATH, snapshot_dir=str(tmp_path_factory.mktemp('snapshots')))
+    agent.apply_delta(routing_delta(agent, 6, 2, 'Test'))
+    yield agent
+    agent.world.close()
+
+
+def test_journeys_over_several_trains(network_agent):
+    ontology = network_agent.ontology
+    network = train_network.TrainNetwork(network_agent)
+    two_stops = network.journey(ontology.TestCity0, ontology.TestCity2)
+    assert (two_stops.duration, two_stops.distance) == (27 + 27, 80)
+    assert [leg.train for leg in two_stops.legs] == [ontology.TestTrain0, ontology.TestTrain1]
+    # The 60 km train beats three 40 km ones
+    halfway = network.journey(ontology.TestCity0, ontology.TestCity3)
+    assert (halfway.duration, [leg.train for leg in halfway.legs]) == (round(60 * 27 / 40), [ontology.TestTrain6])
+
+
+def test_unreachable_destination(network_agent):
+    ontology = network_agent.ontology
+    network = train_network.TrainNetwork(network_agent)
+    assert network.journey(ontology.Amsterdam, ontology.TestCity0) is None
+    assert network.journey(ontology.TestCity0, ontology.Utrecht) is None
+    route = network_agent.travel_matrix.route(ontology.DePijp, ontology.TestCity0Neighborhood0)
+    assert route.kind == 'unreachable'
+    assert network_agent.travel_matrix.options(ontology.DePijp, ontology.TestCity0Neighborhood0, []) == []
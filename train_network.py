@@ -0,0 +1,113 @@
+import heapq
+import re
+import threading
+from collections import namedtuple
+
+# The 40 km train between Amsterdam and Utrecht takes 27 minutes, taking the car instead takes 55 minutes longer
+TRAIN_MINUTES_PER_KM = 27 / 40
+CAR_MINUTES_PER_KM = 55 / 40
+
+# Trains without stops are named after the cities they connect
+TRAIN_LABEL = re.compile(r'^Train From (.+) To (.+)$')
+
+# One train ride between two cities
+Leg = namedtuple('Leg', ['train', 'origin', 'destination', 'duration', 'distance'])
+
+# The fastest way from one city to another by train: total duration and distance and the legs taken
+Journey = namedtuple('Journey', ['duration', 'distance', 'legs'])
+
+
+class TrainNetwork:
+    """
+    Weighted graph of the cities (their train stations) connected by the train individuals of the ontology. A train
+    connects the cities of its first and last stop (hasStopIn), or the cities named in its label. Journeys are found
+    with Dijkstra; the shortest path tree of every origin city is computed once and cached, so later journeys from
+    the same city are dictionary lookups. Safe to share between the threads serving requests: a tree computed by two
+    threads at once is simply stored twice.
+    Only travel between cities goes through the network: within a city the agent's travel rules depend on how two
+    neighborhoods relate (the same, adjacent or in the same city, see travel_matrix.VEHICLE_OFFSETS), not on a path
+    between them, and the car is taken along the train's way (CAR_MINUTES_PER_KM).
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.legs = {}
+        self.trees = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        for train in agent.ontology.Train.instances():
+            endpoints = self.train_endpoints(train)
+            if endpoints is None or not train.travelDistance:
+                continue
+            distance = train.travelDistance[0]
+            leg = Leg(train, endpoints[0], endpoints[1], round(distance * TRAIN_MINUTES_PER_KM), distance)
+            self.legs.setdefault(leg.origin, []).append(leg)
+
+    def station_city(self, station):
+        for location in station.isLocatedIn:
+            if isinstance(location, self.agent.ontology.City):
+                return location
+        cities = self.agent.search(hasTrainStation=station)
+        return cities[0] if cities else None
+
+    def train_endpoints(self, train):
+        """
+        The cities a train goes from and to, None if they can not be determined
+        """
+        stops = [self.station_city(station) for station in train.hasStopIn]
+        if len(stops) >= 2 and stops[0] is not None and stops[-1] is not None:
+            return stops[0], stops[-1]
+        for label in train.label:
+            match = TRAIN_LABEL.match(label)
+            if match:
+                origin = self.agent.label_to_indiv.get(match.group(1))
+                destination = self.agent.label_to_indiv.get(match.group(2))
+                if origin is not None and destination is not None:
+                    return origin, destination
+        return None
+
+    def tree(self, origin):
+        """
+        Shortest path tree from a city: the fastest incoming leg of every reachable city
+        """
+        with self.lock:
+            incoming = self.trees.get(origin)
+            if incoming is not None:
+                self.hits += 1
+                return incoming
+            self.misses += 1
+        durations = {origin: 0}
+        incoming = {origin: None}
+        queue = [(0, 0, origin)]
+        counter = 1  # Tie breaker, entities can not be compared
+        while queue:
+            duration, _, city = heapq.heappop(queue)
+            if duration > durations[city]:
+                continue
+            for leg in self.legs.get(city, []):
+                arrival = duration + leg.duration
+                if leg.destination not in durations or arrival < durations[leg.destination]:
+                    durations[leg.destination] = arrival
+                    incoming[leg.destination] = leg
+                    heapq.heappush(queue, (arrival, counter, leg.destination))
+                    counter += 1
+        with self.lock:
+            self.trees[origin] = incoming
+        return incoming
+
+    def journey(self, origin, destination):
+        """
+        The fastest train journey between two cities, None if there is none
+        """
+        incoming = self.tree(origin)
+        if destination not in incoming or destination == origin:
+            return None
+        legs = []
+        city = destination
+        while city != origin:
+            leg = incoming[city]
+            legs.append(leg)
+            city = leg.origin
+        legs.reverse()
+        return Journey(sum(leg.duration for leg in legs), sum(leg.distance for leg in legs), legs)
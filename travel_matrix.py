@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+from collections import namedtuple
+import train_network
+
+# Bumped whenever the layout of the persisted matrix changes
+MATRIX_FORMAT = 2
+
+# Facts that change the travel matrix when a delta touches them
+TRAVEL_PROPERTIES = ['adjacentTo', 'isLocatedIn', 'hasPopulation', 'hasStopIn', 'hasTrainStation', 'travelDistance']
+
+# Up to this many neighborhoods all routes are computed (and persisted) up front, beyond it they are computed when
+# first needed
+PREBUILD_LIMIT = 200
+
+# The travel options from an origin to a destination neighborhood:
+# - kind: 'same' (same neighborhood), 'adjacent', 'city' (same city, not adjacent), 'train' (other city) or
+#   'unreachable' (other city without a train connection)
+# - vehicle_offsets: extra minutes per vehicle class ('Bike', 'Car') on top of the time it takes to get to the
+#   vehicle, a vehicle class that is missing can not be used for this route
+# - mode, duration and co2score: the option that does not need an owned vehicle (Walking, Public Transport or the
+#   train), co2score being the extra score on top of the train's own score for the train
+# - station_access: True when the origin has no train station, the user then bikes to the nearest one
+# - legs: the trains taken, the first one is the mode
+Route = namedtuple('Route', ['kind', 'vehicle_offsets', 'mode', 'duration', 'co2score', 'station_access', 'legs'])
+
+VEHICLE_OFFSETS = {
+    'same': {'Bike': 5, 'Car': 2},
+    'adjacent': {'Bike': 10, 'Car': 5},
+    'city': {'Bike': 15, 'Car': 15},
+    'unreachable': {},
+}
+
+
+def has_train_station(neighborhood):
+    """
+    Neighborhoods with more than 20000 inhabitants are assumed to have a train station
+    """
+    return neighborhood.hasPopulation[0] > 20000
+
+
+class TravelMatrix:
+    """
+    The travel options between every pair of neighborhoods (origin x destination x mode, with duration and CO2
+    score), computed once after reasoning and stored next to the ontology snapshot. The options of a user follow
+    from a route by masking it with the vehicles the user can reach (see options). Routes from or to a neighborhood
+    that is not in the matrix are computed when they are first needed. Safe to share between the threads serving
+    requests: a route computed by two threads at once is simply stored twice, the train network is built once.
+    """
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.routes = {}
+        self.network = None
+        self.lock = threading.Lock()
+
+    def build(self):
+        # Neighborhoods that are not located in a city have no routes
+        neighborhoods = [neighborhood for neighborhood in self.agent.ontology.Neighborhood.instances()
+                         if neighborhood.isLocatedIn]
+        if len(neighborhoods) > PREBUILD_LIMIT:
+            return self
+        for origin in neighborhoods:
+            for destination in neighborhoods:
+                self.route(origin, destination)
+        return self
+
+    def route(self, origin, destination):
+        key = (origin, destination)
+        with self.lock:
+            route = self.routes.get(key)
+        if route is None:
+            route = self.compute_route(origin, destination)
+            with self.lock:
+                self.routes[key] = route
+        return route
+
+    def train_network(self):
+        with self.lock:
+            if self.network is None:
+                self.network = train_network.TrainNetwork(self.agent)
+            return self.network
+
+    def compute_route(self, origin, destination):
+        """
+        The route between two neighborhoods, following the travel rules of the agent
+        """
+        ontology = self.agent.ontology
+        city = origin.isLocatedIn[0]
+        destination_city = destination.isLocatedIn[0]
+        if city == destination_city:
+            if origin in list(destination.adjacentTo):
+                return Route('adjacent', VEHICLE_OFFSETS['adjacent'], 'Walking', 30, 1, False, [])
+            if origin == destination:
+                return Route('same', VEHICLE_OFFSETS['same'], 'Walking', 10, 1, False, [])
+            return Route('city', VEHICLE_OFFSETS['city'], 'Public Transport', 15, 2, False, [])
+
+        journey = self.train_network().journey(city, destination_city)
+        if journey is None:
+            return Route('unreachable', VEHICLE_OFFSETS['unreachable'], None, None, None, False, [])
+        duration = journey.duration
+        extra_co2score = 0  # If the user has to take a tram or a bus in the other city, the CO2 score becomes worse
+        station_access = not has_train_station(origin)
+        if not station_access:
+            duration += 5  # User needs to walk about 5 minutes
+        if has_train_station(destination):
+            duration += 5
+        else:  # User needs to use public transport (bus/tram) to get to the destination
+            duration += 15
+            extra_co2score += 1
+        # The car takes the same way as the train, but slower
+        vehicle_offsets = {'Car': round(journey.distance * train_network.CAR_MINUTES_PER_KM)}
+        trains = [leg.train for leg in journey.legs]
+        return Route('train', vehicle_offsets, trains[0], duration, extra_co2score, station_access, trains)
+
+    def vehicle_class(self, vehicle):
+        if vehicle.is_a[0] == self.agent.ontology.Bike:
+            return 'Bike'
+        if vehicle.is_a[0].is_a[0] == self.agent.ontology.Car:
+            return 'Car'
+        return None
+
+    def options(self, origin, destination, available_transport):
+        """
+        The travel options of a user from origin to destination: the route masked with the vehicles the user can
+        reach (available_transport, [vehicle, minutes to get it ready] as returned by check_user_transport_options).
+        Options are [vehicle or mode, duration] and [train, duration, extra CO2 score] for the train.
+        """
+        route = self.route(origin, destination)
+        if route.kind == 'unreachable':
+            return []
+        options = []
+        station_time = 0
+        for vehicle, extra_travel_time in available_transport:
+            vehicle_class = self.vehicle_class(vehicle)
+            if vehicle_class == 'Bike' and route.station_access:
+                station_time += int(vehicle.travelTimeToNearestTrainStation[0])
+            if vehicle_class is None:
+                options.append([vehicle, extra_travel_time])
+            elif vehicle_class in route.vehicle_offsets:
+                options.append([vehicle, extra_travel_time + route.vehicle_offsets[vehicle_class]])
+        if route.kind == 'train':
+            options.append([route.mode, route.duration + station_time, route.co2score])
+        else:
+            options.append([route.mode, route.duration])
+        return options
+
+    def update(self, delta_result):
+        """
+        Forgets the routes (and the train network) when a delta changes neighborhoods, cities, trains or the facts the
+        routes depend on, they are recomputed when needed
+        """
+        ontology = self.agent.ontology
+        travel_classes = (ontology.Neighborhood, ontology.City, ontology.Train)
+        if delta_result.removed_storids or \
+                any(isinstance(individual, travel_classes) for individual in delta_result.new_individuals) or \
+                any(prop.python_name in TRAVEL_PROPERTIES for subject, prop, value, added in delta_result.facts):
+            with self.lock:
+                self.routes = {}
+                self.network = None
+
+    def save(self, target):
+        """
+        Writes the matrix to a json file, by entity name. Written to a temporary file first, like the snapshot.
+        """
+        routes = {}
+        for (origin, destination), route in self.routes.items():
+            mode = route.mode if route.mode is None or isinstance(route.mode, str) else {'entity': route.mode.name}
+            routes.setdefault(origin.name, {})[destination.name] = [
+                route.kind, route.vehicle_offsets, mode, route.duration, route.co2score, route.station_access,
+                [train.name for train in route.legs]]
+        tmp_target = '{}.{}.tmp'.format(target, os.getpid())
+        with open(tmp_target, 'w') as openfile:
+            json.dump({'format': MATRIX_FORMAT, 'routes': routes}, openfile)
+        os.replace(tmp_target, target)
+
+    def load(self, target):
+        """
+        Reads a matrix written by save, returns False if there is none (or it has another format)
+        """
+        if not os.path.exists(target):
+            return False
+        with open(target, 'r') as openfile:
+            saved = json.load(openfile)
+        if saved.get('format') != MATRIX_FORMAT:
+            return False
+        ontology = self.agent.ontology
+        for origin_name, destinations in saved['routes'].items():
+            origin = ontology[origin_name]
+            for destination_name, route in destinations.items():
+                kind, vehicle_offsets, mode, duration, co2score, station_access, legs = route
+                if isinstance(mode, dict):
+                    mode = ontology[mode['entity']]
+                self.routes[(origin, ontology[destination_name])] = Route(
+                    kind, vehicle_offsets, mode, duration, co2score, station_access, [ontology[name] for name in legs])
+        return True
+
+
+def load_or_build(agent, target=None):
+    """
+    The travel matrix of the agent, read from target when it was persisted before and built (and persisted to target
+    if given) otherwise
+    """
+    matrix = TravelMatrix(agent)
+    if target is None or not matrix.load(target):
+        matrix.build()
+        if target is not None:
+            matrix.save(target)
+    return matrix
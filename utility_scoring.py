@@ -0,0 +1,53 @@
+import numpy
+
+
+def batch_utilities(co2_sums, n_domains, adhered_prefs, n_prefs):
+    """
+    Utility of every candidate in one vectorised call, the batch form of RecommendationState.calculate_utility:
+    (adhered_prefs / n_prefs * n_domains) / sum(co2_scores), with the CO2 scores per domain of each candidate already
+    summed. Every argument has one value per candidate (or one value for all candidates). The operations are done in
+    the same order as the scalar formula, so the results are identical to it.
+    """
+    # Like the scalar formula, dividing by zero is an error instead of giving inf/nan
+    with numpy.errstate(divide='raise', invalid='raise'):
+        per_loose_prefs = numpy.asarray(adhered_prefs, dtype=float) / numpy.asarray(n_prefs, dtype=float)
+        return (per_loose_prefs * numpy.asarray(n_domains, dtype=float)) / numpy.asarray(co2_sums, dtype=float)
+
+
+def utility(adhered_prefs, n_prefs, co2_scores):
+    """
+    Utility of a single candidate, with the operations in the same order as batch_utilities (and
+    RecommendationState.calculate_utility) so it gives the same value. The number of domains is the number of CO2 scores.
+    """
+    return (adhered_prefs / n_prefs * len(co2_scores)) / sum(co2_scores)
+
+
+class CandidateScores:
+    """
+    Collects the summed CO2 scores, the number of domains and the (adhered) preference counts of candidates while
+    they are created, to score all of them with a single batch_utilities call afterwards
+    """
+
+    def __init__(self):
+        self.co2_sums = []
+        self.n_domains = []
+        self.adhered_prefs = []
+        self.n_prefs = []
+
+    def add(self, co2_scores, n_domains, adhered_prefs, n_prefs):
+        # Summed right away, the callers keep changing their list of CO2 scores
+        self.co2_sums.append(sum(co2_scores))
+        self.n_domains.append(n_domains)
+        self.adhered_prefs.append(adhered_prefs)
+        self.n_prefs.append(n_prefs)
+
+    def __len__(self):
+        return len(self.co2_sums)
+
+    def utilities(self):
+        """
+        The utility of every candidate, in the order they were added
+        """
+        if not self.co2_sums:
+            return []
+        return batch_utilities(self.co2_sums, self.n_domains, self.adhered_prefs, self.n_prefs).tolist()
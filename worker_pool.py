@@ -0,0 +1,178 @@
+import gc
+import multiprocessing
+import multiprocessing.pool
+import os
+import threading
+import time
+import batch_recommendations
+import group10_agent
+import ontology_snapshot
+
+# How the workers get the reasoned world:
+# - FORK: the workers are forked from this process. With a snapshot directory the snapshot is built here and closed
+#   before forking, every worker then opens it read-only (an open SQLite connection can not be used across fork());
+#   without one the ontology is reasoned once into an in-memory world and the workers share its memory copy-on-write
+# - SNAPSHOT: the snapshot is built once, every worker opens it read-only and the workers share its pages through the
+#   operating system's file cache
+# - THREAD: the workers are threads of this process, all serving requests with the same agent (every request has its
+#   own group10_agent.RequestContext)
+FORK = 'fork'
+SNAPSHOT = 'snapshot'
+THREAD = 'thread'
+MODES = [FORK, SNAPSHOT, THREAD]
+
+# The agent of a worker, set before forking (FORK without a snapshot directory) or starting the threads (THREAD), or
+# by open_worker_agent (SNAPSHOT, and FORK with a snapshot directory)
+worker_agent = None
+
+
+def prepare_snapshot(path, snapshot_dir, reasoner='hermit'):
+    """
+    Makes sure the snapshot and the travel matrix next to it exist, so the workers only have to open them: when one
+    of them is missing, an agent is created once to build them.
+    """
+    digest = ontology_snapshot.ontology_hash(path, ontology_snapshot.REASONERS[reasoner])
+    target = ontology_snapshot.snapshot_path(path, snapshot_dir, digest)
+    if not os.path.exists(target) or not os.path.exists(target + '.travel.json'):
+        agent = group10_agent.EnvironmentalAgent(path, snapshot_dir=snapshot_dir, reasoner=reasoner)
+        agent.world.close()
+    return target
+
+
+def open_worker_agent(path, snapshot_dir, preference_backend, reasoner='hermit'):
+    global worker_agent
+    worker_agent = group10_agent.EnvironmentalAgent(path, snapshot_dir=snapshot_dir,
+                                                    preference_backend=preference_backend, read_only=True,
+                                                    reasoner=reasoner)
+
+
+def run_shard(shard):
+    """
+    Runs a shard of (index, request) pairs as one batch in a worker. Returns lightweight records only (see
+    batch_recommendations.RequestResult): the indices, the results, the shared work and the name of the worker (its
+    process ID and thread).
+    """
+    indices = [index for index, request in shard]
+    batch = worker_agent.find_states_many([request for index, request in shard])
+    return indices, batch.results, batch.as_dict()['shared_work'], '{}/{}'.format(os.getpid(),
+                                                                                  threading.current_thread().name)
+
+
+def shards(requests, workers):
+    """
+    Splits the requests into one shard per worker. Requests with the same batch_recommendations.group_key go to the
+    same worker, so they can still share their work; the groups are given out largest first to the worker with the
+    fewest requests.
+    """
+    groups = {}
+    for index, request in enumerate(requests):
+        groups.setdefault(batch_recommendations.group_key(request.preferences), []).append((index, request))
+    shards = [[] for _ in range(workers)]
+    for group in sorted(groups.values(), key=len, reverse=True):
+        min(shards, key=len).extend(group)
+    return [shard for shard in shards if shard]
+
+
+class PoolBatch:
+    """
+    The results of the requests that were run by a WorkerPool, in the order of the requests, with the throughput of
+    the pool (wall-clock time) and what every worker did
+    """
+
+    def __init__(self, size, workers):
+        self.results = [None] * size
+        self.workers = workers
+        self.worker_stats = {}
+        self.seconds = 0
+
+    def add(self, indices, results, shared_work, worker):
+        for index, result in zip(indices, results):
+            self.results[index] = result
+        stats = self.worker_stats.setdefault(worker, {'requests': 0, 'seconds': 0, 'shared_work': {}})
+        stats['requests'] += len(results)
+        stats['seconds'] += sum(result.seconds for result in results)
+        for name, counts in shared_work.items():
+            total = stats['shared_work'].setdefault(name, {'computed': 0, 'reused': 0})
+            total['computed'] += counts['computed']
+            total['reused'] += counts['reused']
+
+    def throughput(self):
+        timings = [result.seconds for result in self.results if result is not None]
+        return {'requests': len(timings), 'workers': self.workers, 'seconds': round(self.seconds, 6),
+                'requests_per_second': round(len(timings) / self.seconds, 3) if self.seconds else None,
+                'mean_ms': round(1000 * sum(timings) / len(timings), 3) if timings else None,
+                'max_ms': round(1000 * max(timings), 3) if timings else None}
+
+    def as_dict(self):
+        return {'results': [result._asdict() for result in self.results],
+                'throughput': self.throughput(),
+                'workers': self.worker_stats}
+
+
+class WorkerPool:
+    """
+    Worker processes serving recommendations over one reasoned world (see MODES). The requests of recommend are
+    sharded over the workers, every worker runs its shard with find_states_many.
+    """
+
+    def __init__(self, path, workers, mode=FORK, snapshot_dir=None, preference_backend='python', reasoner='hermit'):
+        global worker_agent
+        if mode not in MODES:
+            raise ValueError('Unknown worker pool mode: {}'.format(mode))
+        self.workers = workers
+        self.mode = mode
+        start = time.perf_counter()
+        if mode == FORK and snapshot_dir is not None:
+            # The agent building the snapshot is closed again by prepare_snapshot, so no SQLite connection is open
+            # when forking; the workers inherit the imported modules and only have to open the snapshot
+            prepare_snapshot(path, snapshot_dir, reasoner)
+            self.pool = multiprocessing.get_context('fork').Pool(
+                workers, initializer=open_worker_agent, initargs=(path, snapshot_dir, preference_backend, reasoner))
+        elif mode == FORK:
+            # Without a snapshot directory the world lives in memory, every worker gets its own copy-on-write copy
+            worker_agent = group10_agent.EnvironmentalAgent(path, preference_backend=preference_backend,
+                                                            reasoner=reasoner)
+            # Objects that exist before the fork are never collected, so the garbage collector of a worker does not
+            # write to (and copy) the pages holding them
+            gc.freeze()
+            self.pool = multiprocessing.get_context('fork').Pool(workers)
+        elif mode == THREAD:
+            worker_agent = group10_agent.EnvironmentalAgent(path, snapshot_dir=snapshot_dir,
+                                                            preference_backend=preference_backend, reasoner=reasoner)
+            self.pool = multiprocessing.pool.ThreadPool(workers)
+        else:
+            if snapshot_dir is None:
+                raise ValueError('The snapshot mode needs a snapshot directory')
+            prepare_snapshot(path, snapshot_dir, reasoner)
+            self.pool = multiprocessing.get_context('spawn').Pool(
+                workers, initializer=open_worker_agent, initargs=(path, snapshot_dir, preference_backend, reasoner))
+        self.startup_seconds = time.perf_counter() - start
+
+    def recommend(self, requests):
+        """
+        Runs the requests ((name, preferences) pairs) on the workers, returns a PoolBatch
+        """
+        requests = [request if isinstance(request, batch_recommendations.Request)
+                    else batch_recommendations.Request(*request) for request in requests]
+        batch = PoolBatch(len(requests), self.workers)
+        start = time.perf_counter()
+        for result in self.pool.imap_unordered(run_shard, shards(requests, self.workers)):
+            batch.add(*result)
+        batch.seconds = time.perf_counter() - start
+        return batch
+
+    def close(self):
+        global worker_agent
+        self.pool.close()
+        self.pool.join()
+        if self.mode == FORK:
+            gc.unfreeze()
+        if worker_agent is not None and self.mode in (FORK, THREAD):
+            worker_agent.world.close()
+            worker_agent = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()